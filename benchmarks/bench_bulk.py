@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Compare converting many small documents one by one with convert_many.
+
+Usage:
+    python benchmarks/bench_bulk.py [--documents N] [--format html] [--engine subprocess]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+
+
+def snippet(i):
+    """A short chat answer, different for every document."""
+    return (f"**Svar {i}:** Här är punkterna du bad om.\n\n"
+            f"- Första punkten med `kod {i}`\n- Andra punkten med *betoning*\n")
+
+
+def main():
+    """Run the benchmark and print the cost per document."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=1000)
+    parser.add_argument('--format', default='html')
+    parser.add_argument('--engine', default='subprocess', choices=['subprocess', 'pool'])
+    args = parser.parse_args()
+
+    texts = [snippet(i) for i in range(args.documents)]
+    with DocumentConverter(engine=args.engine) as converter:
+        converter.warm_up()
+        start = time.perf_counter()
+        one_by_one = [converter.convert_text(text, args.format) for text in texts]
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        packed = converter.convert_many(texts, args.format)
+        bulk = time.perf_counter() - start
+
+    assert packed == one_by_one
+    for name, elapsed in (('convert_text', sequential), ('convert_many', bulk)):
+        print(f"{name:>12}: {elapsed:.2f}s total, "
+              f"{elapsed / args.documents * 1000:.3f} ms/document")
+    print(f"Speed-up: {sequential / bulk:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Measure DOCX export latency with a corporate reference document, with and without preparing it.
+
+The template is built like a typical corporate one: pandoc's styles plus
+pages of sample text and a large picture in the body.
+
+Usage:
+    python benchmarks/bench_docx.py [--exports N] [--image-size PIXELS]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from templates import ReferenceTemplates
+import templates as templates_module
+
+
+DOCUMENT = "# Kvartalsrapport\n\nIntäkterna ökade med **12 %**.\n\n- Norr\n- Söder\n"
+
+
+def noise_png(size: int) -> bytes:
+    """A PNG of random pixels, which does not compress."""
+    rng = random.Random(1)
+    rows = b''.join(b'\x00' + rng.randbytes(size * 3) for _ in range(size))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+
+    header = struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def build_template(directory: str, image_size: int) -> str:
+    """Write a reference document with sample text and a picture in its body."""
+    with open(os.path.join(directory, 'logo.png'), 'wb') as f:
+        f.write(noise_png(image_size))
+    sample = "\n\n".join(f"Exempeltext {i} som visar företagets typsnitt och stycken."
+                         for i in range(2000))
+    template = os.path.join(directory, 'foretag.docx')
+    with DocumentConverter() as converter:
+        converter.convert_text(f"![Logotyp](logo.png)\n\n{sample}\n", 'docx', output_file=template,
+                               extra_args=[f'--resource-path={directory}'])
+    return template
+
+
+def time_exports(converter: DocumentConverter, output: str, exports: int,
+                 extra_args: list = None) -> list:
+    """Export the document repeatedly, returning each latency in milliseconds."""
+    latencies = []
+    for _ in range(exports):
+        start = time.perf_counter()
+        converter.convert_text(DOCUMENT, 'docx', output_file=output, extra_args=extra_args)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    """Run the benchmark and print latencies and output sizes."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--exports', type=int, default=30)
+    parser.add_argument('--image-size', type=int, default=1500,
+                        help="Width and height of the template's picture (default: 1500)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        template = build_template(directory, args.image_size)
+        output = os.path.join(directory, 'rapport.docx')
+        templates_module.templates = ReferenceTemplates(os.path.join(directory, 'store'))
+        print(f"Template: {os.path.getsize(template) / 1e6:.1f} MB")
+
+        rows = []
+        with DocumentConverter() as converter:
+            converter.warm_up()
+            rows.append(('no template', time_exports(converter, output, args.exports),
+                         os.path.getsize(output)))
+            rows.append(('raw template',
+                         time_exports(converter, output, args.exports,
+                                      [f'--reference-doc={template}']),
+                         os.path.getsize(output)))
+
+        with DocumentConverter(reference_doc=template) as converter:
+            start = time.perf_counter()
+            templates_module.templates.prepare(template)
+            preparing = (time.perf_counter() - start) * 1000
+            rows.append(('prepared', time_exports(converter, output, args.exports),
+                         os.path.getsize(output)))
+
+    print(f"Preparing the template once: {preparing:.0f} ms")
+    for name, latencies, size in rows:
+        print(f"{name:>13}: median {statistics.median(latencies):6.1f} ms, "
+              f"max {max(latencies):6.1f} ms, output {size / 1e3:8.1f} kB")
+
+
+if __name__ == "__main__":
+    main()
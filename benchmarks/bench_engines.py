@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Compare the one-process-per-call engine with the pooled pandoc engine.
+
+Usage:
+    python benchmarks/bench_engines.py [--conversions N] [--workers N] [--format html]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+
+
+SAMPLE_MARKDOWN = """# Svar från språkmodellen
+
+Här är en **sammanfattning** av de viktigaste punkterna:
+
+1. Första punkten med *betoning*
+2. Andra punkten med `kod`
+3. Tredje punkten
+
+```python
+def hello():
+    print("Hej världen")
+```
+
+> Ett citat som avslutar svaret.
+"""
+
+
+def run(converter, conversions, workers, output_format):
+    """Run the conversions and return the elapsed wall time in seconds."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda _: converter.convert_text(SAMPLE_MARKDOWN, output_format),
+                          range(conversions)))
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark and print a comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--conversions', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--format', default='html')
+    args = parser.parse_args()
+
+    results = {}
+    for engine in ('subprocess', 'pool'):
+        with DocumentConverter(engine=engine, pool_size=args.workers) as converter:
+            # Warm up so the pool measurement excludes worker start-up
+            converter.convert_text(SAMPLE_MARKDOWN, args.format)
+            elapsed = run(converter, args.conversions, args.workers, args.format)
+        results[engine] = elapsed
+        print(f"{engine:>10}: {elapsed:.3f}s total, "
+              f"{elapsed / args.conversions * 1000:.2f} ms/conversion, "
+              f"{args.conversions / elapsed:.1f} conversions/s")
+
+    print(f"Speed-up: {results['subprocess'] / results['pool']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Compare markdown_to_html latency of the native fast path with pandoc.
+
+Usage:
+    python benchmarks/bench_native.py [--conversions N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from fast_markdown import render_html
+
+
+# Chat-style answer using only constructs the native renderer supports
+CHAT_MARKDOWN = """# Svar från språkmodellen
+
+Här är en **sammanfattning** av de viktigaste punkterna:
+
+1. Första punkten med *betoning*
+2. Andra punkten med `kod`
+3. Tredje punkten
+   - en underpunkt
+   - en till
+
+```
+def hello():
+    print("Hej världen")
+```
+
+> Ett citat som avslutar svaret.
+"""
+
+
+def run(converter, conversions):
+    """Return the mean latency in milliseconds."""
+    converter.markdown_to_html(CHAT_MARKDOWN)  # Warm up
+    start = time.perf_counter()
+    for i in range(conversions):
+        converter.markdown_to_html(f"{CHAT_MARKDOWN}\nDokument {i}.\n")
+    return (time.perf_counter() - start) / conversions * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--conversions', type=int, default=200)
+    args = parser.parse_args()
+
+    assert render_html(CHAT_MARKDOWN) is not None, "sample left the native subset"
+
+    results = {}
+    results['subprocess'] = run(DocumentConverter(), max(1, args.conversions // 10))
+    with DocumentConverter(engine='pool', pool_size=1) as converter:
+        results['pool'] = run(converter, args.conversions)
+    results['native'] = run(DocumentConverter(native_markdown=True), args.conversions)
+
+    for name, milliseconds in results.items():
+        print(f"{name:>10}: {milliseconds:8.3f} ms/conversion "
+              f"({results['subprocess'] / milliseconds:6.1f}x vs subprocess)")
+
+
+if __name__ == '__main__':
+    main()
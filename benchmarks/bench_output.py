@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Compare batch runs writing outputs directly with staged, atomic output writing.
+
+Point --output-dir at a network share to see the effect of slow output I/O.
+
+Usage:
+    python benchmarks/bench_output.py [--documents N] [--format docx] [--output-dir DIR]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from batch import convert_batch
+
+
+def main():
+    """Run the benchmark and print the time of each variant."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=200)
+    parser.add_argument('--format', default='docx')
+    parser.add_argument('--output-dir', help="Where outputs go (default: a temporary directory)")
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        docs = os.path.join(directory, 'docs')
+        os.makedirs(docs)
+        for i in range(args.documents):
+            with open(os.path.join(docs, f'{i:05}.md'), 'w', encoding='utf-8') as f:
+                f.write(f"# Dokument {i}\n\n" + "Ett stycke text med *betoning*.\n\n" * 50)
+        output_root = args.output_dir or os.path.join(directory, 'out')
+
+        variants = (('direct', dict(atomic=False)),
+                    ('atomic, synced', dict(atomic=True)),
+                    ('atomic, no sync', dict(atomic=True, sync=False)))
+        for name, options in variants:
+            output_dir = os.path.join(output_root, 'bench_output')
+            shutil.rmtree(output_dir, ignore_errors=True)
+            summary = convert_batch([docs], args.format, output_dir=output_dir,
+                                    workers=args.workers, **options)
+            assert summary.count('converted') == args.documents, summary.format()
+            print(f"{name:>16}: {summary.format()}")
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
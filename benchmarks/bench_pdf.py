@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Compare markdown_to_pdf through pandoc with the LaTeX PDF pipeline.
+
+Usage:
+    python benchmarks/bench_pdf.py [--size 200KB] [--runs N] [--engine pdflatex]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from corpus import build_document, parse_size
+from pdf_pipeline import PdfPipeline
+
+
+def run(converter, text, output_file, runs):
+    """Return the seconds of every conversion."""
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        converter.markdown_to_pdf(text, output_file)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', default='200KB', help="Document size (default: 200KB)")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--engine', default='pdflatex')
+    args = parser.parse_args()
+
+    if shutil.which(args.engine) is None:
+        sys.exit(f"{args.engine} is not installed")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text = build_document('llm', parse_size(args.size), os.path.join(tmp, 'images'))
+        output_file = os.path.join(tmp, 'out.pdf')
+        cases = {
+            'pandoc': DocumentConverter(),
+            'pipeline': DocumentConverter(pdf_pipeline=PdfPipeline(
+                args.engine, work_dir=os.path.join(tmp, 'work'), split_threshold=10 ** 12)),
+            'pipeline-parallel': DocumentConverter(pdf_pipeline=PdfPipeline(
+                args.engine, work_dir=os.path.join(tmp, 'work-parallel'))),
+        }
+        results = {}
+        for name, converter in cases.items():
+            # The first run is cold: no format, no working directory yet
+            times = run(converter, text, output_file, args.runs + 1)
+            results[name] = (times[0], statistics.median(times[1:]))
+
+    baseline = results['pandoc'][1]
+    for name, (cold, warm) in results.items():
+        print(f"{name:>18}: cold {cold:7.2f} s, warm {warm:7.2f} s "
+              f"({baseline / warm:5.1f}x vs pandoc)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Measure how queue worker throughput scales with the number of worker processes.
+
+Every run converts the same documents from a fresh queue; the speed-up is
+relative to a single worker. Scaling stops at the number of CPU cores. The
+cost of the queue itself, claiming and completing jobs without converting
+them, bounds the throughput many hosts can reach together.
+
+Usage:
+    python benchmarks/bench_queue.py [--documents N] [--processes 1,2,4] [--queue sqlite]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from job_queue import CLAIM_SIZE, Job, enqueue_batch, open_queue, run_workers
+
+
+def queue_cost(location: str, jobs: int) -> float:
+    """Seconds per job spent claiming and completing, without converting."""
+    queue = open_queue(location)
+    queue.submit(Job(f'{i}.md', f'{i}.html', 'html') for i in range(jobs))
+    start = time.perf_counter()
+    while True:
+        claimed = queue.claim('bench', CLAIM_SIZE)
+        if not claimed:
+            break
+        for job in claimed:
+            queue.complete(job)
+    return (time.perf_counter() - start) / jobs
+
+
+def main():
+    """Run the benchmark and print throughput per worker count."""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=400)
+    parser.add_argument('--format', default='html')
+    parser.add_argument('--processes', default='1,2,4',
+                        help="Comma separated worker process counts (default: 1,2,4)")
+    parser.add_argument('--queue', choices=('sqlite', 'directory'), default='sqlite')
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU cores")
+    with tempfile.TemporaryDirectory() as directory:
+        docs = os.path.join(directory, 'docs')
+        os.makedirs(docs)
+        for i in range(args.documents):
+            with open(os.path.join(docs, f'{i:05}.md'), 'w', encoding='utf-8') as f:
+                f.write(f"# Dokument {i}\n\n" + "Ett stycke text med *betoning*.\n\n" * 20)
+
+        single = None
+        for processes in (int(count) for count in args.processes.split(',')):
+            name = f'queue-{processes}' + ('.db' if args.queue == 'sqlite' else '')
+            location = os.path.join(directory, name)
+            enqueue_batch(open_queue(location), [docs], args.format,
+                          os.path.join(directory, f'out-{processes}'))
+            start = time.perf_counter()
+            completed = run_workers(location, processes)
+            elapsed = time.perf_counter() - start
+            assert completed == args.documents, open_queue(location).counts()
+            single = single or elapsed
+            print(f"{processes:>3} workers: {elapsed:6.2f}s, "
+                  f"{args.documents / elapsed:6.1f} documents/s, speed-up {single / elapsed:.2f}x")
+
+        cost = queue_cost(os.path.join(directory, 'cost' + ('.db' if args.queue == 'sqlite'
+                                                              else '')), args.documents)
+        print(f"Queue cost: {cost * 1000:.2f} ms/job, at most {1 / cost:.0f} jobs/s "
+              f"across all workers")
+
+
+if __name__ == "__main__":
+    main()
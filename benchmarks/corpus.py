@@ -0,0 +1,106 @@
+"""
+Synthetic Markdown corpora for benchmarks.
+
+Each document kind is built by repeating a representative section until the
+requested size is reached, so results are comparable across sizes.
+"""
+
+import os
+import struct
+import zlib
+
+
+def _png(width: int = 64, height: int = 64) -> bytes:
+    """Build a small solid-colour PNG image."""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body))
+    rows = b''.join(b'\x00' + b'\x33\x66\x99' * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows))
+            + chunk(b'IEND', b''))
+
+
+def small_note(i: int, image_dir: str) -> str:
+    return f"## Anteckning {i}\n\nKom ihåg att **skicka rapporten** före fredag.\n\n"
+
+
+def llm_answer(i: int, image_dir: str) -> str:
+    return (f"## Steg {i}\n\n"
+            "Här är en *utförlig* förklaring med `inline-kod` och en [länk](https://example.com).\n\n"
+            "1. Första punkten med **betoning**\n"
+            "2. Andra punkten\n"
+            "   - En underpunkt\n\n"
+            "```python\n"
+            f"def steg_{i}(x):\n"
+            "    return x * 2\n"
+            "```\n\n"
+            "> Ett citat som sammanfattar steget.\n\n")
+
+
+def math_heavy(i: int, image_dir: str) -> str:
+    return (f"### Ekvation {i}\n\n"
+            "Låt $f(x) = \\frac{1}{\\sqrt{2\\pi\\sigma^2}} e^{-\\frac{(x-\\mu)^2}{2\\sigma^2}}$.\n\n"
+            "$$\\int_{-\\infty}^{\\infty} f(x)\\,dx = 1, \\quad "
+            "\\sum_{k=0}^{n} \\binom{n}{k} = 2^n$$\n\n")
+
+
+def table_heavy(i: int, image_dir: str) -> str:
+    rows = "".join(f"| {i}-{r} | Namn {r} | {r * 3.5:.1f} | Ja |\n" for r in range(10))
+    return (f"### Tabell {i}\n\n"
+            "| Id | Namn | Värde | Aktiv |\n"
+            "|----|------|------:|:-----:|\n"
+            f"{rows}\n")
+
+
+def image_heavy(i: int, image_dir: str) -> str:
+    image = os.path.join(image_dir, f"bild{i % 8}.png").replace('\\', '/')
+    return f"### Bild {i}\n\n![Figur {i}]({image})\n\nBildtext för figur {i}.\n\n"
+
+
+KINDS = {
+    'small_note': small_note,
+    'llm_answer': llm_answer,
+    'math': math_heavy,
+    'tables': table_heavy,
+    'images': image_heavy,
+}
+
+
+def build_document(kind: str, size: int, image_dir: str) -> str:
+    """
+    Build a synthetic document of roughly the requested size in bytes.
+
+    Args:
+        kind: One of KINDS
+        size: Target size in bytes
+        image_dir: Directory holding the images referenced by image documents
+    """
+    make_section = KINDS[kind]
+    if kind == 'images':
+        os.makedirs(image_dir, exist_ok=True)
+        for n in range(8):
+            path = os.path.join(image_dir, f"bild{n}.png")
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(_png())
+
+    sections = [f"# Dokument: {kind}\n\n"]
+    total = len(sections[0])
+    i = 0
+    while total < size:
+        section = make_section(i, image_dir)
+        sections.append(section)
+        total += len(section.encode('utf-8'))
+        i += 1
+    return "".join(sections)
+
+
+def parse_size(text: str) -> int:
+    """Parse sizes such as '1KB', '100KB' or '50MB'."""
+    text = text.strip().upper()
+    for suffix, factor in (('MB', 1024 * 1024), ('KB', 1024), ('B', 1)):
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * factor)
+    return int(text)
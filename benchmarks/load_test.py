@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Load generator for the local HTTP conversion service.
+
+Usage:
+    python benchmarks/load_test.py [--url http://127.0.0.1:8765] [--start-server]
+                                   [--token-file FILE] [--clients 16] [--requests 2000]
+                                   [--format html] [--unique 0.9]
+
+Each client thread keeps one connection open and posts Markdown documents
+to /convert/text. A fraction of the documents (--unique) is distinct, the
+rest repeat earlier ones and should be served from the cache. Reports
+throughput, latency percentiles and how many requests were rejected with 429.
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from bench_engines import SAMPLE_MARKDOWN
+from server import default_token_file
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def wait_until_up(url, timeout=30.0):
+    """Poll /health until the service answers."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + '/health', timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Service at {url} did not come up")
+
+
+def client(url, token, documents, output_format, results, lock):
+    """Post documents over one keep-alive connection, recording (status, seconds)."""
+    parsed = urllib.parse.urlparse(url)
+    connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+    local = []
+    for text in documents:
+        body = json.dumps({'text': text, 'to': output_format}).encode('utf-8')
+        start = time.perf_counter()
+        try:
+            connection.request('POST', '/convert/text', body,
+                               {'Content-Type': 'application/json',
+                                'Authorization': f'Bearer {token}'})
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+            status = 0
+        local.append((status, time.perf_counter() - start))
+    connection.close()
+    with lock:
+        results.extend(local)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--url', default='http://127.0.0.1:8765')
+    parser.add_argument('--start-server', action='store_true',
+                        help="Start 'main.py serve' on the URL's port for the run")
+    parser.add_argument('--token-file', help="File with the service's token "
+                                             "(default: the service's default location)")
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--format', default='html')
+    parser.add_argument('--unique', type=float, default=0.9,
+                        help="Fraction of distinct documents (default: 0.9)")
+    args = parser.parse_args()
+
+    server = None
+    token_file = args.token_file or default_token_file()
+    if args.start_server:
+        port = urllib.parse.urlparse(args.url).port
+        main_script = os.path.join(os.path.dirname(__file__), '..', 'src', 'main.py')
+        server = subprocess.Popen([sys.executable, main_script, 'serve', '--port', str(port),
+                                   '--token-file', token_file])
+    try:
+        wait_until_up(args.url)
+        with open(token_file, encoding='utf-8') as f:
+            token = f.read().strip()
+
+        distinct = max(1, int(args.requests * args.unique))
+        documents = [f"{SAMPLE_MARKDOWN}\n\nDokument nummer {i % distinct}.\n"
+                     for i in range(args.requests)]
+        random.Random(0).shuffle(documents)
+        shares = [documents[i::args.clients] for i in range(args.clients)]
+
+        results = []
+        lock = threading.Lock()
+        threads = [threading.Thread(target=client,
+                                    args=(args.url, token, share, args.format, results, lock))
+                   for share in shares]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies = [seconds for status, seconds in results if status == 200]
+        rejected = sum(1 for status, _ in results if status == 429)
+        failed = len(results) - len(latencies) - rejected
+        print(f"{len(results)} requests from {args.clients} clients in {elapsed:.2f}s "
+              f"({len(latencies) / elapsed:.0f} ok/s)")
+        print(f"ok: {len(latencies)}, rejected (429): {rejected}, failed: {failed}")
+        print(f"latency p50 {percentile(latencies, 0.50) * 1000:.1f} ms, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.1f} ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+        with urllib.request.urlopen(args.url + '/health', timeout=5) as response:
+            print(f"server: {response.read().decode('utf-8')}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    main()
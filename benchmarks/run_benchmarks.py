@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Benchmark DocumentConverter across document kinds, sizes and output formats.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 1KB,100KB,1MB] [--formats html,docx]
+        [--kinds llm_answer,math] [--repeat 5] [--output results.json]
+        [--baseline benchmarks/baseline.json] [--save-baseline]
+
+Every case runs in a fresh process so peak RSS is measured per case. Results
+are written as JSON; with a baseline, cases whose median latency regressed
+beyond the tolerance are reported and the exit code is 1.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from corpus import KINDS, build_document, parse_size
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+OUTPUT_EXTENSIONS = {'html': 'html', 'docx': 'docx', 'markdown': 'md', 'pdf': 'pdf'}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def run_case(kind: str, size: int, output_format: str, repeat: int, engine: str) -> dict:
+    """Run one benchmark case. Executed in a fresh worker process."""
+    import logging
+    from converter import DocumentConverter
+
+    # pypandoc logs every pandoc warning, e.g. for math it cannot render as HTML
+    logging.getLogger('pypandoc').setLevel(logging.ERROR)
+
+    work_dir = tempfile.mkdtemp(prefix='omvandlare_bench_')
+    try:
+        text = build_document(kind, size, os.path.join(work_dir, 'images'))
+        output_file = os.path.join(work_dir, f"out.{OUTPUT_EXTENSIONS[output_format]}")
+        with DocumentConverter(engine=engine) as converter:
+            # Warm up format discovery and, for the pool engine, the workers
+            converter.convert_text("warm up", 'html')
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                if output_format in ('docx', 'pdf'):
+                    converter.convert_text(text, output_format, output_file=output_file)
+                else:
+                    converter.convert_text(text, output_format)
+                timings.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    input_mb = len(text.encode('utf-8')) / 1024 / 1024
+    peak_rss_mb = None
+    if resource is not None:
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        peak_rss_mb = max(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+                          resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) / scale
+    return {
+        'kind': kind,
+        'size': size,
+        'format': output_format,
+        'runs': repeat,
+        'p50_ms': percentile(timings, 0.50) * 1000,
+        'p90_ms': percentile(timings, 0.90) * 1000,
+        'p99_ms': percentile(timings, 0.99) * 1000,
+        'mean_ms': sum(timings) / len(timings) * 1000,
+        'throughput_mb_s': input_mb / (sum(timings) / len(timings)),
+        'peak_rss_mb': peak_rss_mb,
+    }
+
+
+def case_key(result: dict) -> str:
+    return f"{result['kind']}/{result['size']}/{result['format']}"
+
+
+def find_regressions(results: list, baseline: dict, tolerance: float,
+                     min_delta_ms: float) -> list:
+    """Compare median latencies against a baseline run."""
+    previous = {case_key(result): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get(case_key(result))
+        if before is None:
+            continue
+        delta = result['p50_ms'] - before['p50_ms']
+        if delta > min_delta_ms and result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append({'case': case_key(result), 'baseline_p50_ms': before['p50_ms'],
+                                'p50_ms': result['p50_ms'],
+                                'change': result['p50_ms'] / before['p50_ms'] - 1})
+    return regressions
+
+
+def main(argv=None) -> int:
+    """Run the benchmark suite."""
+    parser = argparse.ArgumentParser(description="Benchmark DocumentConverter")
+    parser.add_argument('--sizes', default='1KB,100KB,1MB',
+                        help="Comma separated document sizes, 1KB to 50MB")
+    parser.add_argument('--formats', default='html,docx,markdown,pdf')
+    parser.add_argument('--kinds', default=','.join(KINDS))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--engine', choices=('subprocess', 'pool'), default='subprocess')
+    parser.add_argument('--output', help="Write results JSON here (default: stdout)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help="Store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Allowed relative slowdown of the median (default: 0.25)")
+    parser.add_argument('--min-delta-ms', type=float, default=5.0,
+                        help="Ignore slowdowns smaller than this many milliseconds")
+    args = parser.parse_args(argv)
+
+    import pypandoc
+    formats = args.formats.split(',')
+    if 'pdf' in formats and not any(shutil.which(engine) for engine in ('pdflatex', 'xelatex',
+                                                                         'lualatex')):
+        print("Skipping pdf: no LaTeX engine found", file=sys.stderr)
+        formats.remove('pdf')
+
+    cases = [(kind, parse_size(size), fmt)
+             for kind in args.kinds.split(',')
+             for size in args.sizes.split(',')
+             for fmt in formats]
+
+    results = []
+    # One process per case keeps peak RSS and caches independent between cases
+    with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as executor:
+        for kind, size, fmt in cases:
+            result = executor.submit(run_case, kind, size, fmt, args.repeat, args.engine).result()
+            results.append(result)
+            print(f"{case_key(result):<32} p50 {result['p50_ms']:9.1f} ms  "
+                  f"p90 {result['p90_ms']:9.1f} ms  {result['throughput_mb_s']:7.2f} MB/s  "
+                  f"rss {result['peak_rss_mb'] or 0:7.1f} MB", file=sys.stderr, flush=True)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'pandoc_version': pypandoc.get_pandoc_version(),
+            'pypandoc_version': pypandoc.__version__,
+            'python_version': platform.python_version(),
+            'platform': platform.platform(),
+            'engine': args.engine,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+    exit_code = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['regressions'] = find_regressions(results, baseline, args.tolerance,
+                                                 args.min_delta_ms)
+        for regression in report['regressions']:
+            print(f"REGRESSION {regression['case']}: {regression['baseline_p50_ms']:.1f} ms -> "
+                  f"{regression['p50_ms']:.1f} ms ({regression['change']:+.0%})", file=sys.stderr)
+        exit_code = 1 if report['regressions'] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
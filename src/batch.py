@@ -0,0 +1,276 @@
+"""
+Parallel batch conversion of many documents.
+
+Inputs can be directories (searched recursively for Markdown files), glob
+patterns or single files. Conversions run on a process or thread pool and
+outputs that are already newer than their inputs are skipped. Outputs are
+staged on local disk and moved into place atomically by an OutputWriter.
+"""
+
+import glob
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from converter import DocumentConverter
+from output_writer import OutputWriter
+from templates import prepare_reference_doc
+
+
+# File extensions used for outputs of common pandoc formats
+OUTPUT_EXTENSIONS = {
+    'html': '.html',
+    'html5': '.html',
+    'docx': '.docx',
+    'odt': '.odt',
+    'pdf': '.pdf',
+    'markdown': '.md',
+    'gfm': '.md',
+    'commonmark': '.md',
+    'plain': '.txt',
+    'latex': '.tex',
+    'rst': '.rst',
+    'epub': '.epub',
+    'epub3': '.epub',
+}
+
+# Files picked up when a directory is given as input
+DEFAULT_PATTERNS = ('*.md', '*.markdown')
+
+
+@dataclass
+class BatchResult:
+    """Outcome of converting a single file."""
+    input_file: str
+    output_file: str
+    status: str  # 'converted', 'skipped' or 'failed'
+    seconds: float = 0.0
+    input_bytes: int = 0
+    error: Optional[str] = None
+
+
+@dataclass
+class BatchSummary:
+    """Totals for a whole batch run."""
+    results: List[BatchResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def count(self, status: str) -> int:
+        """Number of files with the given status."""
+        return sum(1 for result in self.results if result.status == status)
+
+    @property
+    def converted_bytes(self) -> int:
+        """Total input size of all converted files."""
+        return sum(result.input_bytes for result in self.results if result.status == 'converted')
+
+    def format(self) -> str:
+        """Human readable summary with throughput."""
+        converted = self.count('converted')
+        seconds = max(self.seconds, 1e-9)
+        return (f"{converted} converted, {self.count('skipped')} skipped, "
+                f"{self.count('failed')} failed in {self.seconds:.2f}s "
+                f"({converted / seconds:.1f} files/s, "
+                f"{self.converted_bytes / seconds / 1024 / 1024:.2f} MB/s)")
+
+
+def collect_inputs(sources: Iterable[str],
+                   patterns: Iterable[str] = DEFAULT_PATTERNS) -> List[Tuple[str, str]]:
+    """
+    Expand directories, glob patterns and files into input files.
+
+    Args:
+        sources: Directories, glob patterns or file paths
+        patterns: File name patterns searched for inside directories
+
+    Returns:
+        Sorted list of (input file, base directory) pairs. The base directory
+        is used to mirror the directory structure in the output directory.
+    """
+    inputs = {}
+    for source in sources:
+        if os.path.isdir(source):
+            for pattern in patterns:
+                for path in glob.glob(os.path.join(source, '**', pattern), recursive=True):
+                    inputs.setdefault(os.path.abspath(path), os.path.abspath(source))
+        elif os.path.isfile(source):
+            path = os.path.abspath(source)
+            inputs.setdefault(path, os.path.dirname(path))
+        else:
+            for path in glob.glob(source, recursive=True):
+                if os.path.isfile(path):
+                    path = os.path.abspath(path)
+                    inputs.setdefault(path, os.path.dirname(path))
+    return sorted(inputs.items())
+
+
+def output_path_for(input_file: str, base_dir: str, output_format: str,
+                    output_dir: Optional[str] = None) -> str:
+    """Get the output path for an input file, next to it or under output_dir."""
+    extension = OUTPUT_EXTENSIONS.get(output_format, f'.{output_format}')
+    stem = os.path.splitext(input_file)[0]
+    if output_dir is None:
+        return stem + extension
+    relative = os.path.relpath(stem, base_dir)
+    return os.path.join(output_dir, relative) + extension
+
+
+def is_up_to_date(input_file: str, output_file: str) -> bool:
+    """Check whether the output exists and is newer than its input."""
+    try:
+        return os.path.getmtime(output_file) >= os.path.getmtime(input_file)
+    except OSError:
+        return False
+
+
+# Converter reused by all conversions within one worker process or thread pool
+_worker_converter = None
+
+
+def _init_worker(engine: str, pool_size: Optional[int], reference_doc: Optional[str] = None):
+    global _worker_converter
+    _worker_converter = DocumentConverter(engine=engine, pool_size=pool_size,
+                                          reference_doc=reference_doc)
+
+
+def _convert_one(input_file: str, output_file: str, output_format: str,
+                 staged_file: Optional[str] = None) -> BatchResult:
+    """Convert a single file on a worker, writing it to staged_file if given."""
+    start = time.perf_counter()
+    try:
+        if staged_file is None:
+            os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+        _worker_converter.convert_file(input_file, output_format,
+                                       output_file=staged_file or output_file)
+    except Exception as e:
+        return BatchResult(input_file, output_file, 'failed',
+                           time.perf_counter() - start, error=str(e))
+    return BatchResult(input_file, output_file, 'converted', time.perf_counter() - start,
+                       os.path.getsize(input_file))
+
+
+def convert_batch(sources: Iterable[str], output_format: str, output_dir: Optional[str] = None,
+                  workers: Optional[int] = None, executor: str = 'process', force: bool = False,
+                  progress: Optional[Callable[[BatchResult], None]] = None,
+                  reference_doc: Optional[str] = None, atomic: bool = True,
+                  staging_dir: Optional[str] = None, sync: bool = True) -> BatchSummary:
+    """
+    Convert many documents in parallel.
+
+    Args:
+        sources: Directories, glob patterns or file paths to convert
+        output_format: Target format for all documents
+        output_dir: Directory for outputs (default: next to each input)
+        workers: Number of parallel workers (default: CPU count)
+        executor: 'process' for a process pool, or 'thread' for a thread pool
+            sharing warm pooled pandoc workers
+        force: Convert even if the output is newer than the input
+        progress: Called with each result as soon as it is available
+        reference_doc: Optional DOCX file with the styles of DOCX outputs
+        atomic: Stage outputs on local disk and move them into place once
+            complete, instead of letting pandoc write to the final paths
+        staging_dir: Local directory for staged outputs (default: system temp)
+        sync: Sync outputs and their directories to disk (only when atomic)
+
+    Returns:
+        Summary of all conversions
+
+    Raises:
+        ValueError: If the executor is unknown or the reference document is unusable
+    """
+    if executor not in ('process', 'thread'):
+        raise ValueError(f"Unknown executor: {executor}")
+    if reference_doc is not None:
+        # Validated and prepared here, so workers only look up the prepared copy
+        prepare_reference_doc(reference_doc)
+
+    workers = workers or os.cpu_count() or 1
+    summary = BatchSummary()
+    start = time.perf_counter()
+
+    jobs = []
+    for input_file, base_dir in collect_inputs(sources):
+        output_file = output_path_for(input_file, base_dir, output_format, output_dir)
+        if os.path.abspath(output_file) == input_file:
+            # E.g. markdown to markdown next to the input: never overwrite the source
+            result = BatchResult(input_file, output_file, 'failed',
+                                 error="Output would overwrite the input; choose an output directory")
+            summary.results.append(result)
+            if progress:
+                progress(result)
+        elif not force and is_up_to_date(input_file, output_file):
+            result = BatchResult(input_file, output_file, 'skipped')
+            summary.results.append(result)
+            if progress:
+                progress(result)
+        else:
+            jobs.append((input_file, output_file))
+
+    if jobs:
+        if executor == 'process':
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=('subprocess', None, reference_doc))
+        else:
+            # Threads share one converter backed by a pool of warm pandoc workers
+            _init_worker('pool', workers, reference_doc)
+            pool = ThreadPoolExecutor(max_workers=workers)
+
+        writer = OutputWriter(staging_dir, sync=sync) if atomic else None
+        report_lock = threading.Lock()
+
+        def report(result: BatchResult):
+            with report_lock:
+                summary.results.append(result)
+                if progress:
+                    progress(result)
+
+        def report_commit(result: BatchResult, commit: Future):
+            if commit.exception() is not None:
+                result.status = 'failed'
+                result.error = str(commit.exception())
+            report(result)
+
+        try:
+            futures = {}
+            for input_file, output_file in jobs:
+                staged_file = writer.staging_path(output_file) if writer else None
+                future = pool.submit(_convert_one, input_file, output_file, output_format,
+                                     staged_file)
+                futures[future] = staged_file
+            for future in as_completed(futures):
+                result = future.result()
+                staged_file = futures[future]
+                if staged_file is None:
+                    report(result)
+                elif result.status == 'converted':
+                    # Moved into place on the writer thread while conversions go on
+                    commit = writer.commit(staged_file, result.output_file)
+                    commit.add_done_callback(partial(report_commit, result))
+                else:
+                    writer.discard(staged_file)
+                    report(result)
+        finally:
+            pool.shutdown(cancel_futures=True)
+            if executor == 'thread':
+                _worker_converter.close()
+            if writer is not None:
+                writer.close()
+
+    summary.seconds = time.perf_counter() - start
+    return summary
+
+
+def print_progress(result: BatchResult):
+    """Print one line per finished file."""
+    if result.status == 'failed':
+        print(f"✗ {result.input_file}: {result.error}", file=sys.stderr, flush=True)
+    elif result.status == 'skipped':
+        print(f"- {result.input_file} (up to date)", flush=True)
+    else:
+        print(f"✓ {result.input_file} -> {result.output_file} ({result.seconds * 1000:.0f} ms)",
+              flush=True)
@@ -4,23 +4,544 @@ Conversion utilities using pypandoc.
 This module provides various document conversion functions.
 """
 
-import pypandoc
+import hashlib
+import json
 import os
-from typing import Optional
+import re
+import subprocess
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from fast_markdown import render_html
+from format_registry import get_supported_formats
+from instrumentation import Instrumentation, annotate, is_tracing, stage
+from mapped_input import MappedFile
+from pandoc_pool import PandocWorkerPool, WorkerError, convert_packed
+from pandoc_setup import CREATION_FLAGS, get_cache_dir, lazy_import
+from pdf_pipeline import PdfPipeline
+from resources import MARKDOWN_FORMATS, ResourceCache
+from templates import prepare_reference_doc
+
+
+# Permission bits removed from new files, read once as os.umask can only be read by setting it
+_UMASK = os.umask(0o022)
+os.umask(_UMASK)
+
+
+# Imported on first use to keep application startup fast
+pypandoc = lazy_import('pypandoc')
+asyncio = lazy_import('asyncio')
+
+
+# Conversion engines
+ENGINE_SUBPROCESS = 'subprocess'  # One pandoc process per call (via pypandoc)
+ENGINE_POOL = 'pool'              # Warm, long-lived pandoc workers
+
+# Size of the pieces streamed to and from pandoc
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Input files at least this large are streamed to pandoc from a memory map
+# instead of being read into a string, even when a worker pool is available
+MAPPED_INPUT_THRESHOLD = 16 * 1024 * 1024
+
+# Limits for the groups of documents convert_many sends through one pandoc run
+PACK_DOCUMENTS = 500
+PACK_BYTES = 1024 * 1024
+
+# Output formats pandoc can only write to a file
+FILE_ONLY_FORMATS = {'odt', 'docx', 'epub', 'epub3', 'pdf'}
+
+# Input formats guessed from file extensions when routing files to the pool
+EXTENSION_FORMATS = {
+    '.md': 'markdown',
+    '.markdown': 'markdown',
+    '.html': 'html',
+    '.htm': 'html',
+    '.rst': 'rst',
+    '.tex': 'latex',
+    '.org': 'org',
+}
+
+
+def base_format(fmt: str) -> str:
+    """Normalize a format name and strip any +/- extensions from it."""
+    return re.split(r'[+-]', pypandoc.normalize_format(fmt))[0]
+
+
+class ConversionCancelled(Exception):
+    """Raised when a conversion is cancelled before pandoc finished."""
+
+
+class ConversionTimeout(ConversionCancelled):
+    """Raised when pandoc is killed because a conversion took too long."""
+
+
+def run_pandoc(args: list, input_data: Optional[bytes] = None,
+               cancel_event: Optional[threading.Event] = None,
+               poll_interval: float = 0.1) -> bytes:
+    """
+    Run pandoc as a child process that can be killed while it is working.
+    
+    Args:
+        args: Command line arguments, without the pandoc executable
+        input_data: Bytes fed to pandoc's standard input
+        cancel_event: Event that kills pandoc when set
+        poll_interval: Seconds between checks of the cancel event
+        
+    Returns:
+        Everything pandoc wrote to standard output
+        
+    Raises:
+        ConversionCancelled: If cancel_event was set before pandoc finished
+        RuntimeError: If pandoc exits with an error
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        raise ConversionCancelled("Conversion cancelled")
+    
+    process = subprocess.Popen([pypandoc.get_pandoc_path()] + list(args),
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, creationflags=CREATION_FLAGS)
+    pending_input = input_data or b''
+    while True:
+        try:
+            stdout, stderr = process.communicate(pending_input, timeout=poll_interval)
+            break
+        except subprocess.TimeoutExpired:
+            # Input is only sent once; later calls just keep collecting output
+            pending_input = None
+            if cancel_event is not None and cancel_event.is_set():
+                process.kill()
+                process.communicate()
+                raise ConversionCancelled("Conversion cancelled")
+    
+    if process.returncode != 0:
+        raise RuntimeError(f'Pandoc died with exitcode "{process.returncode}" during conversion: '
+                           f'{stderr.decode("utf-8", errors="replace")}')
+    return stdout
+
+
+async def arun_pandoc(args: list, input_data: Optional[bytes] = None,
+                      timeout: Optional[float] = None) -> bytes:
+    """
+    Run pandoc as an asyncio child process.
+    
+    The child is killed if the timeout expires or the awaiting task is
+    cancelled, so no pandoc process outlives its caller.
+    
+    Args:
+        args: Command line arguments, without the pandoc executable
+        input_data: Bytes fed to pandoc's standard input
+        timeout: Seconds to wait for pandoc, or None to wait forever
+        
+    Returns:
+        Everything pandoc wrote to standard output
+        
+    Raises:
+        ConversionTimeout: If pandoc did not finish within the timeout
+        RuntimeError: If pandoc exits with an error
+    """
+    process = await asyncio.create_subprocess_exec(
+        pypandoc.get_pandoc_path(), *args, stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        creationflags=CREATION_FLAGS)
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(input_data), timeout)
+    except asyncio.TimeoutError:
+        raise ConversionTimeout(f"Conversion timed out after {timeout} seconds") from None
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    
+    if process.returncode != 0:
+        raise RuntimeError(f'Pandoc died with exitcode "{process.returncode}" during conversion: '
+                           f'{stderr.decode("utf-8", errors="replace")}')
+    return stdout
+
+
+def read_log_file(log_file: str) -> List[dict]:
+    """Read the messages pandoc wrote with --log; an empty file means no messages."""
+    with open(log_file, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return json.loads(content) if content.strip() else []
+
+
+@contextmanager
+def _logged(extra_args: Optional[list], messages: Optional[list]):
+    """
+    Yield pandoc arguments that write pandoc's log to a temporary file.
+    
+    Once the enclosed run succeeds, the logged messages are appended to
+    messages. Without a messages list the arguments are yielded unchanged.
+    """
+    if messages is None:
+        yield extra_args
+        return
+    fd, log_file = tempfile.mkstemp(prefix='omvandlare_log_', suffix='.json')
+    os.close(fd)
+    try:
+        yield list(extra_args or []) + ['--quiet', f'--log={log_file}']
+        messages.extend(read_log_file(log_file))
+    finally:
+        os.remove(log_file)
+
+
+def _read_text(path: str) -> str:
+    """Read a whole input file as text, transcoding it to UTF-8 if needed."""
+    with stage('read_input'):
+        with MappedFile(path) as mapped:
+            return mapped.read_text()
+
+
+def _read_transcoded(path: str) -> Optional[str]:
+    """Read an input file that is not UTF-8 as text; None if pandoc can read it itself."""
+    with stage('read_input'):
+        with MappedFile(path) as mapped:
+            return None if mapped.is_utf8 else mapped.read_text()
+
+
+def warnings_only(messages: List[dict]) -> List[dict]:
+    """Keep only warning and error messages from a pandoc log."""
+    return [message for message in messages
+            if message.get('verbosity') in ('WARNING', 'ERROR')]
+
+
+def _iter_chunks(source: Union[BinaryIO, Iterable], chunk_size: int) -> Iterator[bytes]:
+    """Read a file-like object, iterable or mapped file in UTF-8 encoded chunks."""
+    if isinstance(source, (str, os.PathLike)):
+        with MappedFile(source) as mapped:
+            yield from mapped.chunks(chunk_size)
+    elif isinstance(source, MappedFile):
+        yield from source.chunks(chunk_size)
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+    else:
+        for chunk in source:
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def _write_chunks(chunks: Iterable[bytes], destination: BinaryIO) -> int:
+    """Write chunks to a binary file-like object and return the byte count."""
+    written = 0
+    for chunk in chunks:
+        destination.write(chunk)
+        written += len(chunk)
+    return written
+
+
+def _annotate_output(result: str, output_file: Optional[str]):
+    """Record the output size on the active trace."""
+    if not is_tracing():
+        return
+    if output_file:
+        annotate(output_bytes=os.path.getsize(output_file))
+    else:
+        annotate(output_bytes=len(result.encode('utf-8')))
+
+
+def _packs(requests: List[dict], documents: int) -> List[List[dict]]:
+    """Split requests into groups of at most the given documents and PACK_BYTES."""
+    packs = []
+    pack, size = [], 0
+    for request in requests:
+        length = len(request['text'])
+        if pack and (len(pack) >= documents or size + length > PACK_BYTES):
+            packs.append(pack)
+            pack, size = [], 0
+        pack.append(request)
+        size += length
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def _pandoc_args(input_format: Optional[str], output_format: str, output_file: Optional[str],
+                 extra_args: Optional[list]) -> list:
+    """Build pandoc's command line arguments for a conversion."""
+    args = [f'--from={input_format}'] if input_format else []
+    args.append(f'--to={output_format}')
+    if output_file:
+        args.append(f'--output={output_file}')
+    return args + list(extra_args or [])
+
+
+def _decode_output(output: bytes) -> str:
+    """Decode pandoc's standard output the way pypandoc does."""
+    return output.decode('utf-8').replace('\r\n', '\n')
+
+
+def _remove_partial_output(output_file: Optional[str], previous: Optional[tuple]):
+    """Delete an output file pandoc started writing, but keep one it never touched."""
+    current = _file_signature(output_file) if output_file else None
+    if current is not None and current != previous:
+        os.remove(output_file)
+
+
+def _file_signature(path: str) -> Optional[tuple]:
+    """Size and modification time of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+class ConversionCache:
+    """
+    Content-addressed cache of conversion results.
+    
+    Results are kept in an in-memory LRU tier backed by a size-bounded
+    on-disk tier. Entries are keyed by a hash of the input text, formats,
+    extra pandoc arguments and pandoc version, so they never go stale.
+    """
+    
+    def __init__(self, memory_entries: int = 64, disk_dir: Optional[str] = None,
+                 disk_limit: Optional[int] = 256 * 1024 * 1024):
+        """
+        Initialize the cache.
+        
+        Args:
+            memory_entries: Number of results kept in memory
+            disk_dir: Directory for the on-disk tier
+                (default: 'conversions' in the cache directory)
+            disk_limit: Maximum size of the on-disk tier in bytes,
+                or None to keep results in memory only
+        """
+        self.memory_entries = memory_entries
+        self.disk_limit = disk_limit
+        self._disk_dir = disk_dir
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_size = None
+    
+    @property
+    def disk_dir(self) -> str:
+        """Directory of the on-disk tier."""
+        if self._disk_dir is None:
+            self._disk_dir = os.path.join(get_cache_dir(), 'conversions')
+        os.makedirs(self._disk_dir, exist_ok=True)
+        return self._disk_dir
+    
+    def make_key(self, text: str, output_format: str, input_format: str,
+                 extra_args: Optional[list] = None) -> str:
+        """Build the cache key for a conversion."""
+        digest = hashlib.sha256()
+        header = [input_format, output_format, list(extra_args or []),
+                  pypandoc.get_pandoc_version()]
+        digest.update(json.dumps(header).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(text.encode('utf-8'))
+        return digest.hexdigest()
+    
+    def get(self, key: str) -> Optional[bytes]:
+        """Look up a cached result, promoting disk hits to memory."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            if self.disk_limit is None:
+                return None
+            
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                # Refresh the mtime so eviction is least-recently-used
+                os.utime(path)
+            except OSError:
+                return None
+            self._remember(key, data)
+            return data
+    
+    def put(self, key: str, data: bytes):
+        """Store a result in both tiers."""
+        with self._lock:
+            self._remember(key, data)
+            if self.disk_limit is None or len(data) > self.disk_limit:
+                return
+            
+            path = self._disk_path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                # An entry being replaced no longer counts towards the limit
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                print(f"Could not write conversion cache entry: {e}")
+                return
+            
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_size += len(data) - replaced
+            if self._disk_size > self.disk_limit:
+                self._evict()
+    
+    def clear(self):
+        """Remove all cached results."""
+        with self._lock:
+            self._memory.clear()
+            if self.disk_limit is not None:
+                for path, _, _ in self._disk_entries():
+                    os.remove(path)
+            self._disk_size = 0
+    
+    def _remember(self, key: str, data: bytes):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+    
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key)
+    
+    def _disk_entries(self) -> list:
+        """List (path, size, mtime) for every entry of the on-disk tier."""
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+    
+    def _evict(self):
+        """Delete least recently used disk entries until under the size limit."""
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.disk_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._disk_size = total
 
 
 class DocumentConverter:
     """A class for converting between different document formats using pypandoc."""
     
-    def __init__(self):
-        """Initialize the converter."""
-        self.supported_formats = {
-            'input': pypandoc.get_pandoc_formats()[0],
-            'output': pypandoc.get_pandoc_formats()[1]
-        }
+    def __init__(self, engine: str = ENGINE_SUBPROCESS, pool_size: Optional[int] = None,
+                 cache: Optional[ConversionCache] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 max_async_conversions: int = 16, async_timeout: Optional[float] = None,
+                 native_markdown: bool = False, ast_cache_size: int = 16,
+                 resources: Optional[ResourceCache] = None,
+                 pdf_pipeline: Optional[PdfPipeline] = None,
+                 reference_doc: Optional[str] = None, sandbox: bool = False):
+        """
+        Initialize the converter.
+        
+        Args:
+            engine: 'subprocess' to start pandoc for every conversion, or 'pool'
+                to route conversions to a pool of warm pandoc workers
+            pool_size: Number of pooled workers (default: CPU count)
+            cache: Optional cache that makes convert_text return immediately
+                for inputs it has already converted
+            instrumentation: Optional instrumentation that records per-stage
+                timings, sizes and exit status of every conversion
+            max_async_conversions: Pandoc processes the async methods run at
+                once; further calls wait without holding a thread
+            async_timeout: Default timeout in seconds for the async methods
+            native_markdown: Render Markdown to HTML in-process when the
+                document only uses constructs fast_markdown supports,
+                falling back to pandoc otherwise
+            ast_cache_size: Number of parsed documents parse() keeps in memory
+            resources: Optional cache that resolves the images of Markdown
+                documents once, before exports that embed them (FILE_ONLY_FORMATS)
+            pdf_pipeline: Optional pipeline markdown_to_pdf compiles pandoc's
+                LaTeX output with, instead of letting pandoc run the engine
+            reference_doc: Optional DOCX file whose styles, page setup, headers
+                and footers DOCX exports use; it is validated and prepared
+                once, see templates.ReferenceTemplates
+            sandbox: Run pandoc with --sandbox, so documents cannot read other
+                files (LaTeX \\input, RST include, images). For untrusted input;
+                it turns off the resource cache and PDF output, whose LaTeX
+                engine cannot be sandboxed
+        """
+        if engine not in (ENGINE_SUBPROCESS, ENGINE_POOL):
+            raise ValueError(f"Unknown conversion engine: {engine}")
+        
+        self.engine = engine
+        self.pool = PandocWorkerPool(pool_size) if engine == ENGINE_POOL else None
+        self.cache = cache
+        self.instrumentation = instrumentation
+        self.max_async_conversions = max_async_conversions
+        self.async_timeout = async_timeout
+        self.native_markdown = native_markdown
+        self.ast_cache_size = ast_cache_size
+        self._asts = OrderedDict()
+        self._ast_lock = threading.Lock()
+        self.resources = resources
+        self.pdf_pipeline = pdf_pipeline
+        self.reference_doc = reference_doc
+        self.sandbox = sandbox
+        # One semaphore per event loop, since asyncio primitives are loop bound
+        self._async_slots = weakref.WeakKeyDictionary()
+    
+    @property
+    def supported_formats(self) -> dict:
+        """Input and output formats supported by pandoc, discovered on first use."""
+        return get_supported_formats()
+    
+    def warm_up(self) -> dict:
+        """
+        Do the slow one-time work conversions depend on, ahead of time.
+        
+        Locates pandoc (pypandoc probes candidate binaries by running them),
+        asks for its version and loads the supported formats. Meant to run on
+        a background thread right after startup, so the first conversion
+        does not pay for it.
+        
+        Returns:
+            Dictionary with 'pandoc_path', 'pandoc_version' and 'formats'
+            
+        Raises:
+            OSError: If pandoc cannot be found
+        """
+        with self._trace('warm_up'):
+            with stage('pandoc_discovery'):
+                pandoc_path = pypandoc.get_pandoc_path()
+            with stage('pandoc_version'):
+                version = pypandoc.get_pandoc_version()
+            formats = self.supported_formats
+        return {'pandoc_path': pandoc_path, 'pandoc_version': version, 'formats': formats}
+    
+    def close(self):
+        """Stop any pooled pandoc workers."""
+        if self.pool:
+            self.pool.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _trace(self, operation: str, **fields):
+        """Trace an operation if instrumentation is enabled."""
+        if self.instrumentation is None:
+            return nullcontext()
+        return self.instrumentation.trace(operation, engine=self.engine, **fields)
     
     def convert_file(self, input_file: str, output_format: str, 
-                     output_file: Optional[str] = None) -> str:
+                     output_file: Optional[str] = None,
+                     cancel_event: Optional[threading.Event] = None) -> str:
         """
         Convert a file from one format to another.
         
@@ -28,6 +549,8 @@ class DocumentConverter:
             input_file: Path to the input file
             output_format: Target format (e.g., 'html', 'pdf', 'docx')
             output_file: Optional output file path
+            cancel_event: Optional event; setting it kills the running pandoc
+                process and raises ConversionCancelled
             
         Returns:
             Converted content as string or output file path
@@ -35,14 +558,80 @@ class DocumentConverter:
         if not os.path.exists(input_file):
             raise FileNotFoundError(f"Input file not found: {input_file}")
         
-        if output_file:
-            pypandoc.convert_file(input_file, output_format, outputfile=output_file)
-            return output_file
-        else:
-            return pypandoc.convert_file(input_file, output_format)
+        input_format = EXTENSION_FORMATS.get(os.path.splitext(input_file)[1].lower())
+        with self._trace('convert_file', input_format=input_format, output_format=output_format):
+            if is_tracing():
+                annotate(input_bytes=os.path.getsize(input_file))
+            text = rewritten = None
+            if input_format and self._embeds_resources(input_format, output_format):
+                text = _read_text(input_file)
+                rewritten = self._resolve_resources(text,
+                                                    os.path.dirname(os.path.abspath(input_file)))
+            if rewritten != text:
+                result = self._convert_cached(rewritten, output_format, input_format, output_file,
+                                              None, cancel_event)
+            else:
+                # Without images to embed, pandoc can read the file itself
+                result = self._convert_file(input_file, input_format, output_format, output_file,
+                                            cancel_event)
+            _annotate_output(result, output_file)
+            return result
+    
+    def _convert_file(self, input_file: str, input_format: Optional[str], output_format: str,
+                      output_file: Optional[str],
+                      cancel_event: Optional[threading.Event] = None) -> str:
+        """Convert a file on the configured engine."""
+        extra_args = self._pandoc_options(output_format, None)
+        if input_format and base_format(output_format) != 'pdf':
+            with stage('read_input'):
+                mapped = MappedFile(input_file)
+            with mapped:
+                if cancel_event is not None:
+                    # Pool workers cannot be killed, so cancellable conversions run pandoc here
+                    with stage('pandoc'):
+                        if mapped.is_utf8:
+                            return self._run_cancellable(
+                                _pandoc_args(input_format, output_format, output_file, extra_args)
+                                + [os.path.abspath(input_file)], None, output_file, cancel_event)
+                        return self._convert_text_cancellable(mapped.read_text(), output_format,
+                                                              input_format, output_file, extra_args,
+                                                              cancel_event)
+                use_pool = not extra_args and self._use_pool(output_format, output_file)
+                if use_pool and mapped.size < MAPPED_INPUT_THRESHOLD:
+                    with stage('read_input'):
+                        text = mapped.read_text()
+                    return self.pool.convert_text(text, output_format, input_format, output_file)
+                if use_pool or not mapped.is_utf8:
+                    return self._convert_mapped(mapped, input_format, output_format, output_file,
+                                                extra_args)
+            # Otherwise pandoc reads the file itself, which copies nothing in Python
+        
+        self._validate_formats(os.path.splitext(input_file)[1].strip('.'), output_format, output_file)
+        with stage('pandoc_discovery'):
+            pypandoc.get_pandoc_path()
+        with stage('pandoc'):
+            if output_file:
+                pypandoc.convert_file(input_file, output_format, outputfile=output_file,
+                                      extra_args=extra_args or (), verify_format=False)
+                return output_file
+            else:
+                return pypandoc.convert_file(input_file, output_format,
+                                             extra_args=extra_args or (), verify_format=False)
+    
+    def _convert_mapped(self, mapped: MappedFile, input_format: str, output_format: str,
+                        output_file: Optional[str], extra_args: Optional[list] = None) -> str:
+        """Stream a mapped input file through pandoc, transcoding it to UTF-8 if needed."""
+        with stage('pandoc'):
+            if output_file:
+                self.convert_stream(mapped, output_format, output_file, input_format, extra_args)
+                return output_file
+            return _decode_output(b''.join(self.iter_convert(mapped, output_format, input_format,
+                                                             extra_args)))
     
     def convert_text(self, text: str, output_format: str, 
-                     input_format: str = 'markdown', output_file: Optional[str] = None) -> str:
+                     input_format: str = 'markdown', output_file: Optional[str] = None,
+                     extra_args: Optional[list] = None,
+                     cancel_event: Optional[threading.Event] = None) -> str:
         """
         Convert text from one format to another.
         
@@ -51,15 +640,709 @@ class DocumentConverter:
             output_format: Target format
             input_format: Source format (default: markdown)
             output_file: Optional output file path
+            extra_args: Optional extra command line arguments for pandoc
+            cancel_event: Optional event; setting it kills the running pandoc
+                process and raises ConversionCancelled
+            
+        Returns:
+            Converted text or output file path
+        """
+        with self._trace('convert_text', input_format=input_format, output_format=output_format):
+            if is_tracing():
+                annotate(input_bytes=len(text.encode('utf-8')))
+            if self._embeds_resources(input_format, output_format):
+                text = self._resolve_resources(text)
+            result = self._convert_cached(text, output_format, input_format, output_file,
+                                          extra_args, cancel_event)
+            _annotate_output(result, output_file)
+            return result
+    
+    def convert_text_with_messages(self, text: str, output_format: str,
+                                   input_format: str = 'markdown',
+                                   output_file: Optional[str] = None,
+                                   extra_args: Optional[list] = None,
+                                   cancel_event: Optional[threading.Event] = None
+                                   ) -> Tuple[str, List[dict]]:
+        """
+        Convert text and return pandoc's log messages for this conversion.
+        
+        Messages come from pandoc's JSON log, so they are collected per call
+        and conversions can safely run in parallel. Each message is a
+        dictionary with at least 'type', 'verbosity' and 'pretty' keys.
+        
+        Args:
+            Same as convert_text
+            
+        Returns:
+            Tuple of (converted text or output file path, list of messages)
+        """
+        messages = []
+        with self._trace('convert_text', input_format=input_format, output_format=output_format):
+            if is_tracing():
+                annotate(input_bytes=len(text.encode('utf-8')))
+            if self._embeds_resources(input_format, output_format):
+                text = self._resolve_resources(text)
+            result = self._convert_cached(text, output_format, input_format, output_file,
+                                          extra_args, cancel_event, messages)
+            _annotate_output(result, output_file)
+        return result, messages
+    
+    def _embeds_resources(self, input_format: str, output_format: str) -> bool:
+        """Whether images should go through the resource cache for a conversion."""
+        return (self.resources is not None and not self.sandbox
+                and base_format(input_format) in MARKDOWN_FORMATS
+                and base_format(output_format) in FILE_ONLY_FORMATS)
+    
+    def _resolve_resources(self, text: str, base_dir: Optional[str] = None) -> str:
+        """Point the images of a document at locally cached copies."""
+        with stage('resolve_resources'):
+            return self.resources.rewrite(text, base_dir)
+    
+    def parse(self, text: str, input_format: str = 'markdown') -> str:
+        """
+        Parse text into pandoc's JSON AST, reusing earlier parses of the same text.
+        
+        The AST can be inspected or changed with json.loads/json.dumps and
+        rendered to any number of formats with render().
+        
+        Args:
+            text: Input text to parse
+            input_format: Source format (default: markdown)
+            
+        Returns:
+            The document as pandoc JSON
+        """
+        key = hashlib.sha256(f'{input_format}\0{text}'.encode('utf-8')).hexdigest()
+        with self._ast_lock:
+            ast = self._asts.get(key)
+            if ast is not None:
+                self._asts.move_to_end(key)
+                return ast
+        
+        with self._trace('parse', input_format=input_format, output_format='json'):
+            if is_tracing():
+                annotate(input_bytes=len(text.encode('utf-8')))
+            ast = self._convert_cached(text, 'json', input_format, None, None, None)
+        with self._ast_lock:
+            self._asts[key] = ast
+            while len(self._asts) > self.ast_cache_size:
+                self._asts.popitem(last=False)
+        return ast
+    
+    def render(self, ast: Union[str, dict], output_format: str,
+               output_file: Optional[str] = None, extra_args: Optional[list] = None) -> str:
+        """
+        Render a pandoc JSON AST from parse() to an output format.
+        
+        Args:
+            ast: Pandoc JSON, as text or as the decoded dictionary
+            output_format: Target format
+            output_file: Optional output file path
+            extra_args: Optional extra command line arguments for pandoc
             
         Returns:
             Converted text or output file path
         """
+        if not isinstance(ast, str):
+            ast = json.dumps(ast)
+        return self.convert_text(ast, output_format, 'json', output_file, extra_args)
+    
+    def convert_to_formats(self, text: str, outputs: Dict[str, Optional[str]],
+                           input_format: str = 'markdown', extra_args: Optional[list] = None,
+                           max_workers: Optional[int] = None) -> Dict[str, str]:
+        """
+        Convert text to several formats, parsing it only once.
+        
+        The text is parsed to pandoc's JSON AST (see parse()) and the outputs
+        are rendered from it concurrently.
+        
+        Args:
+            text: Input text to convert
+            outputs: Output file path per target format, or None for text output,
+                e.g. {'html': None, 'docx': 'out.docx'}
+            input_format: Source format (default: markdown)
+            extra_args: Optional extra command line arguments for every writer
+            max_workers: Renders running at once (default: one per output)
+            
+        Returns:
+            Converted text or output file path per format
+            
+        Raises:
+            RuntimeError: The first failed render, once all renders have finished
+        """
+        if not outputs:
+            return {}
+        ast = self.parse(text, input_format)
+        with ThreadPoolExecutor(max_workers=max_workers or len(outputs)) as executor:
+            futures = {output_format: executor.submit(self.render, ast, output_format,
+                                                      output_file, extra_args)
+                       for output_format, output_file in outputs.items()}
+        return {output_format: future.result() for output_format, future in futures.items()}
+    
+    def convert_many(self, texts: List[str], output_format: str, input_format: str = 'markdown',
+                     output_files: Optional[List[Optional[str]]] = None,
+                     max_workers: Optional[int] = None) -> list:
+        """
+        Convert many small documents with a few pandoc runs instead of one each.
+        
+        Documents are spread over max_workers groups of at most PACK_DOCUMENTS
+        documents and PACK_BYTES of text. Each group is converted by a single pandoc process
+        (or a single pooled worker). Every document is read on its own, so
+        documents cannot affect each other; for text formats the group is
+        written in one call and split at marker blocks. A document that fails
+        inside its group is converted again on its own, which gives it the
+        same error convert_text would raise; the rest of the group is kept.
+        
+        Args:
+            texts: Input texts to convert
+            output_format: Target format
+            input_format: Source format (default: markdown)
+            output_files: Optional output file path per text, or None entries
+                for text output
+            max_workers: Groups converted at once (default: CPU count)
+            
+        Returns:
+            One entry per text, in order: the converted text or output file
+            path, or the exception raised for that document
+        """
+        if output_files is None:
+            output_files = [None] * len(texts)
+        elif len(output_files) != len(texts):
+            raise ValueError("output_files must have one entry per text")
+        
+        with self._trace('convert_many', input_format=input_format, output_format=output_format):
+            annotate(documents=len(texts))
+            results = [None] * len(texts)
+            requests = []
+            for index, (text, output_file) in enumerate(zip(texts, output_files)):
+                if not self._packable(input_format, output_format, output_file):
+                    results[index] = self._convert_single(text, output_format, input_format,
+                                                          output_file)
+                    continue
+                if self._embeds_resources(input_format, output_format):
+                    text = self._resolve_resources(text)
+                key = None
+                if self.cache is not None:
+                    with stage('cache_lookup'):
+                        key = self.cache.make_key(text, output_format, input_format, None)
+                        data = self.cache.get(key)
+                    if data is not None:
+                        results[index] = self._cached_result(data, output_file)
+                        continue
+                requests.append({'text': text, 'from': input_format, 'to': output_format,
+                                 'output': output_file, 'index': index, 'key': key})
+            
+            workers = max_workers or os.cpu_count() or 1
+            # Spread the documents over the workers, but never pack more than the limits
+            packs = _packs(requests, min(PACK_DOCUMENTS, -(-len(requests) // workers)))
+            annotate(packs=len(packs))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for pack, outcomes in zip(packs, executor.map(self._convert_pack, packs)):
+                    for request, outcome in zip(pack, outcomes):
+                        results[request['index']] = outcome
+            return results
+    
+    def _packable(self, input_format: str, output_format: str,
+                  output_file: Optional[str]) -> bool:
+        """Check whether a document can be converted as part of a group."""
+        if base_format(output_format) == 'pdf':
+            return False
+        if base_format(output_format) in FILE_ONLY_FORMATS and not output_file:
+            return False
+        if self.reference_doc is not None and base_format(output_format) == 'docx':
+            return False
+        if self.sandbox:
+            # Groups are written by workers, whose writers may read files
+            return False
+        # Rendered in-process, which is cheaper than any pandoc run
+        return not (self.native_markdown and input_format in ('markdown', 'md')
+                    and output_format in ('html', 'html5') and not output_file)
+    
+    def _convert_single(self, text: str, output_format: str, input_format: str,
+                        output_file: Optional[str]):
+        """Convert one document of convert_many, returning errors instead of raising."""
+        try:
+            return self.convert_text(text, output_format, input_format, output_file)
+        except Exception as e:
+            return e
+    
+    def _cached_result(self, data: bytes, output_file: Optional[str]) -> str:
+        """Return cached output as text, or write it to the output file."""
         if output_file:
-            pypandoc.convert_text(text, output_format, format=input_format, outputfile=output_file)
+            with stage('write_output'):
+                with open(output_file, 'wb') as f:
+                    f.write(data)
             return output_file
-        else:
-            return pypandoc.convert_text(text, output_format, format=input_format)
+        return data.decode('utf-8')
+    
+    def _convert_pack(self, pack: List[dict]) -> list:
+        """Convert a group of documents in one pandoc run, retrying failures alone."""
+        with stage('pandoc'):
+            try:
+                if self.pool is not None:
+                    outcomes = self.pool.convert_pack(pack)
+                else:
+                    outcomes = convert_packed(pack)
+            except WorkerError:
+                outcomes = [None] * len(pack)
+        
+        results = []
+        for request, outcome in zip(pack, outcomes):
+            if not isinstance(outcome, tuple):
+                # Failed in the group, or the whole run failed
+                results.append(self._convert_single(request['text'], request['to'],
+                                                    request['from'], request['output']))
+                continue
+            result, messages = outcome
+            if request['key'] is not None:
+                with stage('cache_store'):
+                    if request['output']:
+                        with open(request['output'], 'rb') as f:
+                            self.cache.put(request['key'], f.read())
+                    else:
+                        self.cache.put(request['key'], result.encode('utf-8'))
+                    self.cache.put(request['key'] + '.log', json.dumps(messages).encode('utf-8'))
+            results.append(result)
+        return results
+    
+    def _convert_cached(self, text: str, output_format: str, input_format: str,
+                        output_file: Optional[str], extra_args: Optional[list],
+                        cancel_event: Optional[threading.Event],
+                        messages: Optional[list] = None) -> str:
+        """Run a conversion through the cache, if one is configured."""
+        result, key, extra_args = self._route(text, output_format, input_format, output_file,
+                                              extra_args, messages)
+        if result is not None:
+            return result
+        
+        # Cached results keep their log, so later hits can report it
+        collected = [] if key is not None or messages is not None else None
+        result = self._convert_text(text, output_format, input_format, output_file,
+                                    extra_args, cancel_event, collected)
+        self._store(key, result, output_file, collected)
+        if messages is not None:
+            messages.extend(collected)
+        return result
+    
+    def _route(self, text: str, output_format: str, input_format: str,
+               output_file: Optional[str], extra_args: Optional[list],
+               messages: Optional[list] = None) -> Tuple[Optional[str], Optional[str],
+                                                         Optional[list]]:
+        """
+        Handle what comes before pandoc: the native renderer, the reference
+        document and the cache. Shared by the sync and async paths.
+        
+        Returns:
+            Tuple of (result, or None if pandoc has to run; cache key, or None
+            without a cache; pandoc arguments to run with)
+        """
+        if self.native_markdown and input_format in ('markdown', 'md') \
+                and output_format in ('html', 'html5') and not output_file and not extra_args:
+            with stage('native_render'):
+                html = render_html(text)
+            if html is not None:
+                annotate(native=True)
+                return html, None, extra_args
+        
+        extra_args = self._pandoc_options(output_format, extra_args)
+        if self.cache is None:
+            return None, None, extra_args
+        
+        with stage('cache_lookup'):
+            key = self.cache.make_key(text, output_format, input_format, extra_args)
+            data = self.cache.get(key)
+            log_data = self.cache.get(key + '.log') if messages is not None else b'[]'
+        annotate(cache_hit=data is not None and log_data is not None)
+        if data is not None and log_data is not None:
+            if messages is not None:
+                messages.extend(json.loads(log_data))
+            return self._cached_result(data, output_file), key, extra_args
+        return None, key, extra_args
+    
+    def _store(self, key: Optional[str], result: str, output_file: Optional[str],
+               messages: Optional[list]):
+        """Cache a conversion result and its log messages under the key from _route."""
+        if key is None:
+            return
+        with stage('cache_store'):
+            if output_file:
+                with open(output_file, 'rb') as f:
+                    self.cache.put(key, f.read())
+            else:
+                self.cache.put(key, result.encode('utf-8'))
+            self.cache.put(key + '.log', json.dumps(messages).encode('utf-8'))
+    
+    def _convert_text(self, text: str, output_format: str, input_format: str,
+                      output_file: Optional[str], extra_args: Optional[list],
+                      cancel_event: Optional[threading.Event] = None,
+                      messages: Optional[list] = None) -> str:
+        """
+        Run a conversion on the configured engine, bypassing the cache.
+        
+        If a messages list is given, pandoc's log messages are appended to it.
+        """
+        if cancel_event is None and not extra_args and self._use_pool(output_format, output_file):
+            result, pool_messages = self.pool.convert_text_with_messages(
+                text, output_format, input_format, output_file)
+            if messages is not None:
+                messages.extend(pool_messages)
+            return result
+        
+        self._validate_formats(input_format, output_format, output_file)
+        with _logged(extra_args, messages) as args:
+            return self._run_subprocess(text, output_format, input_format, output_file,
+                                        args, cancel_event)
+    
+    def _run_subprocess(self, text: str, output_format: str, input_format: str,
+                        output_file: Optional[str], extra_args: Optional[list],
+                        cancel_event: Optional[threading.Event]) -> str:
+        """Run one pandoc process for a conversion."""
+        with stage('pandoc_discovery'):
+            pypandoc.get_pandoc_path()
+        with stage('pandoc'):
+            if cancel_event is not None:
+                return self._convert_text_cancellable(text, output_format, input_format,
+                                                      output_file, extra_args, cancel_event)
+            if output_file:
+                pypandoc.convert_text(text, output_format, format=input_format,
+                                      outputfile=output_file, extra_args=extra_args or (),
+                                      verify_format=False)
+                return output_file
+            else:
+                return pypandoc.convert_text(text, output_format, format=input_format,
+                                             extra_args=extra_args or (), verify_format=False)
+    
+    def _convert_text_cancellable(self, text: str, output_format: str, input_format: str,
+                                  output_file: Optional[str], extra_args: Optional[list],
+                                  cancel_event: threading.Event) -> str:
+        """Run pandoc directly so the child process can be killed on cancel."""
+        args = _pandoc_args(input_format, output_format, output_file, extra_args)
+        return self._run_cancellable(args, text.encode('utf-8'), output_file, cancel_event)
+    
+    def _run_cancellable(self, args: List[str], input_data: Optional[bytes],
+                         output_file: Optional[str], cancel_event: threading.Event) -> str:
+        """Run pandoc with the given arguments, removing partial output on cancel."""
+        previous = _file_signature(output_file) if output_file else None
+        
+        try:
+            output = run_pandoc(args, input_data, cancel_event)
+        except ConversionCancelled:
+            # Do not leave a half-written document behind
+            _remove_partial_output(output_file, previous)
+            raise
+        
+        if output_file:
+            return output_file
+        return _decode_output(output)
+    
+    async def aconvert_text(self, text: str, output_format: str,
+                            input_format: str = 'markdown', output_file: Optional[str] = None,
+                            extra_args: Optional[list] = None,
+                            timeout: Optional[float] = None) -> str:
+        """
+        Convert text without blocking the event loop.
+        
+        Pandoc runs as an asyncio child process, so many conversions can be
+        in flight from one event loop without a thread each. At most
+        max_async_conversions pandoc processes run at once. Cancelling the
+        awaiting task kills pandoc and removes any partially written output.
+        Conversions are routed like convert_text: through the native
+        renderer, resource cache, reference document and conversion cache.
+        
+        Args:
+            text: Input text to convert
+            output_format: Target format
+            input_format: Source format (default: markdown)
+            output_file: Optional output file path
+            extra_args: Optional extra command line arguments for pandoc
+            timeout: Seconds pandoc may run (default: the converter's async_timeout)
+            
+        Returns:
+            Converted text or output file path
+            
+        Raises:
+            ConversionTimeout: If pandoc did not finish in time
+            RuntimeError: If a format is invalid or pandoc fails
+        """
+        with self._trace('aconvert_text', input_format=input_format, output_format=output_format):
+            if is_tracing():
+                annotate(input_bytes=len(text.encode('utf-8')))
+            if self._embeds_resources(input_format, output_format):
+                # Images may have to be downloaded
+                text = await asyncio.to_thread(self._resolve_resources, text)
+            result = await self._aconvert_cached(text, output_format, input_format, output_file,
+                                                 extra_args, timeout)
+            _annotate_output(result, output_file)
+            return result
+    
+    async def aconvert_file(self, input_file: str, output_format: str,
+                            output_file: Optional[str] = None,
+                            timeout: Optional[float] = None) -> str:
+        """
+        Convert a file without blocking the event loop. See aconvert_text.
+        
+        Files are routed like convert_file.
+        
+        Args:
+            input_file: Path to the input file
+            output_format: Target format
+            output_file: Optional output file path
+            timeout: Seconds pandoc may run (default: the converter's async_timeout)
+            
+        Returns:
+            Converted content as string or output file path
+        """
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"Input file not found: {input_file}")
+        
+        input_format = EXTENSION_FORMATS.get(os.path.splitext(input_file)[1].lower())
+        with self._trace('aconvert_file', input_format=input_format, output_format=output_format):
+            if is_tracing():
+                annotate(input_bytes=os.path.getsize(input_file))
+            text = rewritten = None
+            if input_format and self._embeds_resources(input_format, output_format):
+                text = await asyncio.to_thread(_read_text, input_file)
+                rewritten = await asyncio.to_thread(
+                    self._resolve_resources, text, os.path.dirname(os.path.abspath(input_file)))
+            if rewritten != text:
+                result = await self._aconvert_cached(rewritten, output_format, input_format,
+                                                     output_file, None, timeout)
+            else:
+                result = await self._aconvert_file(input_file, input_format, output_format,
+                                                   output_file, timeout)
+            _annotate_output(result, output_file)
+            return result
+    
+    async def _aconvert_cached(self, text: str, output_format: str, input_format: str,
+                               output_file: Optional[str], extra_args: Optional[list],
+                               timeout: Optional[float]) -> str:
+        """Async counterpart of _convert_cached."""
+        result, key, extra_args = await asyncio.to_thread(
+            self._route, text, output_format, input_format, output_file, extra_args)
+        if result is not None:
+            return result
+        
+        collected = [] if key is not None else None
+        self._validate_formats(input_format, output_format, output_file)
+        with _logged(extra_args, collected) as args:
+            output = await self._arun_pandoc(
+                _pandoc_args(input_format, output_format, output_file, args),
+                text.encode('utf-8'), output_file, timeout)
+        result = output_file if output_file else _decode_output(output)
+        await asyncio.to_thread(self._store, key, result, output_file, collected)
+        return result
+    
+    async def _aconvert_file(self, input_file: str, input_format: Optional[str],
+                             output_format: str, output_file: Optional[str],
+                             timeout: Optional[float]) -> str:
+        """Async counterpart of _convert_file: pandoc reads the file unless it needs transcoding."""
+        extra_args = self._pandoc_options(output_format, None)
+        if input_format and base_format(output_format) != 'pdf':
+            text = await asyncio.to_thread(_read_transcoded, input_file)
+            if text is not None:
+                self._validate_formats(input_format, output_format, output_file)
+                output = await self._arun_pandoc(
+                    _pandoc_args(input_format, output_format, output_file, extra_args),
+                    text.encode('utf-8'), output_file, timeout)
+                return output_file if output_file else _decode_output(output)
+        
+        self._validate_formats(os.path.splitext(input_file)[1].strip('.'), output_format, output_file)
+        args = _pandoc_args(input_format, output_format, output_file, extra_args)
+        output = await self._arun_pandoc(args + [os.path.abspath(input_file)], None, output_file,
+                                         timeout)
+        return output_file if output_file else _decode_output(output)
+    
+    async def _arun_pandoc(self, args: list, input_data: Optional[bytes],
+                           output_file: Optional[str], timeout: Optional[float]) -> bytes:
+        """Run pandoc once a slot is free, cleaning up output on timeout or cancel."""
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = asyncio.Semaphore(self.max_async_conversions)
+        
+        previous = _file_signature(output_file) if output_file else None
+        async with slots:
+            with stage('pandoc'):
+                try:
+                    return await arun_pandoc(args, input_data,
+                                             self.async_timeout if timeout is None else timeout)
+                except (ConversionCancelled, asyncio.CancelledError):
+                    _remove_partial_output(output_file, previous)
+                    raise
+    
+    def _validate_formats(self, input_format: str, output_format: str,
+                          output_file: Optional[str]):
+        """
+        Check formats against the cached format registry.
+        
+        This replaces pypandoc's own validation, which asks pandoc for its
+        formats on every single conversion.
+        
+        Raises:
+            RuntimeError: If a format is unsupported or needs an output file
+        """
+        input_base = base_format(input_format)
+        output_base = base_format(output_format)
+        with stage('format_discovery'):
+            formats = self.supported_formats
+        
+        if input_base not in formats['input']:
+            raise RuntimeError(f'Invalid input format! Got "{input_base}" but expected one of these: '
+                               f'{", ".join(formats["input"])}')
+        if output_base not in formats['output'] and output_base != 'pdf':
+            raise RuntimeError(f'Invalid output format! Got {output_base} but expected one of these: '
+                               f'{", ".join(formats["output"])}')
+        if output_base in FILE_ONLY_FORMATS and not output_file:
+            raise RuntimeError(f"Output to {output_base} only works by using a outputfile.")
+        if output_base == 'pdf' and not str(output_file).endswith('.pdf'):
+            raise RuntimeError('PDF output needs an outputfile with ".pdf" as a fileending.')
+    
+    def _pandoc_options(self, output_format: str,
+                        extra_args: Optional[list]) -> Optional[list]:
+        """
+        Add the converter's own options to the arguments of a conversion: the
+        prepared reference document for DOCX exports, and --sandbox.
+        
+        Raises:
+            RuntimeError: If PDF output is requested from a sandboxed converter
+        """
+        if self.sandbox:
+            if base_format(output_format) == 'pdf':
+                raise RuntimeError("PDF output is not available in sandbox mode, because "
+                                   "the LaTeX engine can read any file")
+            extra_args = list(extra_args or [])
+            if '--sandbox' not in extra_args:
+                extra_args.append('--sandbox')
+        if self.reference_doc is None or base_format(output_format) != 'docx':
+            return extra_args
+        extra_args = list(extra_args or [])
+        # A reference document passed by the caller wins
+        if any(arg.startswith('--reference-doc') for arg in extra_args):
+            return extra_args
+        with stage('reference_doc'):
+            prepared = prepare_reference_doc(self.reference_doc)
+        return extra_args + [f'--reference-doc={prepared}']
+    
+    def _use_pool(self, output_format: str, output_file: Optional[str]) -> bool:
+        """Check whether a conversion should go to the worker pool."""
+        return self.pool is not None and self.pool.supports(output_format, output_file)
+    
+    def iter_convert(self, source: Union[BinaryIO, Iterable], output_format: str,
+                     input_format: str = 'markdown', extra_args: Optional[list] = None,
+                     chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        Convert a stream, yielding the output in chunks as pandoc produces it.
+        
+        The input is fed to pandoc through a pipe from a background thread,
+        so neither the whole input nor the whole output is held in Python.
+        Stopping the iteration early kills pandoc.
+        
+        Args:
+            source: File-like object with read(), an iterable of str/bytes chunks,
+                or an input file path or MappedFile, streamed from a memory map
+            output_format: Target format (binary formats such as docx are allowed)
+            input_format: Source format (default: markdown)
+            extra_args: Optional extra command line arguments for pandoc
+            chunk_size: Size of the chunks read from the source and from pandoc
+            
+        Yields:
+            Output bytes
+            
+        Raises:
+            RuntimeError: If pandoc exits with an error
+        """
+        self._validate_formats(input_format, output_format, '-')
+        extra_args = self._pandoc_options(output_format, extra_args)
+        args = [pypandoc.get_pandoc_path(), f'--from={input_format}', f'--to={output_format}',
+                '--output=-'] + list(extra_args or [])
+        process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE, creationflags=CREATION_FLAGS)
+        
+        feed_errors = []
+        stderr_chunks = []
+        
+        def feed():
+            try:
+                for chunk in _iter_chunks(source, chunk_size):
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # pandoc stopped early; its exit status tells why
+            except Exception as e:
+                feed_errors.append(e)
+                process.kill()
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+        
+        threads = [threading.Thread(target=feed, daemon=True),
+                   threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()),
+                                    daemon=True)]
+        for thread in threads:
+            thread.start()
+        
+        finished = False
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            process.wait()
+            for thread in threads:
+                thread.join()
+            process.stdout.close()
+            process.stderr.close()
+        
+        if feed_errors:
+            raise feed_errors[0]
+        if process.returncode != 0:
+            stderr = b''.join(stderr_chunks).decode('utf-8', errors='replace')
+            raise RuntimeError(f'Pandoc died with exitcode "{process.returncode}" during '
+                               f'conversion: {stderr}')
+    
+    def convert_stream(self, source: Union[BinaryIO, Iterable], output_format: str,
+                       destination: Union[str, BinaryIO], input_format: str = 'markdown',
+                       extra_args: Optional[list] = None,
+                       chunk_size: int = STREAM_CHUNK_SIZE) -> int:
+        """
+        Convert a stream and write the output straight to a file.
+        
+        A destination path is only replaced once the conversion succeeded.
+        
+        Args:
+            source: File-like object with read(), an iterable of str/bytes chunks,
+                or an input file path or MappedFile, streamed from a memory map
+            output_format: Target format
+            destination: Output file path, or a writable binary file-like object
+            input_format: Source format (default: markdown)
+            extra_args: Optional extra command line arguments for pandoc
+            chunk_size: Size of the chunks streamed through pandoc
+            
+        Returns:
+            Number of bytes written
+        """
+        chunks = self.iter_convert(source, output_format, input_format, extra_args, chunk_size)
+        if not isinstance(destination, str):
+            return _write_chunks(chunks, destination)
+        
+        # Unique per call, so threads streaming to one destination never share it
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(destination) or '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                written = _write_chunks(chunks, f)
+            # mkstemp creates the file private to the user; give it the usual mode
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+            os.replace(tmp_path, destination)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return written
     
     def get_supported_formats(self) -> dict:
         """Get list of supported input and output formats."""
@@ -71,9 +1354,25 @@ class DocumentConverter:
     
     def markdown_to_pdf(self, markdown_text: str, output_file: str) -> str:
         """Convert Markdown to PDF file."""
-        pypandoc.convert_text(markdown_text, 'pdf', format='markdown', 
-                             outputfile=output_file)
-        return output_file
+        if self.pdf_pipeline is None or self.sandbox:
+            # In sandbox mode this refuses PDF output, see _pandoc_options
+            return self.convert_text(markdown_text, 'pdf', 'markdown', output_file=output_file)
+        
+        with self._trace('markdown_to_pdf', input_format='markdown', output_format='pdf'):
+            if self.resources is not None:
+                markdown_text = self._resolve_resources(markdown_text)
+            # Images are written next to the LaTeX so the engine finds remote ones too
+            extra_args = ['--standalone', f'--extract-media={self.pdf_pipeline.media_dir}']
+            latex = self._convert_cached(markdown_text, 'latex', 'markdown', None, extra_args,
+                                         None)
+            if self.pdf_pipeline.missing_media(latex):
+                # Cached LaTeX whose extracted images have been removed since;
+                # running pandoc again extracts them again
+                latex = self._convert_text(markdown_text, 'latex', 'markdown', None, extra_args)
+            with stage('latex'):
+                result = self.pdf_pipeline.compile(latex, output_file)
+            _annotate_output(result, output_file)
+            return result
     
     def html_to_markdown(self, html_text: str) -> str:
         """Convert HTML to Markdown."""
@@ -0,0 +1,278 @@
+"""
+In-process Markdown to HTML rendering for a small, well-defined subset.
+
+Typical chat-style Markdown only uses a handful of constructs. For those,
+rendering in Python is much faster than starting (or even messaging) pandoc.
+render_html() produces the same HTML as pandoc's markdown reader and HTML
+writer, up to line wrapping inside paragraphs, and returns None as soon as
+a document uses anything outside the subset, so callers can fall back to
+pandoc.
+
+Supported:
+    - ATX headings (``# Title``) with pandoc's automatic identifiers
+    - paragraphs, with soft line breaks
+    - tight bullet lists (``-``, ``*``, ``+``) and ``1.`` ordered lists,
+      nested by indenting to the parent item's text
+    - block quotes
+    - fenced code blocks without an info string
+    - ``*emphasis*``, ``**strong**``, ``***both***`` and ``code`` spans
+
+Anything else (links, images, raw HTML, tables, smart quotes, math, escapes,
+loose lists, indented code, highlighted code, ...) makes render_html()
+return None.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+
+class UnsupportedMarkdown(Exception):
+    """Raised internally when a document leaves the supported subset."""
+
+
+HEADING_PATTERN = re.compile(r'^(#{1,6}) +(.*?)\s*$')
+FENCE_PATTERN = re.compile(r'^(`{3,}|~{3,})\s*$')
+BULLET_PATTERN = re.compile(r'^([-*+]) (?=\S)')
+ORDERED_PATTERN = re.compile(r'^(\d{1,9})\. (?=\S)')
+# Lines pandoc may read as the start of some other block
+BLOCK_START_PATTERN = re.compile(r'^(?:[#>:|%=+]|`{3}|~{3}|[-*+](?:\s|$)'
+                                 r'|\(?(?:[A-Za-z#@]|\d{1,9}|[ivxlcdmIVXLCDM]+)[.)](?:\s|$))')
+RULE_PATTERN = re.compile(r'^(?:[-*_=]\s*){3,}$')
+
+CODE_SPAN_PATTERN = re.compile(r'(?<!`)`([^`\n]+)`(?!`)')
+STRONG_EMPHASIS_PATTERN = re.compile(r'\*\*\*(?![\s*])([^*]+?)(?<![\s*])\*\*\*')
+STRONG_PATTERN = re.compile(r'\*\*(?![\s*])(.+?)(?<![\s*])\*\*', re.DOTALL)
+EMPHASIS_PATTERN = re.compile(r'\*(?![\s*])([^*]+?)(?<![\s*])\*')
+APOSTROPHE_PATTERN = re.compile(r"(?<=\w)'(?=\w)")
+PLACEHOLDER_PATTERN = re.compile('\0(\\d+)\0')
+
+# Characters that start pandoc constructs outside the subset
+UNSUPPORTED_CHARACTERS = set('\\[]$^~@{}|"\t')
+# Raw HTML, autolinks and entities
+UNSUPPORTED_INLINE_PATTERN = re.compile(r'<[A-Za-z/!?]|&[#A-Za-z0-9]+;|--|\.\.\.'
+                                        r'|(?<!\w)_|_(?!\w)|!\[')
+
+
+def render_html(text: str) -> Optional[str]:
+    """
+    Render Markdown to HTML without pandoc.
+
+    Args:
+        text: Markdown text
+
+    Returns:
+        HTML matching pandoc's output, or None if the document uses anything
+        outside the supported subset
+    """
+    if not text.strip():
+        return None
+    try:
+        return _Renderer().render(text)
+    except UnsupportedMarkdown:
+        return None
+
+
+def escape_html(text: str) -> str:
+    """Escape text the way pandoc's HTML writer does."""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _indentation(line: str) -> int:
+    return len(line) - len(line.lstrip(' '))
+
+
+class _Renderer:
+    """Renders one document; keeps the heading identifiers already used."""
+
+    def __init__(self):
+        self._identifiers = set()
+
+    def render(self, text: str) -> str:
+        lines = text.replace('\r\n', '\n').split('\n')
+        # A title block at the top would become metadata
+        if lines[0].startswith('%'):
+            raise UnsupportedMarkdown()
+        if any(line.endswith('  ') for line in lines):
+            raise UnsupportedMarkdown()  # Hard line breaks
+        return '\n'.join(self._blocks(lines)) + '\n'
+
+    def _blocks(self, lines: List[str]) -> List[str]:
+        """Render a sequence of lines to a list of HTML blocks."""
+        blocks = []
+        i = 0
+        while i < len(lines):
+            line = lines[i].rstrip()
+            if not line:
+                i += 1
+                continue
+            if line[0] == ' ':
+                raise UnsupportedMarkdown()  # Indented code or lazy continuation
+
+            heading = HEADING_PATTERN.match(line)
+            if FENCE_PATTERN.match(line):
+                html, i = self._code_block(lines, i)
+            elif heading:
+                html = self._heading(len(heading.group(1)), heading.group(2))
+                i += 1
+            elif line.startswith('>'):
+                html, i = self._block_quote(lines, i)
+            elif BULLET_PATTERN.match(line) or ORDERED_PATTERN.match(line):
+                html, i = self._list(lines, i, 0)
+                self._check_after_list(lines, i)
+            else:
+                html, i = self._paragraph(lines, i)
+            blocks.append(html)
+        return blocks
+
+    def _code_block(self, lines: List[str], i: int) -> Tuple[str, int]:
+        fence = FENCE_PATTERN.match(lines[i].rstrip()).group(1)
+        for end in range(i + 1, len(lines)):
+            closing = lines[end].strip()
+            if closing and set(closing) == {fence[0]} and len(closing) >= len(fence) \
+                    and lines[end][0] == fence[0]:
+                code = '\n'.join(lines[i + 1:end])
+                return f'<pre><code>{escape_html(code)}</code></pre>', end + 1
+        raise UnsupportedMarkdown()  # Unclosed fence
+
+    def _heading(self, level: int, content: str) -> str:
+        if not content or content.endswith('#'):
+            raise UnsupportedMarkdown()
+        html = self._inline(content)
+        return f'<h{level} id="{self._identifier(content)}">{html}</h{level}>'
+
+    def _identifier(self, content: str) -> str:
+        """Pandoc's auto_identifiers algorithm for plain headings."""
+        plain = CODE_SPAN_PATTERN.sub(lambda match: match.group(1), content)
+        plain = APOSTROPHE_PATTERN.sub('\u2019', plain.replace('*', ''))
+        kept = ''.join(c for c in plain if c.isalnum() or c in '_-.' or c.isspace())
+        identifier = _drop_to_first_letter('-'.join(kept.lower().split())) or 'section'
+        unique = identifier
+        number = 0
+        while unique in self._identifiers:
+            number += 1
+            unique = f'{identifier}-{number}'
+        self._identifiers.add(unique)
+        return unique
+
+    def _block_quote(self, lines: List[str], i: int) -> Tuple[str, int]:
+        inner = []
+        while i < len(lines) and lines[i].startswith('>'):
+            line = lines[i][1:]
+            inner.append(line[1:] if line.startswith(' ') else line)
+            i += 1
+        if i < len(lines) and lines[i].strip():
+            raise UnsupportedMarkdown()  # Lazy continuation line
+        return '<blockquote>\n' + '\n'.join(self._blocks(inner)) + '\n</blockquote>', i
+
+    def _list(self, lines: List[str], i: int, indent: int) -> Tuple[str, int]:
+        """Render a tight list whose markers start at the given indentation."""
+        first = lines[i][indent:]
+        ordered = ORDERED_PATTERN.match(first)
+        kind = 'ol' if ordered else BULLET_PATTERN.match(first).group(1)
+        items = []
+
+        while i < len(lines):
+            line = lines[i].rstrip()
+            if not line or _indentation(line) < indent:
+                break
+            if _indentation(line) != indent:
+                raise UnsupportedMarkdown()
+            marker = (ORDERED_PATTERN if kind == 'ol' else BULLET_PATTERN).match(line[indent:])
+            if not marker or (kind != 'ol' and marker.group(1) != kind):
+                raise UnsupportedMarkdown()  # Lazy text, or a different kind of list
+            content_column = indent + marker.end()
+            text = [line[content_column:]]
+            if BLOCK_START_PATTERN.match(text[0]) or RULE_PATTERN.match(text[0]):
+                raise UnsupportedMarkdown()
+            sublists = []
+            i += 1
+
+            while i < len(lines):
+                line = lines[i].rstrip()
+                if not line or _indentation(line) < content_column:
+                    break
+                if _indentation(line) != content_column:
+                    raise UnsupportedMarkdown()
+                rest = line[content_column:]
+                if BULLET_PATTERN.match(rest) or ORDERED_PATTERN.match(rest):
+                    html, i = self._list(lines, i, content_column)
+                    sublists.append(html)
+                elif sublists or BLOCK_START_PATTERN.match(rest) or RULE_PATTERN.match(rest):
+                    raise UnsupportedMarkdown()
+                else:
+                    text.append(rest)
+                    i += 1
+
+            html = self._inline('\n'.join(text))
+            if sublists:
+                html += '\n' + '\n'.join(sublists)
+            items.append(f'<li>{html}</li>')
+
+        if kind == 'ol':
+            start = int(ORDERED_PATTERN.match(first).group(1))
+            opening = '<ol type="1">' if start == 1 else f'<ol start="{start}" type="1">'
+        else:
+            opening = '<ul>'
+        closing = '</ol>' if kind == 'ol' else '</ul>'
+        return opening + '\n' + '\n'.join(items) + '\n' + closing, i
+
+    def _check_after_list(self, lines: List[str], i: int):
+        """Reject what would make a top-level list loose or continue it lazily."""
+        if i < len(lines) and lines[i].strip():
+            raise UnsupportedMarkdown()  # Lazy continuation text
+        while i < len(lines) and not lines[i].strip():
+            i += 1
+        if i < len(lines):
+            following = lines[i].rstrip()
+            if following[0] == ' ' or BULLET_PATTERN.match(following) \
+                    or ORDERED_PATTERN.match(following):
+                raise UnsupportedMarkdown()
+
+    def _paragraph(self, lines: List[str], i: int) -> Tuple[str, int]:
+        text = []
+        while i < len(lines) and lines[i].strip():
+            line = lines[i]
+            if line[0] == ' ':
+                raise UnsupportedMarkdown()  # Indented continuation
+            line = line.rstrip()
+            if BLOCK_START_PATTERN.match(line) or RULE_PATTERN.match(line):
+                raise UnsupportedMarkdown()
+            text.append(line)
+            i += 1
+        return f'<p>{self._inline(chr(10).join(text))}</p>', i
+
+    def _inline(self, text: str) -> str:
+        """Render inline Markdown: code spans, emphasis and plain text."""
+        code_spans = []
+
+        def hide_code(match):
+            code = match.group(1)
+            if code != code.strip():
+                raise UnsupportedMarkdown()
+            code_spans.append(f'<code>{escape_html(code)}</code>')
+            return f'\0{len(code_spans) - 1}\0'
+
+        if '\0' in text:
+            raise UnsupportedMarkdown()
+        text = CODE_SPAN_PATTERN.sub(hide_code, text)
+        if '`' in text or UNSUPPORTED_CHARACTERS.intersection(text.replace('\0', '')) \
+                or UNSUPPORTED_INLINE_PATTERN.search(text):
+            raise UnsupportedMarkdown()
+
+        text = APOSTROPHE_PATTERN.sub('\u2019', escape_html(text))
+        if "'" in text:
+            raise UnsupportedMarkdown()  # Quotes pandoc would make curly
+        text = STRONG_EMPHASIS_PATTERN.sub(r'<strong><em>\1</em></strong>', text)
+        text = STRONG_PATTERN.sub(r'<strong>\1</strong>', text)
+        text = EMPHASIS_PATTERN.sub(r'<em>\1</em>', text)
+        if '*' in text:
+            raise UnsupportedMarkdown()
+        return PLACEHOLDER_PATTERN.sub(lambda match: code_spans[int(match.group(1))], text)
+
+
+def _drop_to_first_letter(identifier: str) -> str:
+    """Identifiers may not begin with a number or punctuation mark."""
+    for index, char in enumerate(identifier):
+        if char.isalpha():
+            return identifier[index:]
+    return ''
@@ -0,0 +1,118 @@
+"""
+Registry of the formats supported by the pandoc binary in use.
+
+Format discovery spawns pandoc twice, so the result is computed once per
+pandoc binary, memoized in-process and persisted to an on-disk cache keyed
+by the binary's path, size and modification time.
+"""
+
+import json
+import os
+import subprocess
+import threading
+from typing import Optional
+
+from pandoc_setup import CREATION_FLAGS, binary_key, get_cache_dir, lazy_import
+
+
+pypandoc = lazy_import('pypandoc')
+
+
+CACHE_FILENAME = 'formats.json'
+
+
+class FormatRegistry:
+    """Memoized, persisted pandoc format discovery."""
+    
+    def __init__(self, cache_file: Optional[str] = None):
+        """
+        Initialize the registry. Nothing is discovered until formats are requested.
+        
+        Args:
+            cache_file: JSON file used to persist discovered formats
+                (default: formats.json in the cache directory)
+        """
+        self._cache_file = cache_file
+        self._formats = {}
+        self._lock = threading.Lock()
+    
+    @property
+    def cache_file(self) -> str:
+        """Path of the on-disk format cache."""
+        if self._cache_file is None:
+            self._cache_file = os.path.join(get_cache_dir(), CACHE_FILENAME)
+        return self._cache_file
+    
+    def get_formats(self, pandoc_path: Optional[str] = None) -> dict:
+        """
+        Get the input and output formats supported by a pandoc binary.
+        
+        Args:
+            pandoc_path: Pandoc executable (default: the one pypandoc uses)
+            
+        Returns:
+            Dictionary with 'input' and 'output' format lists
+        """
+        pandoc_path = pandoc_path or pypandoc.get_pandoc_path()
+        key = binary_key(pandoc_path)
+        
+        with self._lock:
+            formats = self._formats.get(key)
+            if formats is None:
+                formats = self._load(key)
+                if formats is None:
+                    formats = discover_formats(pandoc_path)
+                    self._store(key, formats)
+                self._formats[key] = formats
+        return formats
+    
+    def clear(self):
+        """Forget all memoized and persisted formats."""
+        with self._lock:
+            self._formats.clear()
+            if os.path.exists(self.cache_file):
+                os.remove(self.cache_file)
+    
+    def _read_cache(self) -> dict:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _load(self, key: str) -> Optional[dict]:
+        """Read formats for a binary from the on-disk cache."""
+        return self._read_cache().get(key)
+    
+    def _store(self, key: str, formats: dict):
+        """Persist formats for a binary to the on-disk cache."""
+        cache = self._read_cache()
+        cache[key] = formats
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            # The cache is an optimization; failing to write it is not fatal
+            print(f"Could not write format cache: {e}")
+
+
+def discover_formats(pandoc_path: str) -> dict:
+    """Ask a pandoc binary for its supported input and output formats."""
+    formats = {}
+    for kind in ('input', 'output'):
+        result = subprocess.run([os.path.expanduser(pandoc_path), f'--list-{kind}-formats'],
+                                capture_output=True, text=True, check=True,
+                                creationflags=CREATION_FLAGS)
+        formats[kind] = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+    return formats
+
+
+# Shared registry used by all converters in this process
+registry = FormatRegistry()
+
+
+def get_supported_formats(pandoc_path: Optional[str] = None) -> dict:
+    """Get supported formats from the shared registry."""
+    return registry.get_formats(pandoc_path)
@@ -7,15 +7,57 @@ Provides a simple interface for converting text to PDF and DOCX formats.
 import tkinter as tk
 from tkinter import ttk, scrolledtext, filedialog, messagebox
 import os
-import sys
-import io
+import queue
 import subprocess
 import platform
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from converter import DocumentConverter
+from converter import ConversionCache, ConversionCancelled, DocumentConverter, warnings_only
+from resources import ResourceCache
+from preview import HtmlTextSegments, IncrementalPreview
 from pandoc_setup import setup_pandoc
 
 
+# Milliseconds between checks for finished background exports
+POLL_INTERVAL_MS = 100
+
+# Milliseconds without edits before the preview is re-rendered
+PREVIEW_DELAY_MS = 400
+
+# Texts at least this long are pasted in steps and exported through a temporary
+# file, so Tk never has to swallow or hand over megabytes in a single call
+LARGE_DOCUMENT_CHARS = 256 * 1024
+
+# Characters inserted or written per step in large-document mode
+PASTE_CHUNK_CHARS = 64 * 1024
+
+# Fonts for the preview pane, keyed by the tags HtmlTextSegments produces
+PREVIEW_STYLES = {
+    'h1': {'font': ("Arial", 16, "bold"), 'spacing1': 6},
+    'h2': {'font': ("Arial", 14, "bold"), 'spacing1': 4},
+    'h3': {'font': ("Arial", 12, "bold"), 'spacing1': 2},
+    'h4': {'font': ("Arial", 11, "bold")},
+    'bold': {'font': ("Arial", 10, "bold")},
+    'italic': {'font': ("Arial", 10, "italic")},
+    'code': {'font': ("Consolas", 10), 'background': "#f2f2f2"},
+    'quote': {'lmargin1': 20, 'lmargin2': 20, 'foreground': "#555555"},
+    'link': {'foreground': "#1a5fb4", 'underline': True},
+}
+
+
+class ExportJob:
+    """A queued or running background export."""
+    
+    def __init__(self, content, filename, output_format='docx'):
+        self.content = content
+        self.filename = filename
+        self.output_format = output_format
+        self.cancel_event = threading.Event()
+        self.future = None
+
+
 class OmvandlareGUI:
     """Main GUI application for Erics-Omvandlare."""
     
@@ -23,17 +65,44 @@ class OmvandlareGUI:
         """Initialize the GUI application."""
         self.root = tk.Tk()
         self.root.title("Erics omvandlare - Dokumentkonverterare")
-        self.root.geometry("800x600")
+        self.root.geometry("1100x650")
         self.root.minsize(600, 400)
         
-        # Initialize converter
-        self.converter = DocumentConverter()
+        # Initialize converter; the cache makes repeated exports of the same text instant
+        self.converter = DocumentConverter(cache=ConversionCache(), resources=ResourceCache())
+        
+        # Exports run one at a time on a background thread; finished jobs are
+        # reported back to the Tk thread through a queue
+        self.export_executor = ThreadPoolExecutor(max_workers=1)
+        self.completion_queue = queue.Queue()
+        self.pending_exports = []
+        
+        # Live preview, rendered on its own thread with its own uncached converter
+        self.preview = IncrementalPreview(DocumentConverter(native_markdown=True))
+        self.preview_executor = ThreadPoolExecutor(max_workers=1)
+        self.preview_future = None
+        self.preview_after_id = None
+        self.preview_dirty = False
+        
+        # Copy of the text area's contents, dropped whenever the text is edited
+        self.content_cache = None
+        
+        # Large pastes in progress: (text, characters inserted, status when done)
+        self.pending_paste = None
+        self.paste_after_id = None
         
         # Setup GUI components
         self.setup_gui()
         
         # Center the window
         self.center_window()
+        
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after(POLL_INTERVAL_MS, self.poll_completed_exports)
+        
+        # Finding pandoc runs it several times; do that once the window is up
+        self.warm_up_future = None
+        self.root.after_idle(self.start_warm_up)
     
     def setup_gui(self):
         """Setup all GUI components."""
@@ -58,21 +127,39 @@ class OmvandlareGUI:
                                font=("Arial", 10))
         input_label.grid(row=1, column=0, columnspan=2, pady=(0, 5), sticky=tk.W)
         
-        # Text area
-        text_frame = ttk.Frame(main_frame)
-        text_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), 
-                       pady=(0, 15))
+        # Text area and preview side by side
+        panes = ttk.PanedWindow(main_frame, orient=tk.HORIZONTAL)
+        panes.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), 
+                   pady=(0, 15))
+        
+        text_frame = ttk.Frame(panes)
         text_frame.columnconfigure(0, weight=1)
         text_frame.rowconfigure(0, weight=1)
+        panes.add(text_frame, weight=1)
         
         # Text input with scrollbar
         self.text_area = scrolledtext.ScrolledText(text_frame, wrap=tk.WORD, 
-                                                  width=70, height=20,
+                                                  width=60, height=20,
                                                   font=("Consolas", 11))
         self.text_area.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.text_area.bind("<<Modified>>", self.on_text_modified)
         
         # Text area starts empty - no placeholder text
         
+        # Read-only preview of the rendered document
+        preview_frame = ttk.Frame(panes)
+        preview_frame.columnconfigure(0, weight=1)
+        preview_frame.rowconfigure(0, weight=1)
+        panes.add(preview_frame, weight=1)
+        
+        self.preview_area = scrolledtext.ScrolledText(preview_frame, wrap=tk.WORD,
+                                                     width=50, height=20,
+                                                     font=("Arial", 10),
+                                                     state=tk.DISABLED)
+        self.preview_area.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        for tag, options in PREVIEW_STYLES.items():
+            self.preview_area.tag_configure(tag, **options)
+        
         # Button frame
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=3, column=0, columnspan=2, pady=(0, 10))
@@ -90,7 +177,19 @@ class OmvandlareGUI:
         # Clear button
         self.clear_button = ttk.Button(button_frame, text="🗑️ Rensa text", 
                                      command=self.clear_text, width=15)
-        self.clear_button.grid(row=0, column=2, padx=(10, 0))
+        self.clear_button.grid(row=0, column=2, padx=(10, 10))
+        
+        # Cancel button for running and queued exports
+        self.cancel_button = ttk.Button(button_frame, text="⏹ Avbryt export", 
+                                      command=self.cancel_exports, width=15,
+                                      state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=3, padx=(10, 0))
+        
+        # Busy indicator shown while exports are running
+        self.progress_bar = ttk.Progressbar(main_frame, mode='indeterminate')
+        self.progress_bar.grid(row=6, column=0, columnspan=2, sticky=(tk.W, tk.E),
+                               pady=(5, 0))
+        self.progress_bar.grid_remove()
         
         # Status bar
         self.status_var = tk.StringVar()
@@ -117,63 +216,50 @@ class OmvandlareGUI:
         self.root.geometry(f"{width}x{height}+{x}+{y}")
     
     def get_text_content(self):
-        """Get the current text content from the text area."""
-        return self.text_area.get("1.0", tk.END).strip()
+        """Get the current text content, copying it out of Tk only after edits."""
+        if self.content_cache is None or self.text_area.edit_modified():
+            self.content_cache = self.text_area.get("1.0", tk.END).strip()
+        return self.content_cache
+    
+    def has_text(self):
+        """Check for non-whitespace text without copying the text area's contents."""
+        return bool(self.text_area.search(r"\S", "1.0", tk.END, regexp=True))
     
     def generate_filename(self, extension):
         """Generate a default filename with timestamp."""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         return f"converted_document_{timestamp}.{extension}"
     
-    def capture_stderr_warnings(self, func, *args, **kwargs):
-        """Capture stderr output from a function call to catch Pandoc warnings."""
-        # Capture stderr
-        old_stderr = sys.stderr
-        sys.stderr = captured_stderr = io.StringIO()
+    def show_warnings_if_any(self, messages):
+        """Display warnings from a conversion's pandoc log to the user."""
+        # Skip informational messages; only warnings are worth a dialog
+        warnings = warnings_only(messages)
         
-        try:
-            # Call the function
-            result = func(*args, **kwargs)
-            
-            # Get any warnings from stderr
-            warnings = captured_stderr.getvalue()
+        if warnings:
+            # Format warnings for display, one line each
+            formatted_warnings = "\n".join(
+                "[WARNING] " + message.get('pretty', message.get('type', '')).splitlines()[0]
+                for message in warnings)
             
-            return result, warnings
-        
-        finally:
-            # Restore stderr
-            sys.stderr = old_stderr
-    
-    def show_warnings_if_any(self, warnings_text):
-        """Display warnings to the user if any were captured."""
-        if warnings_text.strip():
-            # Extract meaningful warnings (skip empty lines and minor notices)
-            warning_lines = [line.strip() for line in warnings_text.split('\n') 
-                           if line.strip() and '[WARNING]' in line]
+            # Translate common warnings to Swedish
+            if any(message.get('type') == 'CouldNotConvertTeXMath' for message in warnings):
+                swedish_msg = (
+                    "Varning: Hittade problem med matematiska uttryck i texten.\n\n"
+                    "Detta kan bero på:\n"
+                    "• Ofullständiga LaTeX-matematikuttryck\n"
+                    "• Saknade klammer eller parenteser\n"
+                    "• Felaktig matematisk syntax\n\n"
+                    f"Teknisk information:\n{formatted_warnings}\n\n"
+                    "Dokumentet skapades ändå, men kontrollera det matematiska innehållet."
+                )
+            else:
+                swedish_msg = (
+                    "Varning: Några problem upptäcktes under konverteringen.\n\n"
+                    f"{formatted_warnings}\n\n"
+                    "Dokumentet skapades ändå, men kontrollera resultatet."
+                )
             
-            if warning_lines:
-                # Format warnings for display
-                formatted_warnings = "\n".join(warning_lines)
-                
-                # Translate common warnings to Swedish
-                if "TeX math" in formatted_warnings:
-                    swedish_msg = (
-                        "Varning: Hittade problem med matematiska uttryck i texten.\n\n"
-                        "Detta kan bero på:\n"
-                        "• Ofullständiga LaTeX-matematikuttryck\n"
-                        "• Saknade klammer eller parenteser\n"
-                        "• Felaktig matematisk syntax\n\n"
-                        f"Teknisk information:\n{formatted_warnings}\n\n"
-                        "Dokumentet skapades ändå, men kontrollera det matematiska innehållet."
-                    )
-                else:
-                    swedish_msg = (
-                        "Varning: Några problem upptäcktes under konverteringen.\n\n"
-                        f"{formatted_warnings}\n\n"
-                        "Dokumentet skapades ändå, men kontrollera resultatet."
-                    )
-                
-                messagebox.showwarning("Konverteringsvarningar", swedish_msg)
+            messagebox.showwarning("Konverteringsvarningar", swedish_msg)
     
     def open_file(self, file_path):
         """Open a file with the default system application."""
@@ -194,11 +280,13 @@ class OmvandlareGUI:
             )
     
     def export_to_docx(self):
-        """Export the text content to DOCX format."""
+        """Queue an export of the text content to DOCX format."""
         try:
-            # Get text content
-            content = self.get_text_content()
-            if not content:
+            if self.pending_paste is not None:
+                messagebox.showinfo("Inklistring pågår", "Vänta tills texten har klistrats in!")
+                return
+            
+            if not self.has_text():
                 messagebox.showwarning("Inget innehåll", "Vänligen ange någon text att konvertera!")
                 return
             
@@ -213,32 +301,180 @@ class OmvandlareGUI:
             if not filename:
                 return  # User cancelled
             
-            # Update status
-            self.status_var.set("Exporterar till Word...")
-            self.root.update()
-            
-            # Convert and save with warning capture
-            result, warnings = self.capture_stderr_warnings(
-                self.converter.convert_text, 
-                content, 'docx', 'markdown', output_file=filename
-            )
-            
-            # Success message
-            self.status_var.set(f"Framgångsrikt exporterat till: {os.path.basename(filename)}")
-            
-            # Show success dialog first
-            messagebox.showinfo("Klart!", f"Word-dokument exporterat framgångsrikt!\n\nSparat som: {filename}")
-            
-            # Automatically open the created document
-            self.open_file(filename)
-            
-            # Then show any warnings that were captured
-            self.show_warnings_if_any(warnings)
+            self.submit_export(ExportJob(self.get_text_content(), filename))
             
         except Exception as e:
             self.status_var.set("Export misslyckades!")
             messagebox.showerror("Exportfel", f"Misslyckades med att exportera till Word:\n\n{str(e)}\n\nSe till att du har de nödvändiga beroendena installerade.")
     
+    def submit_export(self, job):
+        """Start an export on the background worker without blocking the window."""
+        job.future = self.export_executor.submit(self.run_export, job)
+        self.pending_exports.append(job)
+        self.update_export_status()
+    
+    def run_export(self, job):
+        """Convert and save an export. Runs on the background worker thread."""
+        try:
+            if job.cancel_event.is_set():
+                raise ConversionCancelled("Conversion cancelled")
+            if len(job.content) >= LARGE_DOCUMENT_CHARS:
+                # Pandoc reads large texts from a file instead of a pipe; its
+                # log is not collected on this path
+                self.export_through_file(job)
+                messages = []
+            else:
+                result, messages = self.converter.convert_text_with_messages(
+                    job.content, job.output_format, 'markdown', output_file=job.filename,
+                    cancel_event=job.cancel_event
+                )
+            self.completion_queue.put((job, None, messages))
+        except Exception as e:
+            self.completion_queue.put((job, e, []))
+    
+    def export_through_file(self, job):
+        """Write the text to a temporary Markdown file and convert that file."""
+        fd, path = tempfile.mkstemp(prefix="omvandlare_", suffix=".md")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                for start in range(0, len(job.content), PASTE_CHUNK_CHARS):
+                    f.write(job.content[start:start + PASTE_CHUNK_CHARS])
+            return self.converter.convert_file(path, job.output_format, output_file=job.filename,
+                                               cancel_event=job.cancel_event)
+        finally:
+            os.remove(path)
+    
+    def start_warm_up(self):
+        """Locate pandoc and load its formats on the export thread."""
+        self.warm_up_future = self.export_executor.submit(self.converter.warm_up)
+    
+    def finish_warm_up(self):
+        """Tell the user if pandoc could not be started."""
+        error = self.warm_up_future.exception()
+        self.warm_up_future = None
+        if error is not None:
+            print(f"Could not start pandoc: {error}")
+            self.status_var.set("Pandoc hittades inte - export och förhandsvisning fungerar inte!")
+    
+    def poll_completed_exports(self):
+        """Handle finished exports on the Tk thread, then check again later."""
+        if self.warm_up_future is not None and self.warm_up_future.done():
+            self.finish_warm_up()
+        try:
+            while True:
+                job, error, messages = self.completion_queue.get_nowait()
+                if job in self.pending_exports:
+                    self.pending_exports.remove(job)
+                self.update_export_status()
+                self.finish_export(job, error, messages)
+        except queue.Empty:
+            pass
+        self.root.after(POLL_INTERVAL_MS, self.poll_completed_exports)
+    
+    def finish_export(self, job, error, messages):
+        """Report the outcome of an export to the user."""
+        if isinstance(error, ConversionCancelled):
+            self.status_var.set(f"Export avbruten: {os.path.basename(job.filename)}")
+            return
+        if error is not None:
+            self.status_var.set("Export misslyckades!")
+            messagebox.showerror("Exportfel", f"Misslyckades med att exportera till Word:\n\n{str(error)}\n\nSe till att du har de nödvändiga beroendena installerade.")
+            return
+        
+        # Success message
+        self.status_var.set(f"Framgångsrikt exporterat till: {os.path.basename(job.filename)}")
+        
+        # Show success dialog first
+        messagebox.showinfo("Klart!", f"Word-dokument exporterat framgångsrikt!\n\nSparat som: {job.filename}")
+        
+        # Automatically open the created document
+        self.open_file(job.filename)
+        
+        # Then show any warnings pandoc logged
+        self.show_warnings_if_any(messages)
+    
+    def update_export_status(self):
+        """Show or hide the busy indicator and cancel button."""
+        count = len(self.pending_exports)
+        if count:
+            self.progress_bar.grid()
+            self.progress_bar.start(10)
+            self.cancel_button.config(state=tk.NORMAL)
+            queued = f" ({count - 1} i kö)" if count > 1 else ""
+            self.status_var.set(f"Exporterar till Word...{queued}")
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.grid_remove()
+            self.cancel_button.config(state=tk.DISABLED)
+    
+    def on_text_modified(self, event=None):
+        """Schedule a preview update once typing pauses."""
+        if not self.text_area.edit_modified():
+            return  # Event caused by resetting the modified flag below
+        self.text_area.edit_modified(False)
+        self.content_cache = None
+        if self.preview_after_id is not None:
+            self.root.after_cancel(self.preview_after_id)
+        self.preview_after_id = self.root.after(PREVIEW_DELAY_MS, self.start_preview_render)
+    
+    def start_preview_render(self):
+        """Render the preview in the background, unless a render is already running."""
+        self.preview_after_id = None
+        if self.preview_future is not None:
+            # Render again as soon as the current one finishes
+            self.preview_dirty = True
+            return
+        
+        self.preview_dirty = False
+        self.preview_future = self.preview_executor.submit(self.preview.render,
+                                                           self.get_text_content())
+        self.root.after(POLL_INTERVAL_MS, self.poll_preview)
+    
+    def poll_preview(self):
+        """Show a finished preview render on the Tk thread."""
+        if not self.preview_future.done():
+            self.root.after(POLL_INTERVAL_MS, self.poll_preview)
+            return
+        
+        future, self.preview_future = self.preview_future, None
+        try:
+            self.show_preview(future.result())
+        except Exception as e:
+            self.show_preview_text(f"Förhandsvisningen misslyckades:\n\n{str(e)}")
+        
+        if self.preview_dirty:
+            self.start_preview_render()
+    
+    def show_preview(self, html):
+        """Display rendered HTML in the preview pane."""
+        self.preview_area.config(state=tk.NORMAL)
+        self.preview_area.delete("1.0", tk.END)
+        for text, tags in HtmlTextSegments.parse(html):
+            self.preview_area.insert(tk.END, text, tags)
+        self.preview_area.config(state=tk.DISABLED)
+    
+    def show_preview_text(self, text):
+        """Display plain text, such as an error message, in the preview pane."""
+        self.preview_area.config(state=tk.NORMAL)
+        self.preview_area.delete("1.0", tk.END)
+        self.preview_area.insert(tk.END, text)
+        self.preview_area.config(state=tk.DISABLED)
+    
+    def cancel_exports(self):
+        """Cancel the running export and everything queued behind it."""
+        for job in self.pending_exports:
+            job.cancel_event.set()
+        self.status_var.set("Avbryter export...")
+    
+    def on_close(self):
+        """Cancel outstanding exports and close the window."""
+        self.cancel_paste()
+        self.cancel_exports()
+        self.export_executor.shutdown(wait=False, cancel_futures=True)
+        self.preview_executor.shutdown(wait=False, cancel_futures=True)
+        self.converter.close()
+        self.root.destroy()
+    
     def paste_from_clipboard(self):
         """Paste text from clipboard into the text area."""
         try:
@@ -249,9 +485,12 @@ class OmvandlareGUI:
                 messagebox.showinfo("Tomt innehåll", "Inget text hittades i urklipp!")
                 return
             
+            if self.pending_paste is not None:
+                messagebox.showinfo("Inklistring pågår", "Vänta tills texten har klistrats in!")
+                return
+            
             # Check if text area already has content
-            current_content = self.get_text_content()
-            if current_content:
+            if self.has_text():
                 # Ask user what to do
                 result = messagebox.askyesnocancel(
                     "Text finns redan", 
@@ -265,17 +504,16 @@ class OmvandlareGUI:
                     return
                 elif result is True:  # User clicked Yes (append)
                     # Add clipboard content at the end
-                    self.text_area.insert(tk.END, "\n\n" + clipboard_content)
-                    self.status_var.set("Text från urklipp tillagd i slutet!")
+                    self.insert_text(tk.END, "\n\n" + clipboard_content,
+                                     "Text från urklipp tillagd i slutet!")
                 else:  # User clicked No (replace)
                     # Replace all content
                     self.text_area.delete("1.0", tk.END)
-                    self.text_area.insert("1.0", clipboard_content)
-                    self.status_var.set("Text från urklipp inklistrad - ersatte tidigare innehåll!")
+                    self.insert_text("1.0", clipboard_content,
+                                     "Text från urklipp inklistrad - ersatte tidigare innehåll!")
             else:
                 # Text area is empty, just paste
-                self.text_area.insert("1.0", clipboard_content)
-                self.status_var.set("Text från urklipp inklistrad!")
+                self.insert_text("1.0", clipboard_content, "Text från urklipp inklistrad!")
             
             # Scroll to the beginning to show the content
             self.text_area.see("1.0")
@@ -292,9 +530,58 @@ class OmvandlareGUI:
                 f"Ett oväntat fel uppstod när text skulle klistras in:\n\n{str(e)}"
             )
     
+    def insert_text(self, index, text, status):
+        """Insert text at an index; large texts are inserted a chunk at a time."""
+        if len(text) < LARGE_DOCUMENT_CHARS:
+            self.text_area.insert(index, text)
+            self.status_var.set(status)
+            return
+        
+        # The mark moves past each inserted chunk, so the next one follows it
+        self.text_area.mark_set("paste_end", index)
+        self.text_area.mark_gravity("paste_end", tk.RIGHT)
+        self.pending_paste = (text, 0, status)
+        self.paste_button.config(state=tk.DISABLED)
+        self.docx_button.config(state=tk.DISABLED)
+        self.insert_next_chunk()
+    
+    def insert_next_chunk(self):
+        """Insert the next chunk of a large paste and schedule the one after it."""
+        self.paste_after_id = None
+        text, inserted, status = self.pending_paste
+        chunk = text[inserted:inserted + PASTE_CHUNK_CHARS]
+        self.text_area.insert("paste_end", chunk)
+        inserted += len(chunk)
+        
+        if inserted < len(text):
+            self.pending_paste = (text, inserted, status)
+            self.status_var.set(f"Klistrar in text... {inserted * 100 // len(text)} %")
+            # Let Tk redraw and handle input between chunks
+            self.paste_after_id = self.root.after(1, self.insert_next_chunk)
+        else:
+            self.finish_paste()
+            self.status_var.set(status)
+    
+    def finish_paste(self):
+        """Forget a large paste and enable the buttons again."""
+        self.pending_paste = None
+        self.text_area.mark_unset("paste_end")
+        self.paste_button.config(state=tk.NORMAL)
+        self.docx_button.config(state=tk.NORMAL)
+    
+    def cancel_paste(self):
+        """Stop a large paste, keeping the chunks inserted so far."""
+        if self.pending_paste is None:
+            return
+        if self.paste_after_id is not None:
+            self.root.after_cancel(self.paste_after_id)
+            self.paste_after_id = None
+        self.finish_paste()
+    
     def clear_text(self):
         """Clear all text from the text area."""
         if messagebox.askyesno("Rensa text", "Är du säker på att du vill rensa all text?"):
+            self.cancel_paste()
             self.text_area.delete("1.0", tk.END)
             self.status_var.set("Text rensad - Redo för nytt innehåll!")
     
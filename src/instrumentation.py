@@ -0,0 +1,254 @@
+"""
+Opt-in timing instrumentation for conversions.
+
+An Instrumentation object collects one record per conversion with per-stage
+timings, input/output sizes and pandoc's exit status, and hands it to one or
+more sinks (logging, a JSON-lines file or a local Prometheus endpoint).
+Code being measured marks its stages with the module-level stage() helper,
+which does nothing unless a trace is active in the current context.
+"""
+
+import contextvars
+import json
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Optional
+
+
+_current_trace = contextvars.ContextVar('omvandlare_trace', default=None)
+
+
+class ConversionTrace:
+    """Measurements collected for a single operation."""
+
+    def __init__(self, operation: str, **fields):
+        self.record = {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'operation': operation,
+            'stages': {},
+            'exit_status': None,
+            'error': None,
+        }
+        self.record.update(fields)
+
+    def add_stage(self, name: str, seconds: float):
+        """Add time to a stage; repeated stages accumulate."""
+        stages = self.record['stages']
+        stages[name] = stages.get(name, 0.0) + seconds
+
+    def update(self, **fields):
+        """Set additional fields on the record."""
+        self.record.update(fields)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as a named stage of the active trace, if any."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name: str, seconds: float):
+    """Add a stage measured elsewhere (e.g. inside pandoc) to the active trace."""
+    trace = _current_trace.get()
+    if trace is not None and seconds is not None:
+        trace.add_stage(name, seconds)
+
+
+def annotate(**fields):
+    """Set fields on the active trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.update(**fields)
+
+
+def is_tracing() -> bool:
+    """Check whether a trace is active, e.g. before computing costly fields."""
+    return _current_trace.get() is not None
+
+
+def exit_status_from_error(error: Exception) -> int:
+    """Extract pandoc's exit code from a conversion error, defaulting to 1."""
+    match = re.search(r'exitcode "?(\d+)"?', str(error))
+    return int(match.group(1)) if match else 1
+
+
+class Instrumentation:
+    """Collects conversion traces and sends them to sinks."""
+
+    def __init__(self, *sinks):
+        """
+        Initialize instrumentation.
+
+        Args:
+            sinks: Objects with an emit(record) method
+        """
+        self.sinks = list(sinks)
+
+    @contextmanager
+    def trace(self, operation: str, **fields):
+        """
+        Trace an operation. Stages timed with stage() inside the block are
+        added to the record, which is emitted when the block exits.
+        """
+        trace = ConversionTrace(operation, **fields)
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        except Exception as e:
+            trace.update(error=str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__)
+            if trace.record['exit_status'] is None:
+                trace.update(exit_status=exit_status_from_error(e))
+            raise
+        else:
+            if trace.record['exit_status'] is None:
+                trace.update(exit_status=0)
+        finally:
+            _current_trace.reset(token)
+            trace.update(total_seconds=time.perf_counter() - start)
+            self.emit(trace.record)
+
+    def emit(self, record: dict):
+        """Send a record to every sink; a failing sink never breaks a conversion."""
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception as e:
+                logging.getLogger(__name__).warning("Instrumentation sink failed: %s", e)
+
+
+class LoggingSink:
+    """Writes one log line per record."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger('omvandlare.metrics')
+        self.level = level
+
+    def emit(self, record: dict):
+        stages = ", ".join(f"{name}={seconds * 1000:.1f}ms"
+                           for name, seconds in record['stages'].items())
+        self.logger.log(self.level, "%s %s->%s %.1fms exit=%s [%s]",
+                        record['operation'], record.get('input_format', '-'),
+                        record.get('output_format', '-'), record['total_seconds'] * 1000,
+                        record['exit_status'], stages)
+
+
+class JsonLinesSink:
+    """Appends each record as a JSON line to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class PrometheusSink:
+    """
+    Aggregates records into Prometheus metrics, optionally served over HTTP.
+
+    Metrics are exposed in the Prometheus text format at /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conversions = {}
+        self._seconds = {}
+        self._stages = {}
+        self._bytes = {'input': 0, 'output': 0}
+        self._server = None
+
+    def emit(self, record: dict):
+        labels = (record['operation'], record.get('output_format') or '',
+                  'ok' if record['exit_status'] == 0 else 'error')
+        with self._lock:
+            self._conversions[labels] = self._conversions.get(labels, 0) + 1
+            total, count = self._seconds.get(record['operation'], (0.0, 0))
+            self._seconds[record['operation']] = (total + record['total_seconds'], count + 1)
+            for name, seconds in record['stages'].items():
+                total, count = self._stages.get(name, (0.0, 0))
+                self._stages[name] = (total + seconds, count + 1)
+            self._bytes['input'] += record.get('input_bytes') or 0
+            self._bytes['output'] += record.get('output_bytes') or 0
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = ["# HELP omvandlare_conversions_total Conversions by operation, format and status.",
+                 "# TYPE omvandlare_conversions_total counter"]
+        with self._lock:
+            for (operation, output_format, status), count in sorted(self._conversions.items()):
+                lines.append(f'omvandlare_conversions_total{{operation="{operation}",'
+                             f'output_format="{output_format}",status="{status}"}} {count}')
+            lines += ["# HELP omvandlare_conversion_seconds Total time per operation.",
+                      "# TYPE omvandlare_conversion_seconds summary"]
+            for operation, (total, count) in sorted(self._seconds.items()):
+                lines.append(f'omvandlare_conversion_seconds_sum{{operation="{operation}"}} {total:.6f}')
+                lines.append(f'omvandlare_conversion_seconds_count{{operation="{operation}"}} {count}')
+            lines += ["# HELP omvandlare_stage_seconds Time spent per conversion stage.",
+                      "# TYPE omvandlare_stage_seconds summary"]
+            for name, (total, count) in sorted(self._stages.items()):
+                lines.append(f'omvandlare_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+                lines.append(f'omvandlare_stage_seconds_count{{stage="{name}"}} {count}')
+            lines += ["# HELP omvandlare_bytes_total Bytes read and written by conversions.",
+                      "# TYPE omvandlare_bytes_total counter"]
+            for direction, total in sorted(self._bytes.items()):
+                lines.append(f'omvandlare_bytes_total{{direction="{direction}"}} {total}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int = 0, host: str = '127.0.0.1') -> int:
+        """
+        Serve /metrics on a local port from a background thread.
+
+        Args:
+            port: Port to listen on (default: any free port)
+            host: Interface to bind (default: localhost only)
+
+        Returns:
+            The port the endpoint listens on
+        """
+        # Imported here to keep startup of applications without metrics fast
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = sink.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep scrapes out of the console
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address[1]
+
+    def close(self):
+        """Stop the HTTP endpoint, if running."""
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -0,0 +1,479 @@
+"""
+Shared job queues for batch conversion across processes and machines.
+
+A queue holds one job per document. Any number of workers, on one machine
+or on several hosts that share the queue and the document tree, claim jobs,
+convert them with DocumentConverter and record the outcome. A claim is a
+lease: a worker that dies mid-job loses it when the lease runs out, and the
+job is handed to another worker. Failed jobs are retried up to a maximum
+number of attempts before they are recorded as failed with their last error.
+
+Two queues need no services:
+
+- SQLiteJobQueue keeps the jobs in one SQLite file. It is the simplest
+  choice for many processes on one machine.
+- DirectoryJobQueue keeps one JSON file per job and claims jobs with atomic
+  renames. Use it on network shares, where SQLite's file locking is
+  unreliable.
+
+open_queue picks one from the location, and other queues can implement
+JobQueue.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Iterable, List, Optional
+
+from batch import BatchResult, collect_inputs, output_path_for
+from converter import DocumentConverter
+from output_writer import OutputWriter
+
+
+# Attempts a job gets before it is recorded as failed
+MAX_ATTEMPTS = 3
+
+# Seconds a claimed job stays with its worker before another may take it
+LEASE_SECONDS = 600.0
+
+# Jobs a worker claims at once, which keeps the queue from becoming a bottleneck
+CLAIM_SIZE = 4
+
+# Queue file extensions that select the SQLite queue in open_queue
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+
+@dataclass
+class Job:
+    """One document to convert."""
+    input_file: str
+    output_file: str
+    output_format: str
+    id: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    worker: Optional[str] = None
+    seconds: float = 0.0
+    # Queue specific handle of the current claim
+    claim: Optional[str] = None
+
+
+class JobQueue(ABC):
+    """Interface of the shared job queues."""
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, lease: float = LEASE_SECONDS):
+        """
+        Args:
+            max_attempts: Attempts a job gets before it is recorded as failed
+            lease: Seconds a claimed job stays with its worker
+        """
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+    @abstractmethod
+    def submit(self, jobs: Iterable[Job]) -> int:
+        """Add jobs to the queue, returning how many were added."""
+
+    @abstractmethod
+    def claim(self, worker: str, limit: int = 1) -> List[Job]:
+        """Lease up to limit pending jobs, oldest first, counting an attempt for each."""
+
+    @abstractmethod
+    def complete(self, job: Job):
+        """Record a job as done."""
+
+    @abstractmethod
+    def fail(self, job: Job, error: str):
+        """Record a failed attempt, putting the job back unless it has no attempts left."""
+
+    @abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+
+    @abstractmethod
+    def failures(self) -> List[Job]:
+        """Jobs that are recorded as failed."""
+
+
+class SQLiteJobQueue(JobQueue):
+    """Jobs kept in a SQLite file, claimed in short write transactions."""
+
+    def __init__(self, path: str, **options):
+        """
+        Open the queue, creating the file if needed.
+
+        Args:
+            path: SQLite file of the queue
+            **options: max_attempts and lease, see JobQueue
+        """
+        super().__init__(**options)
+        self.path = path
+        with closing(self._connect()) as db:
+            db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                input_file TEXT NOT NULL,
+                output_file TEXT NOT NULL,
+                output_format TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                worker TEXT,
+                seconds REAL NOT NULL DEFAULT 0,
+                error TEXT)""")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per operation, so a queue can be used from any thread or process
+        return sqlite3.connect(self.path, timeout=60, isolation_level=None)
+
+    def submit(self, jobs: Iterable[Job]) -> int:
+        rows = [(job.input_file, job.output_file, job.output_format) for job in jobs]
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            db.executemany("INSERT INTO jobs (input_file, output_file, output_format) "
+                           "VALUES (?, ?, ?)", rows)
+            db.execute("COMMIT")
+        return len(rows)
+
+    def claim(self, worker: str, limit: int = 1) -> List[Job]:
+        now = time.time()
+        with closing(self._connect()) as db:
+            db.execute("BEGIN IMMEDIATE")
+            # Jobs of workers that stopped responding, out of attempts
+            db.execute("UPDATE jobs SET status = 'failed', error = 'Worker stopped responding' "
+                       "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                       (now, self.max_attempts))
+            rows = db.execute("SELECT id, input_file, output_file, output_format, attempts "
+                              "FROM jobs WHERE status = 'pending' "
+                              "OR (status = 'running' AND lease_until < ?) "
+                              "ORDER BY id LIMIT ?", (now, limit)).fetchall()
+            db.executemany("UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+                           "worker = ?, lease_until = ? WHERE id = ?",
+                           [(worker, now + self.lease, row[0]) for row in rows])
+            db.execute("COMMIT")
+        return [Job(input_file, output_file, output_format, str(job_id), attempts + 1,
+                    worker=worker)
+                for job_id, input_file, output_file, output_format, attempts in rows]
+
+    def complete(self, job: Job):
+        with closing(self._connect()) as db:
+            db.execute("UPDATE jobs SET status = 'done', seconds = ?, error = NULL "
+                       "WHERE id = ? AND status = 'running' AND worker = ?",
+                       (job.seconds, int(job.id), job.worker))
+
+    def fail(self, job: Job, error: str):
+        status = 'pending' if job.attempts < self.max_attempts else 'failed'
+        with closing(self._connect()) as db:
+            db.execute("UPDATE jobs SET status = ?, error = ?, seconds = ? "
+                       "WHERE id = ? AND status = 'running' AND worker = ?",
+                       (status, error, job.seconds, int(job.id), job.worker))
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUSES, 0)
+        with closing(self._connect()) as db:
+            counts.update(db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return counts
+
+    def failures(self) -> List[Job]:
+        with closing(self._connect()) as db:
+            rows = db.execute("SELECT input_file, output_file, output_format, id, attempts, "
+                              "error, worker, seconds FROM jobs WHERE status = 'failed' "
+                              "ORDER BY id").fetchall()
+        return [Job(*row[:3], str(row[3]), *row[4:]) for row in rows]
+
+
+class DirectoryJobQueue(JobQueue):
+    """
+    One JSON file per job, moved between status directories with atomic renames.
+
+    A job is claimed by renaming it from pending/ into running/, under a
+    name that carries the lease expiry and the claiming worker. Only one of
+    several workers racing for a job can win the rename. Everything else
+    that changes a claimed job first takes the claim over with another
+    rename: a worker finishing its job, or a worker returning a job whose
+    lease ran out. Whoever loses that rename has lost the lease and leaves
+    the job alone. Until the job file has moved on, it is a claim with a
+    fresh lease, so a crash in between only means the job runs again.
+    """
+
+    def __init__(self, path: str, **options):
+        """
+        Open the queue, creating its directories if needed.
+
+        Args:
+            path: Directory of the queue
+            **options: max_attempts and lease, see JobQueue
+        """
+        super().__init__(**options)
+        self.path = path
+        for status in STATUSES:
+            os.makedirs(os.path.join(path, status), exist_ok=True)
+
+    def submit(self, jobs: Iterable[Job]) -> int:
+        count = 0
+        for job in jobs:
+            # Sortable by submission time, unique across hosts
+            name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:12]}.json"
+            job.id = name
+            self._write(job, 'pending', name)
+            count += 1
+        return count
+
+    def claim(self, worker: str, limit: int = 1) -> List[Job]:
+        jobs = self._claim_pending(worker, limit)
+        if len(jobs) < limit and self._requeue_expired():
+            jobs += self._claim_pending(worker, limit - len(jobs))
+        return jobs
+
+    def complete(self, job: Job):
+        self._finish(job, 'done')
+
+    def fail(self, job: Job, error: str):
+        job.error = error
+        self._finish(job, 'pending' if job.attempts < self.max_attempts else 'failed')
+
+    def counts(self) -> Dict[str, int]:
+        return {status: sum(1 for name in os.listdir(os.path.join(self.path, status))
+                            if name.endswith('.json'))
+                for status in STATUSES}
+
+    def failures(self) -> List[Job]:
+        failed = os.path.join(self.path, 'failed')
+        return [self._read(os.path.join(failed, name))
+                for name in sorted(os.listdir(failed)) if name.endswith('.json')]
+
+    def _claim_pending(self, worker: str, limit: int) -> List[Job]:
+        jobs = []
+        if limit <= 0:
+            return jobs
+        pending = os.path.join(self.path, 'pending')
+        for name in sorted(os.listdir(pending)):
+            if not name.endswith('.json'):
+                continue
+            lease_until = int(time.time() + self.lease)
+            running = os.path.join(self.path, 'running', f"{lease_until}~{worker}~{name}")
+            try:
+                os.rename(os.path.join(pending, name), running)
+            except FileNotFoundError:
+                # Another worker claimed it first
+                continue
+            job = self._read(running)
+            job.attempts += 1
+            job.worker = worker
+            job.claim = os.path.basename(running)
+            self._write(job, 'running', os.path.basename(running))
+            jobs.append(job)
+            if len(jobs) == limit:
+                break
+        return jobs
+
+    def _requeue_expired(self) -> bool:
+        """Put jobs whose lease ran out back, returning whether any went to pending/."""
+        requeued = False
+        running = os.path.join(self.path, 'running')
+        now = time.time()
+        for claimed in os.listdir(running):
+            lease_until = claimed.split('~', 1)[0]
+            name = claimed.rsplit('~', 1)[-1]
+            if not name.endswith('.json') or not lease_until.isdigit() \
+                    or int(lease_until) >= now:
+                continue
+            # Taken over first, so no other worker can claim or finish it meanwhile
+            taken = self._take_over(claimed, f".requeue-{uuid.uuid4().hex[:12]}")
+            if taken is None:
+                continue
+            try:
+                job = self._read(os.path.join(running, taken))
+            except (OSError, ValueError):
+                continue
+            status = 'pending' if job.attempts < self.max_attempts else 'failed'
+            job.claim = None
+            if status == 'failed':
+                job.error = 'Worker stopped responding'
+            self._move(job, taken, status)
+            requeued = requeued or status == 'pending'
+        return requeued
+
+    def _finish(self, job: Job, status: str):
+        """Move a claimed job to its new status, unless its lease was lost."""
+        taken = self._take_over(job.claim, f"{job.worker}.finish")
+        if taken is None:
+            # The lease ran out and another worker has the job now
+            return
+        job.claim = None
+        self._move(job, taken, status)
+
+    def _take_over(self, claimed: str, owner: str) -> Optional[str]:
+        """
+        Rename a claim in running/ to a new claim of owner with a fresh lease.
+
+        Returns:
+            The new name, or None if the claim was gone, i.e. taken by someone else
+        """
+        name = claimed.rsplit('~', 1)[-1]
+        taken = f"{int(time.time() + self.lease)}~{owner}~{name}"
+        running = os.path.join(self.path, 'running')
+        try:
+            os.rename(os.path.join(running, claimed), os.path.join(running, taken))
+        except FileNotFoundError:
+            return None
+        return taken
+
+    def _move(self, job: Job, claimed: str, status: str):
+        """Rewrite a job this process has taken over and move it out of running/."""
+        path = os.path.join(self.path, 'running', claimed)
+        self._write(job, 'running', claimed)
+        os.rename(path, os.path.join(self.path, status, job.id))
+
+    def _read(self, path: str) -> Job:
+        with open(path, encoding='utf-8') as f:
+            return Job(**json.load(f))
+
+    def _write(self, job: Job, status: str, name: str):
+        """Write a job file atomically, so readers never see half of it."""
+        path = os.path.join(self.path, status, name)
+        tmp_file = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(asdict(job), f)
+        os.replace(tmp_file, path)
+
+
+def open_queue(location: str, **options) -> JobQueue:
+    """
+    Open the queue at a location: a SQLite file for .db/.sqlite names, otherwise a directory.
+
+    Args:
+        location: Path of the queue
+        **options: max_attempts and lease, see JobQueue
+    """
+    if location.lower().endswith(SQLITE_EXTENSIONS):
+        return SQLiteJobQueue(location, **options)
+    return DirectoryJobQueue(location, **options)
+
+
+def enqueue_batch(queue: JobQueue, sources: Iterable[str], output_format: str,
+                  output_dir: Optional[str] = None) -> int:
+    """
+    Add a job for every document found in the sources, see batch.collect_inputs.
+
+    Documents whose output path is the document itself are left out.
+
+    Returns:
+        Number of jobs added
+    """
+    jobs = (Job(input_file, output_path_for(input_file, base_dir, output_format, output_dir),
+                output_format)
+            for input_file, base_dir in collect_inputs(sources))
+    return queue.submit(job for job in jobs if os.path.abspath(job.output_file) != job.input_file)
+
+
+def default_worker_id() -> str:
+    """Name of this worker process in queue records."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def run_worker(queue: JobQueue, converter: Optional[DocumentConverter] = None,
+               worker: Optional[str] = None, claim_size: int = CLAIM_SIZE,
+               wait: bool = False, poll_interval: float = 1.0,
+               progress: Optional[Callable[[BatchResult], None]] = None,
+               should_stop: Optional[Callable[[], bool]] = None) -> int:
+    """
+    Convert jobs from a queue until it is empty, or until stopped when waiting.
+
+    Outputs are staged locally and moved into place atomically, see
+    OutputWriter; a job is recorded as done once its output is in place.
+
+    Args:
+        queue: Queue to take jobs from
+        converter: Converter to use (default: a new subprocess converter)
+        worker: Name recorded with claimed jobs (default: host name and process id)
+        claim_size: Jobs claimed at once
+        wait: Keep polling for new jobs when the queue is empty
+        poll_interval: Seconds between polls of an empty queue
+        progress: Called with the result of each attempt
+        should_stop: Checked between jobs; returning True ends the worker
+
+    Returns:
+        Number of jobs this worker completed
+    """
+    worker = worker or default_worker_id()
+    own_converter = converter is None
+    converter = converter or DocumentConverter()
+    completed = []
+
+    def finish(job: Job, result: BatchResult, commit):
+        if commit.exception() is not None:
+            result.status, result.error = 'failed', str(commit.exception())
+            queue.fail(job, result.error)
+        else:
+            queue.complete(job)
+            completed.append(job)
+        if progress:
+            progress(result)
+
+    try:
+        with OutputWriter() as writer:
+            while not (should_stop and should_stop()):
+                jobs = queue.claim(worker, claim_size)
+                if not jobs:
+                    if not wait:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                for job in jobs:
+                    staged_file = writer.staging_path(job.output_file)
+                    start = time.perf_counter()
+                    try:
+                        converter.convert_file(job.input_file, job.output_format,
+                                               output_file=staged_file)
+                    except Exception as e:
+                        writer.discard(staged_file)
+                        job.seconds = time.perf_counter() - start
+                        queue.fail(job, str(e))
+                        if progress:
+                            progress(BatchResult(job.input_file, job.output_file, 'failed',
+                                                 job.seconds, error=str(e)))
+                        continue
+                    job.seconds = time.perf_counter() - start
+                    result = BatchResult(job.input_file, job.output_file, 'converted',
+                                         job.seconds, os.path.getsize(job.input_file))
+                    # Recorded once the output is in place, while the next job converts
+                    writer.commit(staged_file, job.output_file).add_done_callback(
+                        lambda commit, job=job, result=result: finish(job, result, commit))
+    finally:
+        if own_converter:
+            converter.close()
+    return len(completed)
+
+
+def _worker_process(location: str, queue_options: dict, worker_options: dict) -> int:
+    return run_worker(open_queue(location, **queue_options), **worker_options)
+
+
+def run_workers(location: str, processes: int, queue_options: Optional[dict] = None,
+                **worker_options) -> int:
+    """
+    Run worker processes on the queue at a location and wait for them to finish.
+
+    Args:
+        location: Path of the queue, see open_queue
+        processes: Number of worker processes
+        queue_options: max_attempts and lease, see JobQueue
+        **worker_options: Options of run_worker; progress must be picklable
+
+    Returns:
+        Number of jobs the processes completed
+    """
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = [pool.submit(_worker_process, location, queue_options or {}, worker_options)
+                   for _ in range(processes)]
+        return sum(future.result() for future in futures)
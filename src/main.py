@@ -5,9 +5,13 @@ Erics-Omvandlare - Conversion utility application
 Main entry point for the application.
 """
 
-import pypandoc
+import argparse
 import os
-from converter import DocumentConverter
+import sys
+from typing import Optional
+from batch import convert_batch, print_progress
+from templates import prepare_reference_doc
+from converter import DocumentConverter, pypandoc
 from pandoc_setup import setup_pandoc, get_pandoc_version
 
 def test_pandoc_installation():
@@ -29,11 +33,155 @@ def test_pandoc_installation():
         print("You may need to install pandoc separately.")
         return False
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(prog='omvandlare',
+                                     description="Erics-Omvandlare document conversion")
+    commands = parser.add_subparsers(dest='command')
+
+    batch = commands.add_parser('batch', help="Convert many documents in parallel")
+    batch.add_argument('inputs', nargs='+', help="Directories, glob patterns or files")
+    batch.add_argument('-t', '--to', required=True, help="Output format, e.g. html or docx")
+    batch.add_argument('-o', '--output-dir', help="Output directory (default: next to inputs)")
+    batch.add_argument('-j', '--workers', type=int, help="Parallel workers (default: CPU count)")
+    batch.add_argument('--executor', choices=('process', 'thread'), default='process',
+                       help="Worker pool type (default: process)")
+    batch.add_argument('-f', '--force', action='store_true',
+                       help="Convert even if outputs are up to date")
+    batch.add_argument('--reference-doc',
+                       help="DOCX file whose styles, headers and footers DOCX outputs use")
+    batch.add_argument('--staging-dir',
+                       help="Local directory outputs are written to before being moved into place")
+    batch.add_argument('--no-sync', action='store_true',
+                       help="Do not sync outputs to disk (faster, but not crash safe)")
+
+    serve = commands.add_parser('serve', help="Run a local HTTP conversion service")
+    serve.add_argument('--host', help="Interface to bind (default: 127.0.0.1)")
+    serve.add_argument('-p', '--port', type=int, help="Port to listen on (default: 8765)")
+    serve.add_argument('-j', '--workers', type=int,
+                       help="Concurrent conversions (default: CPU count)")
+    serve.add_argument('--max-queue', type=int, default=64,
+                       help="Requests allowed to wait before answering 429 (default: 64)")
+    serve.add_argument('--batch-window', type=float, default=5.0,
+                       help="Milliseconds to collect small requests into a batch (default: 5)")
+    serve.add_argument('--allow-dir', action='append', default=[],
+                       help="Directory input and output files may be in; repeat for several "
+                            "(default: none, text conversions only)")
+    serve.add_argument('--token-file',
+                       help="File to write the access token to (default: in the cache directory)")
+
+    watch = commands.add_parser('watch', help="Keep converted copies of a directory tree up to date")
+    watch.add_argument('directory', help="Directory tree to watch")
+    watch.add_argument('-t', '--to', required=True, action='append',
+                       help="Output format; repeat for several, e.g. -t html -t docx")
+    watch.add_argument('-o', '--output-dir', help="Output directory (default: next to inputs)")
+    watch.add_argument('-j', '--workers', type=int, help="Parallel workers (default: CPU count)")
+    watch.add_argument('--debounce', type=float, default=300.0,
+                       help="Milliseconds without changes before converting (default: 300)")
+    watch.add_argument('--poll', action='store_true',
+                       help="Poll for changes instead of using inotify")
+
+    enqueue = commands.add_parser('enqueue', help="Add documents to a shared job queue")
+    enqueue.add_argument('queue', help="Queue: a .db/.sqlite file or a directory")
+    enqueue.add_argument('inputs', nargs='+', help="Directories, glob patterns or files")
+    enqueue.add_argument('-t', '--to', required=True, help="Output format, e.g. html or docx")
+    enqueue.add_argument('-o', '--output-dir', help="Output directory (default: next to inputs)")
+
+    worker = commands.add_parser('worker', help="Convert documents from a shared job queue")
+    worker.add_argument('queue', help="Queue: a .db/.sqlite file or a directory")
+    worker.add_argument('-j', '--processes', type=int, default=1,
+                        help="Worker processes on this machine (default: 1)")
+    worker.add_argument('--max-attempts', type=int, default=3,
+                        help="Attempts per document before it is recorded as failed (default: 3)")
+    worker.add_argument('--wait', action='store_true',
+                        help="Keep waiting for new jobs when the queue is empty")
+    return parser
+
+
+def run_batch(args: argparse.Namespace) -> int:
+    """Run the batch command and return the exit code."""
+    if args.reference_doc is not None:
+        try:
+            prepare_reference_doc(args.reference_doc)
+        except (OSError, ValueError) as e:
+            print(f"Unusable reference document: {e}", file=sys.stderr)
+            return 1
+    if args.staging_dir is not None and not (os.path.isdir(args.staging_dir)
+                                             and os.access(args.staging_dir, os.W_OK)):
+        print(f"Staging directory is missing or not writable: {args.staging_dir}",
+              file=sys.stderr)
+        return 1
+    summary = convert_batch(args.inputs, args.to, output_dir=args.output_dir,
+                            workers=args.workers, executor=args.executor,
+                            force=args.force, progress=print_progress,
+                            reference_doc=args.reference_doc,
+                            staging_dir=args.staging_dir, sync=not args.no_sync)
+    print(summary.format())
+    return 1 if summary.count('failed') else 0
+
+
+def run_watch(args: argparse.Namespace) -> int:
+    """Run the watch command until interrupted and return the exit code."""
+    from watcher import FolderWatcher
+
+    if not os.path.isdir(args.directory):
+        print(f"Not a directory: {args.directory}", file=sys.stderr)
+        return 1
+    watcher = FolderWatcher(args.directory, args.to, output_dir=args.output_dir,
+                            workers=args.workers, debounce=args.debounce / 1000,
+                            use_inotify=not args.poll, progress=print_progress)
+    print(f"Watching {watcher.root} (Ctrl+C to stop)", flush=True)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+def run_queue_command(args: argparse.Namespace) -> int:
+    """Run the enqueue or worker command and return the exit code."""
+    from job_queue import enqueue_batch, open_queue, run_workers
+
+    options = {'max_attempts': args.max_attempts} if args.command == 'worker' else {}
+    queue = open_queue(args.queue, **options)
+    if args.command == 'enqueue':
+        added = enqueue_batch(queue, args.inputs, args.to, args.output_dir)
+        print(f"{added} jobs added", flush=True)
+    else:
+        try:
+            run_workers(args.queue, args.processes, options, wait=args.wait,
+                        progress=print_progress)
+        except KeyboardInterrupt:
+            pass
+    counts = queue.counts()
+    print(", ".join(f"{count} {status}" for status, count in counts.items()))
+    for job in queue.failures():
+        print(f"✗ {job.input_file} after {job.attempts} attempts: {job.error}", file=sys.stderr)
+    return 1 if counts['failed'] else 0
+
+
+def main(argv: Optional[list] = None) -> int:
     """Main function to start the application."""
     # Ensure the bundled pandoc is used when frozen
     setup_pandoc()
 
+    args = build_parser().parse_args(argv or [])
+    if args.command == 'batch':
+        return run_batch(args)
+    if args.command == 'serve':
+        # The service pulls in asyncio; only pay for it when serving
+        from server import DEFAULT_HOST, DEFAULT_PORT, run_server
+        return run_server(args.host or DEFAULT_HOST, args.port or DEFAULT_PORT,
+                          max_concurrency=args.workers, max_queue=args.max_queue,
+                          batch_window=args.batch_window / 1000, file_roots=args.allow_dir,
+                          token_file=args.token_file)
+    if args.command == 'watch':
+        return run_watch(args)
+    if args.command in ('enqueue', 'worker'):
+        return run_queue_command(args)
+
     print("Welcome to Erics-Omvandlare!")
     print("This is a conversion utility application using Pandoc.")
     print("\nTesting pypandoc installation...")
@@ -65,6 +213,7 @@ def main():
     else:
         print("\n⚠️  Please install pandoc to use all features.")
         print("Visit: https://pandoc.org/installing.html")
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main(sys.argv[1:]))
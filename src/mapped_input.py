@@ -0,0 +1,167 @@
+"""
+Memory-mapped input files for streaming into pandoc.
+
+Large inputs should never be read into a Python string: a multi-gigabyte
+log dump would need several times its size in memory once it is decoded and
+encoded again. MappedFile maps the file read-only and hands out
+memoryview slices of the mapping, which can be written straight to pandoc's
+standard input. The encoding is detected from a byte order mark or a few
+sampled windows of the file. Only non-UTF-8 files are transcoded, one chunk
+at a time, so memory use stays flat whatever the file size.
+"""
+
+import codecs
+import mmap
+import os
+from typing import Iterator, Optional, Tuple, Union
+
+
+# Checked in order: the UTF-32 LE mark starts with the UTF-16 LE mark
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF32_LE, 'utf-32-le'),
+    (codecs.BOM_UTF32_BE, 'utf-32-be'),
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+# Bytes sampled for encoding detection, spread over the whole file
+SAMPLE_WINDOWS = 16
+SAMPLE_WINDOW_SIZE = 16 * 1024
+
+# Encoding of text that is not UTF-8. Windows-1252 decodes the typographic
+# quotes and dashes Latin-1 leaves as control characters; files using one of
+# the five bytes it does not define fall back to Latin-1.
+LEGACY_ENCODINGS = ('cp1252', 'latin-1')
+
+
+def detect_encoding(buffer: Union[bytes, memoryview, mmap.mmap]) -> Tuple[str, int]:
+    """
+    Detect the encoding of text without decoding all of it.
+
+    Args:
+        buffer: The raw contents
+
+    Returns:
+        Tuple of (codec name, length of the byte order mark to skip)
+    """
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if buffer[:len(mark)] == mark:
+            return encoding, len(mark)
+
+    view = memoryview(buffer)
+    size = len(view)
+    if size <= SAMPLE_WINDOWS * SAMPLE_WINDOW_SIZE:
+        windows = [(0, size)]
+    else:
+        # From the very start to the very end of the file
+        starts = [(size - SAMPLE_WINDOW_SIZE) * i // (SAMPLE_WINDOWS - 1)
+                  for i in range(SAMPLE_WINDOWS)]
+        windows = [(start, start + SAMPLE_WINDOW_SIZE) for start in starts]
+
+    samples = [view[start:end] for start, end in windows]
+    if all(_is_utf8_window(sample, start == 0, end == size)
+           for sample, (start, end) in zip(samples, windows)):
+        return 'utf-8', 0
+    for encoding in LEGACY_ENCODINGS:
+        try:
+            for sample in samples:
+                codecs.decode(sample, encoding)
+        except UnicodeDecodeError:
+            continue
+        return encoding, 0
+    return LEGACY_ENCODINGS[-1], 0
+
+
+def _is_utf8_window(window: memoryview, at_start: bool, at_end: bool) -> bool:
+    """Check that a window of a file is valid UTF-8, allowing for cut characters."""
+    if not at_start:
+        # Skip the continuation bytes of a character cut off by the window
+        skip = 0
+        while skip < 3 and skip < len(window) and 0x80 <= window[skip] < 0xC0:
+            skip += 1
+        window = window[skip:]
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(window, final=at_end)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+class MappedFile:
+    """A read-only memory map of a text file and its detected encoding."""
+
+    def __init__(self, path: Union[str, os.PathLike], encoding: Optional[str] = None):
+        """
+        Map a file.
+
+        Args:
+            path: Path of the file
+            encoding: Encoding of the file, or None to detect it
+        """
+        self.path = os.fspath(path)
+        with open(self.path, 'rb') as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # Empty files cannot be mapped
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        buffer = self._mmap if self._mmap is not None else b''
+        if encoding is None:
+            self.encoding, self.offset = detect_encoding(buffer)
+        else:
+            self.encoding, self.offset = codecs.lookup(encoding).name, 0
+
+    @property
+    def is_utf8(self) -> bool:
+        """Whether the contents can go to pandoc unchanged."""
+        return self.encoding == 'utf-8' and self.offset == 0
+
+    def chunks(self, chunk_size: int) -> Iterator[Union[memoryview, bytes]]:
+        """
+        Yield the contents as UTF-8 without a byte order mark.
+
+        UTF-8 files are yielded as memoryview slices of the mapping, without
+        copying; each slice is released when the next one is requested.
+        Other encodings are decoded and encoded one chunk at a time.
+        """
+        if self._mmap is None:
+            return
+        view = memoryview(self._mmap)
+        chunk = None
+        try:
+            if self.encoding == 'utf-8':
+                for start in range(self.offset, self.size, chunk_size):
+                    chunk = view[start:start + chunk_size]
+                    yield chunk
+                    chunk.release()
+                return
+
+            decoder = codecs.getincrementaldecoder(self.encoding)()
+            for start in range(self.offset, self.size, chunk_size):
+                chunk = view[start:start + chunk_size]
+                text = decoder.decode(chunk, final=start + chunk_size >= self.size)
+                chunk.release()
+                if text:
+                    yield text.encode('utf-8')
+        finally:
+            # Also when the caller stops early, so the mapping can be closed
+            if chunk is not None:
+                chunk.release()
+            view.release()
+
+    def read_text(self) -> str:
+        """Decode the whole file; only meant for files small enough to hold in memory."""
+        if self._mmap is None:
+            return ''
+        with memoryview(self._mmap) as view, view[self.offset:] as contents:
+            return str(contents, self.encoding)
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,188 @@
+"""
+Atomic, background output writing for bulk exports.
+
+Letting pandoc write straight to the final path leaves partial files behind
+when a conversion fails or the machine crashes, and on a network share every
+small write stalls the conversion that made it. OutputWriter gives each
+output a staging path on fast local disk instead. Once a conversion has
+succeeded, the staged file is handed to a writer thread which copies it next
+to its destination, syncs it and renames it into place, while the next
+conversion is already running. Readers therefore only ever see complete old
+or complete new files. The rename is made durable by syncing the directory,
+which the writer does once per batch of files rather than once per file.
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import Optional, Set
+
+
+# Files moved into place before their directories are synced
+SYNC_BATCH = 64
+
+# Directories cannot be opened for syncing on Windows
+CAN_SYNC_DIRECTORIES = os.name != 'nt'
+
+
+class OutputWriter:
+    """Moves staged outputs atomically into place on a background thread."""
+
+    def __init__(self, staging_dir: Optional[str] = None, sync: bool = True,
+                 sync_batch: int = SYNC_BATCH):
+        """
+        Initialize the writer and its private staging directory.
+
+        Args:
+            staging_dir: Local directory to stage outputs in (default: the
+                system temporary directory)
+            sync: Sync files and directories to disk, so outputs survive a crash
+            sync_batch: Files moved into place between directory syncs
+        """
+        self.sync = sync
+        self.sync_batch = sync_batch
+        self.staging_dir = tempfile.mkdtemp(prefix='omvandlare-output-', dir=staging_dir)
+        self._staging_dev = os.stat(self.staging_dir).st_dev
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._dirty_dirs: Set[str] = set()
+        self._unsynced = 0
+        self._thread = threading.Thread(target=self._run, name='output-writer', daemon=True)
+        self._thread.start()
+
+    def staging_path(self, output_file: str) -> str:
+        """
+        Get a fresh staging path for an output, keeping its file name and extension.
+
+        Args:
+            output_file: Final path of the output
+
+        Returns:
+            Path to write the output to before committing it
+        """
+        with self._counter_lock:
+            self._counter += 1
+            number = self._counter
+        return os.path.join(self.staging_dir, f"{number}-{os.path.basename(output_file)}")
+
+    def commit(self, staged_file: str, output_file: str) -> Future:
+        """
+        Queue a staged output to be moved into place.
+
+        Args:
+            staged_file: Complete output written to a staging path
+            output_file: Final path; created or replaced atomically
+
+        Returns:
+            Future that is done once the output is in place. Its result is
+            the final path, or it holds the OSError that stopped the move.
+        """
+        future = Future()
+        self._queue.put((staged_file, output_file, future))
+        return future
+
+    def discard(self, staged_file: str):
+        """Remove a staged output that will not be committed, e.g. after a failure."""
+        try:
+            os.remove(staged_file)
+        except FileNotFoundError:
+            pass
+
+    def flush(self):
+        """Wait until all queued outputs are in place and their directories are synced."""
+        done = Future()
+        self._queue.put((None, None, done))
+        done.result()
+
+    def close(self):
+        """Flush queued outputs, stop the writer thread and remove the staging directory."""
+        if self._thread.is_alive():
+            self.flush()
+            self._queue.put(None)
+            self._thread.join()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                # Idle: make what has been moved so far durable
+                self._sync_directories()
+                continue
+            if item is None:
+                return
+            staged_file, output_file, future = item
+            if staged_file is None:
+                self._sync_directories()
+                future.set_result(None)
+                continue
+            try:
+                self._move(staged_file, output_file)
+            except OSError as e:
+                future.set_exception(e)
+            else:
+                future.set_result(output_file)
+            if self._unsynced >= self.sync_batch:
+                self._sync_directories()
+
+    def _move(self, staged_file: str, output_file: str):
+        """Move one staged file into place, syncing its data before the rename."""
+        directory = os.path.dirname(os.path.abspath(output_file))
+        os.makedirs(directory, exist_ok=True)
+        if os.stat(directory).st_dev == self._staging_dev:
+            # Same file system: the staged file itself can be renamed into place
+            if self.sync:
+                _sync_file(staged_file)
+            os.replace(staged_file, output_file)
+        else:
+            # Copied next to the destination first, since renames cannot cross file systems
+            tmp_file = os.path.join(directory,
+                                    f".{os.path.basename(output_file)}.{os.getpid()}.tmp")
+            try:
+                shutil.copyfile(staged_file, tmp_file)
+                if self.sync:
+                    _sync_file(tmp_file)
+                os.replace(tmp_file, output_file)
+            except OSError:
+                if os.path.exists(tmp_file):
+                    os.remove(tmp_file)
+                raise
+            finally:
+                self.discard(staged_file)
+        self._dirty_dirs.add(directory)
+        self._unsynced += 1
+
+    def _sync_directories(self):
+        """Sync every directory that received outputs since the last sync."""
+        if self.sync and CAN_SYNC_DIRECTORIES:
+            for directory in self._dirty_dirs:
+                try:
+                    fd = os.open(directory, os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    os.fsync(fd)
+                except OSError:
+                    # Some network file systems do not support syncing directories
+                    pass
+                finally:
+                    os.close(fd)
+        self._dirty_dirs.clear()
+        self._unsynced = 0
+
+
+def _sync_file(path: str):
+    """Flush a file's data to disk."""
+    with open(path, 'rb+') as f:
+        os.fsync(f.fileno())
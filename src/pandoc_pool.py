@@ -0,0 +1,659 @@
+"""
+Pool of long-lived pandoc worker processes.
+
+Starting pandoc is often more expensive than the conversion itself for
+typical LLM-sized Markdown. This module keeps a few warm ``pandoc lua``
+processes running a small request loop, so each conversion is a round trip
+over a pipe instead of a new process.
+"""
+
+import json
+import os
+import queue
+import subprocess
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from instrumentation import record_stage, stage
+from pandoc_setup import CREATION_FLAGS, lazy_import
+
+
+pypandoc = lazy_import('pypandoc')
+
+
+# Request loop executed by each worker. One JSON request per input line,
+# one JSON response per output line. Binary formats are written straight to
+# the requested output file because they cannot travel through JSON.
+#
+# A request with a 'requests' list is a pack of documents. Each document is
+# read on its own; those without footnotes are then written in a single call
+# with a raw marker block between them, because for short texts a writer
+# call costs more than the document itself. The output is split at the
+# markers, and a pack whose first piece does not match a separate write of
+# that document is written one document at a time instead.
+#
+# A request with 'sandbox' set is read without access to any file, as with
+# pandoc --sandbox, so e.g. LaTeX \input or RST include directives cannot
+# read files. Writers are not sandboxed; see SANDBOX_FORMATS.
+WORKER_SCRIPT = r"""
+local function run(fn)
+  local seen = #PANDOC_STATE.log
+  local ok, result = pcall(fn)
+  local messages = {}
+  for i = seen + 1, #PANDOC_STATE.log do
+    messages[#messages + 1] = PANDOC_STATE.log[i]
+  end
+  return ok, result, messages
+end
+
+local function respond(ok, result, messages, timings)
+  if ok then
+    return {ok = true, output = result, messages = messages, timings = timings}
+  end
+  return {ok = false, error = tostring(result), messages = messages}
+end
+
+local function read(req)
+  return pandoc.read(req.text, req.from, nil, req.sandbox and {} or nil)
+end
+
+local function deliver(req, out)
+  if req.output then
+    local f = assert(io.open(req.output, 'wb'))
+    f:write(out)
+    f:close()
+    return ''
+  end
+  return out
+end
+
+local function convert(req)
+  local timings = {}
+  local ok, result, messages = run(function()
+    local start = os.clock()
+    local doc = read(req)
+    timings.read = os.clock() - start
+    start = os.clock()
+    local out = pandoc.write(doc, req.to)
+    timings.write = os.clock() - start
+    return deliver(req, out)
+  end)
+  return respond(ok, result, messages, timings)
+end
+
+local function split(out, marker)
+  local pieces, start = {}, 1
+  while true do
+    local first, last = out:find(marker, start, true)
+    if not first then break end
+    pieces[#pieces + 1] = (out:sub(start, first - 1):gsub('\n+$', ''))
+    start = last + 1
+    while out:sub(start, start) == '\n' do start = start + 1 end
+  end
+  pieces[#pieces + 1] = out:sub(start)
+  return pieces
+end
+
+local function convert_pack(pack)
+  local responses, docs, joined = {}, {}, {}
+  for i, req in ipairs(pack.requests) do
+    local ok, doc, messages = run(function() return read(req) end)
+    if ok then
+      docs[i] = {doc = doc, messages = messages}
+      local notes = false
+      doc:walk{Note = function() notes = true end}
+      if pack.join and not req.output and not notes and #doc.blocks > 0 then
+        joined[#joined + 1] = i
+      end
+    else
+      responses[i] = respond(false, doc, messages)
+    end
+  end
+
+  if #joined > 1 then
+    local blocks = pandoc.Blocks{}
+    for k, i in ipairs(joined) do
+      if k > 1 then blocks:insert(pandoc.RawBlock(pack.join, pack.marker)) end
+      blocks:extend(docs[i].doc.blocks)
+    end
+    local ok, out, messages = run(function()
+      return pandoc.write(pandoc.Pandoc(blocks), pack.to)
+    end)
+    if ok and #messages == 0 then
+      local pieces = split(out, pack.marker)
+      if #pieces == #joined and pieces[1] == pandoc.write(docs[joined[1]].doc, pack.to) then
+        for k, i in ipairs(joined) do
+          responses[i] = respond(true, pieces[k], docs[i].messages)
+          docs[i] = nil
+        end
+      end
+    end
+  end
+
+  for i, req in ipairs(pack.requests) do
+    local entry = docs[i]
+    if entry then
+      local ok, result, messages = run(function()
+        return deliver(req, pandoc.write(entry.doc, req.to))
+      end)
+      for _, message in ipairs(messages) do
+        entry.messages[#entry.messages + 1] = message
+      end
+      responses[i] = respond(ok, result, entry.messages)
+    end
+  end
+  return {ok = true, responses = responses}
+end
+
+while true do
+  local line = io.read('l')
+  if not line then break end
+  local req = pandoc.json.decode(line, false)
+  local response
+  if req.requests then
+    response = convert_pack(req)
+  else
+    response = convert(req)
+  end
+  io.write(pandoc.json.encode(response), '\n')
+  io.flush()
+end
+"""
+
+# Seconds a worker may take to answer one request before it is considered
+# hung, killed and replaced
+REQUEST_TIMEOUT = 300.0
+
+# Output formats pandoc produces as zip containers rather than text.
+BINARY_FORMATS = {'docx', 'odt', 'epub', 'epub2', 'epub3', 'pptx'}
+
+# Output formats the in-process writers cannot produce at all.
+UNSUPPORTED_FORMATS = {'pdf'}
+
+# Text formats whose writers never read files, e.g. to embed images, so
+# sandboxed requests (see WORKER_SCRIPT) are safe for them
+SANDBOX_FORMATS = {'html', 'html4', 'html5', 'markdown', 'gfm', 'commonmark', 'commonmark_x',
+                   'plain', 'latex', 'rst', 'org', 'asciidoc', 'mediawiki', 'json', 'native'}
+
+# Text formats whose writers pass raw blocks through and keep no state across
+# blocks (apart from footnotes), so a pack of documents can be written at once
+JOINABLE_FORMATS = {'html', 'html4', 'html5', 'latex', 'markdown', 'gfm', 'commonmark',
+                    'commonmark_x'}
+
+
+def _as_list(value) -> list:
+    """Lua encodes empty tables as JSON objects; normalize them to lists."""
+    return value if isinstance(value, list) else []
+
+
+def _payload(request: dict) -> dict:
+    """Build a worker request from a batch entry."""
+    payload = {'text': request['text'], 'from': request.get('from') or 'markdown',
+               'to': request['to']}
+    if request.get('output'):
+        payload['output'] = os.path.abspath(request['output'])
+    if request.get('sandbox'):
+        payload['sandbox'] = True
+    return payload
+
+
+def _pack_payload(requests: List[dict]) -> dict:
+    """Build a pack request for documents that share their output format."""
+    output_format = requests[0]['to']
+    pack = {'requests': [_payload(request) for request in requests], 'to': output_format}
+    join = output_format.split('+')[0].split('-')[0]
+    if join in JOINABLE_FORMATS:
+        pack['join'] = join
+        pack['marker'] = f'OMVANDLARE-SPLIT-{uuid.uuid4().hex}'
+    return pack
+
+
+def _parse_pack(requests: List[dict], response: dict) -> list:
+    """Turn the response to a pack request into per-document results."""
+    responses = response.get('responses') if response.get('ok') else None
+    if not isinstance(responses, list) or len(responses) != len(requests):
+        raise WorkerError(f"Invalid pack response from pandoc worker: {response.get('error')}")
+    return _parse_responses(requests, responses)
+
+
+def _parse_responses(requests: List[dict], responses: List[dict]) -> list:
+    """Turn worker responses into (result, messages) tuples or errors."""
+    results = []
+    for request, response in zip(requests, responses):
+        try:
+            results.append(_parse_response(response, request.get('output')))
+        except RuntimeError as e:
+            results.append(e)
+    return results
+
+
+def _parse_response(response: dict, output_file: Optional[str]) -> Tuple[str, List[dict]]:
+    """Turn a worker response into (output, messages), raising on pandoc errors."""
+    if not response.get('ok'):
+        raise RuntimeError(f"Pandoc died with error: {response.get('error')}")
+
+    # CPU time pandoc spent in its reader and writer
+    timings = response.get('timings') or {}
+    record_stage('pandoc_read', timings.get('read'))
+    record_stage('pandoc_write', timings.get('write'))
+    messages = _as_list(response.get('messages'))
+    if output_file:
+        return output_file, messages
+    output = response['output']
+    # Match the trailing newline the pandoc command line adds
+    if not output.endswith('\n'):
+        output += '\n'
+    return output, messages
+
+
+class WorkerError(RuntimeError):
+    """Raised when a worker process dies or breaks the request protocol."""
+
+
+class WorkerTimeout(WorkerError):
+    """Raised when a worker does not answer a request in time; it has been killed."""
+
+
+class PandocWorker:
+    """A single long-lived ``pandoc lua`` process."""
+
+    def __init__(self, pandoc_path: str, script_path: str,
+                 timeout: Optional[float] = REQUEST_TIMEOUT):
+        """
+        Start the worker process.
+
+        Args:
+            pandoc_path: Pandoc executable
+            script_path: Path of the worker script
+            timeout: Seconds to wait for each response, or None to wait forever
+        """
+        self.process = subprocess.Popen(
+            [pandoc_path, 'lua', script_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            creationflags=CREATION_FLAGS,
+        )
+        self.timeout = timeout
+        self.requests_served = 0
+        self._timed_out = False
+
+    def is_alive(self) -> bool:
+        """Check whether the worker process is still running."""
+        return self.process.poll() is None
+
+    def request(self, payload: dict) -> dict:
+        """
+        Send one request to the worker and wait for its response.
+
+        Args:
+            payload: Request with 'text', 'from', 'to' and optional 'output'
+
+        Returns:
+            Decoded response dictionary
+
+        Raises:
+            WorkerTimeout: If no response arrived in time; the worker is killed
+            WorkerError: If the process died or returned garbage
+        """
+        line = json.dumps(payload).encode('utf-8') + b'\n'
+        try:
+            with self._deadline():
+                self.process.stdin.write(line)
+                self.process.stdin.flush()
+                response = self.process.stdout.readline()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            self._check_timeout()
+            raise WorkerError(f"Pandoc worker pipe failed: {e}") from e
+
+        if not response:
+            self._check_timeout()
+            raise WorkerError("Pandoc worker exited unexpectedly")
+
+        self.requests_served += 1
+        try:
+            return json.loads(response)
+        except ValueError as e:
+            raise WorkerError(f"Invalid response from pandoc worker: {e}") from e
+
+    def request_many(self, payloads: List[dict]) -> List[dict]:
+        """
+        Pipeline several requests: all are written before the first response
+        is read, so the worker never waits for a round trip between them.
+
+        Raises:
+            WorkerError: If the process died, returned garbage or did not
+                answer in time. The worker is killed and must not be reused.
+        """
+        data = b''.join(json.dumps(payload).encode('utf-8') + b'\n' for payload in payloads)
+
+        def feed():
+            try:
+                self.process.stdin.write(data)
+                self.process.stdin.flush()
+            except (OSError, ValueError):
+                pass  # Reported by the reader as a missing response
+
+        # Writing from a separate thread keeps large batches from filling both
+        # pipes and deadlocking
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+        responses = []
+        try:
+            for _ in payloads:
+                with self._deadline():
+                    response = self.process.stdout.readline()
+                if not response:
+                    self._check_timeout()
+                    raise WorkerError("Pandoc worker exited unexpectedly")
+                self.requests_served += 1
+                try:
+                    responses.append(json.loads(response))
+                except ValueError as e:
+                    raise WorkerError(f"Invalid response from pandoc worker: {e}") from e
+        except BaseException:
+            self.process.kill()
+            raise
+        finally:
+            writer.join()
+        return responses
+
+    @contextmanager
+    def _deadline(self):
+        """Kill the process if the enclosed pipe I/O takes longer than the timeout."""
+        if self.timeout is None:
+            yield
+            return
+        timer = threading.Timer(self.timeout, self._expire)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        finally:
+            timer.cancel()
+
+    def _expire(self):
+        # Killing the process closes its end of the pipes, which wakes the reader
+        self._timed_out = True
+        self.process.kill()
+
+    def _check_timeout(self):
+        if self._timed_out:
+            raise WorkerTimeout(f"Pandoc worker did not respond within {self.timeout} seconds")
+
+    def close(self):
+        """Stop the worker process."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+
+class PandocWorkerPool:
+    """A thread-safe pool of warm pandoc workers."""
+
+    def __init__(self, size: Optional[int] = None, max_requests_per_worker: int = 1000,
+                 pandoc_path: Optional[str] = None,
+                 request_timeout: Optional[float] = REQUEST_TIMEOUT):
+        """
+        Initialize the pool. Workers are started on first use.
+
+        Args:
+            size: Maximum number of concurrent workers (default: CPU count)
+            max_requests_per_worker: Recycle a worker after this many requests
+            pandoc_path: Pandoc executable (default: the one pypandoc uses)
+            request_timeout: Seconds a worker may take to answer a request
+                before it is killed and replaced, or None to wait forever
+        """
+        self.size = size or os.cpu_count() or 1
+        self.max_requests_per_worker = max_requests_per_worker
+        self.request_timeout = request_timeout
+        self._pandoc_path = pandoc_path
+        self._idle = queue.LifoQueue()
+        self._slots = threading.Semaphore(self.size)
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._script_path = None
+        self._closed = False
+
+    def supports(self, output_format: str, output_file: Optional[str] = None) -> bool:
+        """Check whether a conversion can be routed to the pool."""
+        if output_format in UNSUPPORTED_FORMATS:
+            return False
+        if output_format in BINARY_FORMATS and not output_file:
+            return False
+        return True
+
+    def convert_text(self, text: str, output_format: str, input_format: str = 'markdown',
+                     output_file: Optional[str] = None) -> str:
+        """Convert text on a pooled worker. See convert_text_with_messages."""
+        return self.convert_text_with_messages(text, output_format, input_format, output_file)[0]
+
+    def convert_text_with_messages(self, text: str, output_format: str,
+                                   input_format: str = 'markdown',
+                                   output_file: Optional[str] = None,
+                                   sandbox: bool = False) -> Tuple[str, List[dict]]:
+        """
+        Convert text on a pooled worker and collect pandoc's log messages.
+
+        A worker that dies or breaks protocol is discarded and the request is
+        retried once on a fresh worker. A worker that does not answer within
+        request_timeout is killed and replaced, and the request fails.
+
+        Args:
+            text: Input text to convert
+            output_format: Target format
+            input_format: Source format (default: markdown)
+            output_file: Optional output file path
+            sandbox: Read the input without access to any file
+
+        Returns:
+            Tuple of (converted text or output file path, log messages)
+
+        Raises:
+            WorkerTimeout: If the worker did not answer in time
+            RuntimeError: If pandoc reports a conversion error
+        """
+        payload = _payload({'text': text, 'from': input_format, 'to': output_format,
+                            'output': output_file, 'sandbox': sandbox})
+
+        response = None
+        for attempt in range(2):
+            with stage('pool_acquire'):
+                worker = self._acquire()
+            try:
+                with stage('pandoc'):
+                    response = worker.request(payload)
+            except WorkerError as e:
+                self._discard(worker)
+                # A document that hung one worker would hang the next as well
+                if attempt == 1 or isinstance(e, WorkerTimeout):
+                    raise
+                continue
+            self._release(worker)
+            break
+
+        return _parse_response(response, output_file)
+
+    def convert_batch(self, requests: List[dict]) -> list:
+        """
+        Convert several small documents back to back on a single worker.
+
+        The requests are pipelined to one warm worker, which saves a round
+        trip and a pool checkout per document. If the worker dies, the
+        batch falls back to converting each document on its own.
+
+        Args:
+            requests: Dictionaries with 'text', 'to' and optional 'from'
+                (default: markdown), 'output' (output file path) and
+                'sandbox' (read without access to files)
+
+        Returns:
+            One entry per request, in order: a (result, messages) tuple, or
+            the RuntimeError raised for that document
+        """
+        payloads = [_payload(request) for request in requests]
+        if not payloads:
+            return []
+
+        worker = self._acquire()
+        try:
+            responses = worker.request_many(payloads)
+        except WorkerError:
+            self._discard(worker)
+            return [self._convert_single(request) for request in requests]
+        self._release(worker)
+        return _parse_responses(requests, responses)
+
+    def convert_pack(self, requests: List[dict]) -> list:
+        """
+        Convert several documents with one request to a single worker.
+
+        Unlike convert_batch, the worker writes documents that share a text
+        output format in a single writer call (see WORKER_SCRIPT), so all
+        requests must have the same 'to' format.
+
+        Args:
+            requests: Entries as for convert_batch
+
+        Returns:
+            One entry per request, in order: a (result, messages) tuple, or
+            the RuntimeError raised for that document
+
+        Raises:
+            WorkerError: If the worker died; it is discarded
+        """
+        if not requests:
+            return []
+        worker = self._acquire()
+        try:
+            response = worker.request(_pack_payload(requests))
+        except WorkerError:
+            self._discard(worker)
+            raise
+        self._release(worker)
+        return _parse_pack(requests, response)
+
+    def _convert_single(self, request: dict):
+        """Convert one batch entry on its own, returning errors instead of raising."""
+        try:
+            return self.convert_text_with_messages(request['text'], request['to'],
+                                                   request.get('from') or 'markdown',
+                                                   request.get('output'),
+                                                   bool(request.get('sandbox')))
+        except RuntimeError as e:
+            return e
+
+    def close(self):
+        """Stop all workers and remove the worker script."""
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+        if self._script_path and os.path.exists(self._script_path):
+            os.remove(self._script_path)
+            self._script_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _acquire(self) -> PandocWorker:
+        """Take an idle worker, starting a new one if none are available."""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    worker = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._spawn()
+                if worker.is_alive():
+                    return worker
+                self._forget(worker)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker: PandocWorker):
+        """Return a worker to the pool, recycling it if it has served enough."""
+        if self._closed:
+            self._forget(worker)
+            worker.close()
+        elif worker.requests_served >= self.max_requests_per_worker:
+            self._discard(worker, release=False)
+        else:
+            self._idle.put(worker)
+        self._slots.release()
+
+    def _discard(self, worker: PandocWorker, release: bool = True):
+        """Kill a worker and drop it from the pool."""
+        self._forget(worker)
+        if worker.is_alive():
+            worker.process.kill()
+        worker.close()
+        if release:
+            self._slots.release()
+
+    def _forget(self, worker: PandocWorker):
+        with self._lock:
+            self._workers.discard(worker)
+
+    def _spawn(self) -> PandocWorker:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Pandoc worker pool is closed")
+            if self._script_path is None:
+                fd, self._script_path = tempfile.mkstemp(prefix='omvandlare_worker_', suffix='.lua')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(WORKER_SCRIPT)
+            pandoc_path = self._pandoc_path or pypandoc.get_pandoc_path()
+            worker = PandocWorker(pandoc_path, self._script_path, self.request_timeout)
+            self._workers.add(worker)
+            return worker
+
+
+def convert_packed(requests: List[dict], pandoc_path: Optional[str] = None) -> list:
+    """
+    Convert several documents in one short-lived ``pandoc lua`` process.
+
+    The documents are sent to the worker request loop as a single pack, so
+    they cost one pandoc start and, for text formats, one writer call.
+
+    Args:
+        requests: Entries as for PandocWorkerPool.convert_pack
+        pandoc_path: Pandoc executable (default: the one pypandoc uses)
+
+    Returns:
+        One entry per request, in order: a (result, messages) tuple, or the
+        RuntimeError raised for that document
+
+    Raises:
+        WorkerError: If the process died or returned garbage
+    """
+    if not requests:
+        return []
+    fd, script_path = tempfile.mkstemp(prefix='omvandlare_worker_', suffix='.lua')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(WORKER_SCRIPT)
+        worker = PandocWorker(pandoc_path or pypandoc.get_pandoc_path(), script_path)
+        try:
+            response = worker.request(_pack_payload(requests))
+        finally:
+            worker.close()
+    finally:
+        os.remove(script_path)
+    return _parse_pack(requests, response)
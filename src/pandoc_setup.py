@@ -4,13 +4,108 @@ Pandoc setup utilities for portable executable.
 This module handles setting up pandoc path when running as a bundled executable.
 """
 
+import importlib
+import json
 import os
+import re
+import shutil
+import subprocess
 import sys
-import pypandoc
+import threading
+from contextlib import nullcontext
+from typing import TYPE_CHECKING, Callable, Optional
+from instrumentation import annotate, stage
 
 
-def setup_pandoc():
-    """Set up pandoc path for the bundled executable."""
+# Keep pandoc from opening a console window when started from the GUI on Windows
+CREATION_FLAGS = 0x08000000 if sys.platform == 'win32' else 0
+
+MANIFEST_FILENAME = 'pandoc.json'
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self.__dict__['_name'] = name
+
+    def __getattr__(self, attribute):
+        # Only called for attributes not set on the proxy itself
+        module = importlib.import_module(self._name)
+        if not self.__dict__.get('_hooks_run'):
+            # Other threads wait here until the hooks have set the module up
+            with _hooks_lock:
+                for hook in _import_hooks.pop(self._name, ()):
+                    hook(module)
+            self.__dict__['_hooks_run'] = True
+        return getattr(module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+_lazy_modules = {}
+_import_hooks = {}
+_hooks_lock = threading.RLock()
+
+
+def lazy_import(name: str):
+    """
+    Get a module without importing it until it is first used.
+    
+    Importing pypandoc alone pulls in urllib, http.client and ssl, which adds
+    noticeably to startup time of the GUI and CLI.
+    
+    Args:
+        name: Absolute module name
+        
+    Returns:
+        The module if it is already imported, otherwise a shared LazyModule
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _lazy_modules.setdefault(name, LazyModule(name))
+
+
+def after_import(name: str, hook: Callable):
+    """
+    Call a function with a module once it is imported through lazy_import.
+    
+    Args:
+        name: Absolute module name
+        hook: Called with the module; immediately if it is already imported
+    """
+    with _hooks_lock:
+        if name in sys.modules:
+            hook(sys.modules[name])
+        else:
+            _import_hooks.setdefault(name, []).append(hook)
+
+
+if TYPE_CHECKING:
+    # Never executed, but lets type checkers and PyInstaller see the dependency
+    import pypandoc
+else:
+    pypandoc = lazy_import('pypandoc')
+
+
+def _trace(instrumentation, operation):
+    """Trace an operation if instrumentation was passed in."""
+    return instrumentation.trace(operation) if instrumentation is not None else nullcontext()
+
+
+def setup_pandoc(instrumentation=None):
+    """
+    Set up pandoc path for the bundled executable.
+    
+    Args:
+        instrumentation: Optional Instrumentation that records how long setup takes
+    """
+    with _trace(instrumentation, 'setup_pandoc'):
+        _setup_pandoc()
+
+
+def _setup_pandoc():
     if getattr(sys, 'frozen', False):
         # Running as bundled executable
         # In PyInstaller, bundled files are extracted to sys._MEIPASS
@@ -43,10 +138,199 @@ def setup_pandoc():
         print("Running in development mode - using system pandoc")
 
 
-def get_pandoc_version():
-    """Get the version of pandoc being used."""
+def get_cache_dir():
+    """
+    Get the directory used for on-disk caches, creating it if needed.
+    
+    The location can be overridden with the OMVANDLARE_CACHE_DIR environment
+    variable.
+    """
+    cache_dir = os.environ.get('OMVANDLARE_CACHE_DIR')
+    if not cache_dir:
+        if sys.platform == 'win32':
+            base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        else:
+            base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(base, 'erics-omvandlare')
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+class PandocManifest:
+    """
+    The pandoc binary in use, with its version and features, persisted
+    between launches.
+    
+    Finding pandoc makes pypandoc run `pandoc --version` for every candidate
+    location. The result is stored in a small JSON manifest together with
+    the binary's size and modification time, so later launches and worker
+    processes only stat the binary, and probe again once it changes.
+    """
+    
+    def __init__(self, manifest_file: Optional[str] = None):
+        """
+        Initialize the manifest. Nothing is read until pandoc is resolved.
+        
+        Args:
+            manifest_file: JSON file the manifest is kept in
+                (default: pandoc.json in the cache directory)
+        """
+        self._manifest_file = manifest_file
+        self._entry = None
+        self._lock = threading.Lock()
+    
+    @property
+    def manifest_file(self) -> str:
+        """Path of the on-disk manifest."""
+        if self._manifest_file is None:
+            self._manifest_file = os.path.join(get_cache_dir(), MANIFEST_FILENAME)
+        return self._manifest_file
+    
+    def resolve(self) -> dict:
+        """
+        Get the pandoc binary in use, probing it only if it is new or changed.
+        
+        Returns:
+            Dictionary with 'path', 'version', 'features' (e.g. ['lua',
+            'server']), 'scripting_engine' and 'stamp'
+            
+        Raises:
+            OSError: If pandoc cannot be found or run
+        """
+        with self._lock:
+            if self._entry is None:
+                # The bundled pandoc of a frozen build is configured through
+                # this variable, which pypandoc then uses exclusively
+                origin = os.environ.get('PYPANDOC_PANDOC', '')
+                manifest = self._read()
+                entry = manifest.get(origin)
+                if not entry or entry.get('stamp') != binary_key(entry.get('path', '')):
+                    entry = probe_pandoc(origin)
+                    manifest[origin] = entry
+                    self._write(manifest)
+                self._entry = entry
+            return self._entry
+    
+    def clear(self):
+        """Forget the resolved binary, in memory and on disk."""
+        with self._lock:
+            self._entry = None
+            if os.path.exists(self.manifest_file):
+                os.remove(self.manifest_file)
+    
+    def _read(self) -> dict:
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _write(self, manifest: dict):
+        tmp_file = f"{self.manifest_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(manifest, f)
+            os.replace(tmp_file, self.manifest_file)
+        except OSError as e:
+            # The manifest is an optimization; failing to write it is not fatal
+            print(f"Could not write pandoc manifest: {e}")
+
+
+def probe_pandoc(pandoc_path: str = '') -> dict:
+    """
+    Run a pandoc binary to find its version and features.
+    
+    Args:
+        pandoc_path: Pandoc executable, or '' to let pypandoc search for one
+        
+    Raises:
+        OSError: If pandoc cannot be found or run
+    """
+    with stage('pandoc_discovery'):
+        if pandoc_path:
+            path = os.path.expanduser(pandoc_path)
+        else:
+            # Imported directly: going through the lazy proxy would run the
+            # import hooks, which wait for the manifest being resolved here
+            path = importlib.import_module('pypandoc').get_pandoc_path()
+    with stage('pandoc_startup'):
+        try:
+            output = subprocess.run([path, '--version'], capture_output=True, text=True,
+                                    check=True, creationflags=CREATION_FLAGS).stdout
+        except subprocess.CalledProcessError as e:
+            raise OSError(f"Could not run pandoc at {path}: {e}") from e
+    
+    lines = output.splitlines()
+    version = next((token for token in (lines[0].split() if lines else [])
+                    if re.match(r'^\d+(\.\d+)+$', token)), None)
+    if version is None:
+        raise OSError(f"Could not read the version of pandoc at {path}")
+    fields = dict(line.split(':', 1) for line in lines[1:] if ':' in line)
+    features = [token[1:] for token in fields.get('Features', '').split() if token.startswith('+')]
+    return {'path': path, 'version': version, 'features': sorted(features),
+            'scripting_engine': fields.get('Scripting engine', '').strip() or None,
+            'stamp': binary_key(path)}
+
+
+def binary_key(pandoc_path: str) -> str:
+    """
+    Build a key identifying a specific pandoc binary.
+    
+    The key changes whenever the binary is replaced or upgraded in place.
+    """
+    resolved = os.path.realpath(_which(pandoc_path))
     try:
-        return pypandoc.get_pandoc_version()
-    except Exception as e:
-        print(f"Could not get pandoc version: {e}")
-        return "Unknown"
+        stat = os.stat(resolved)
+    except OSError:
+        return resolved
+    return f"{resolved}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def _which(pandoc_path: str) -> str:
+    """Resolve a bare command name such as 'pandoc' against PATH."""
+    if os.path.dirname(pandoc_path):
+        return os.path.expanduser(pandoc_path)
+    return shutil.which(pandoc_path) or pandoc_path
+
+
+# Shared manifest used by everything in this process
+manifest = PandocManifest()
+
+
+def resolve_pandoc() -> dict:
+    """Get the pandoc binary in use from the shared manifest. See PandocManifest.resolve."""
+    return manifest.resolve()
+
+
+def _seed_pypandoc(module):
+    """Hand the resolved pandoc to pypandoc, so it skips its own search."""
+    try:
+        entry = resolve_pandoc()
+    except OSError:
+        return  # pypandoc reports a missing pandoc itself
+    # pypandoc remembers the pandoc it found in these module globals
+    for name, value in (('__pandoc_path', entry['path']), ('__version', entry['version'])):
+        if name in vars(module) and vars(module)[name] is None:
+            setattr(module, name, value)
+
+
+after_import('pypandoc', _seed_pypandoc)
+
+
+def get_pandoc_version(instrumentation=None):
+    """
+    Get the version of pandoc being used.
+    
+    Args:
+        instrumentation: Optional Instrumentation that records how long
+            locating pandoc and asking it for its version take
+    """
+    with _trace(instrumentation, 'pandoc_version'):
+        try:
+            version = resolve_pandoc()['version']
+            annotate(pandoc_version=version)
+            return version
+        except Exception as e:
+            print(f"Could not get pandoc version: {e}")
+            annotate(exit_status=1, error=str(e))
+            return "Unknown"
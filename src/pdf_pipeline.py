@@ -0,0 +1,410 @@
+"""
+Faster PDF output through a LaTeX engine.
+
+Pandoc's PDF output starts the LaTeX engine from scratch in a fresh
+temporary directory on every call: the preamble's packages and fonts are
+loaded again and every pass is repeated. PdfPipeline compiles pandoc's
+LaTeX output itself instead:
+
+    - The preamble is dumped into a precompiled format once (pdflatex with
+      the mylatexformat package) and reused by every document with the same
+      preamble.
+    - Each export runs in a working directory of its own, seeded with the
+      auxiliary files of the last export to the same output file, so an
+      unchanged or lightly edited document usually needs a single pass.
+    - Long documents are split at headings and the pieces are
+      compiled in parallel, then merged. Page, footnote, figure and table
+      counters are carried across pieces; every piece starts on a new page.
+      Documents with a table of contents, cross-references or citations are
+      always compiled in one piece.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from pandoc_setup import CREATION_FLAGS, get_cache_dir
+
+
+# LaTeX engines pandoc supports that this pipeline can drive
+ENGINES = ('pdflatex', 'xelatex', 'lualatex')
+
+# Counters carried from one piece of a split document to the next
+CARRIED_COUNTERS = ('page', 'footnote', 'figure', 'table')
+
+# Headings a document can be split at
+SPLIT_PATTERN = re.compile(r'^\\(?:part|chapter|section|subsection)\*?[{\[]', re.MULTILINE)
+# Commands that need the whole document in one piece
+UNSPLITTABLE_PATTERN = re.compile(r'\\(?:tableofcontents|listoffigures|listoftables'
+                                  r'|ref|pageref|autoref|hyperref|cite\w*|printbibliography)\b')
+# Lines from which the preamble is run on every compile instead of dumped
+# into the format: hyperref and friends do not survive format dumping
+UNDUMPABLE_PATTERN = re.compile(r'^.*\\usepackage(?:\[[^\]]*\])?\{(?:bookmark|hyperref)\}'
+                                r'|^.*\{bookmark\.sty\}', re.MULTILINE)
+COUNTERS_PATTERN = re.compile(r'^OMVANDLARE-COUNTERS: (.*)$', re.MULTILINE)
+# Files whose changes mean another pass is needed
+PASS_FILE_EXTENSIONS = ('.aux', '.toc', '.out', '.lof', '.lot')
+
+
+class PdfPipeline:
+    """Compiles pandoc's standalone LaTeX output to PDF."""
+
+    def __init__(self, engine: str = 'pdflatex', work_dir: Optional[str] = None,
+                 jobs: Optional[int] = None, split_threshold: int = 200 * 1024,
+                 precompile: bool = True, max_passes: int = 3):
+        """
+        Initialize the pipeline.
+
+        Args:
+            engine: LaTeX engine to run ('pdflatex', 'xelatex' or 'lualatex')
+            work_dir: Directory for formats and working directories
+                (default: 'pdf' in the cache directory)
+            jobs: Pieces of a long document compiled at once (default: CPU count)
+            split_threshold: Documents whose body is at least this many
+                characters are split into pieces
+            precompile: Dump the preamble into a format; only pdflatex supports
+                this, as XeTeX and LuaTeX cannot dump loaded fonts
+            max_passes: Maximum engine runs per document or piece
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unsupported PDF engine: {engine}")
+        self.engine = engine
+        self.jobs = jobs or os.cpu_count() or 1
+        self.split_threshold = split_threshold
+        self.precompile = precompile and engine == 'pdflatex'
+        self.max_passes = max_passes
+        self._work_dir = work_dir
+        self._failed_formats = set()
+        self._lock = threading.Lock()
+
+    @property
+    def work_dir(self) -> str:
+        """Directory for formats and working directories."""
+        if self._work_dir is None:
+            self._work_dir = os.path.join(get_cache_dir(), 'pdf')
+        os.makedirs(self._work_dir, exist_ok=True)
+        return self._work_dir
+
+    @property
+    def media_dir(self) -> str:
+        """Directory pandoc should extract images to (see --extract-media)."""
+        return os.path.join(self.work_dir, 'media')
+
+    def is_available(self) -> bool:
+        """Whether the LaTeX engine is installed."""
+        return shutil.which(self.engine) is not None
+
+    def compile(self, latex: str, output_file: str) -> str:
+        """
+        Compile a standalone LaTeX document to PDF.
+
+        Args:
+            latex: Standalone LaTeX, as written by pandoc with --standalone
+            output_file: Path of the PDF to write
+
+        Returns:
+            The output file path
+
+        Raises:
+            RuntimeError: If the engine is missing or the document fails to compile
+        """
+        if not self.is_available():
+            raise RuntimeError(f"{self.engine} not found. Please install a LaTeX "
+                               f"distribution or select a different PDF engine")
+        preamble, body = split_document(latex)
+        fmt = self._format(preamble) if self.precompile else None
+        if fmt:
+            # The rest of the preamble after the marker runs on every compile
+            preamble = _dumpable(preamble)
+
+        # Every export gets its own working directory, so concurrent exports
+        # and retries of the same output never share one. The auxiliary files
+        # of the last successful export to this output file are copied in.
+        jobs_dir = os.path.join(self.work_dir, 'jobs')
+        os.makedirs(jobs_dir, exist_ok=True)
+        job = hashlib.sha256(os.path.abspath(output_file).encode('utf-8')).hexdigest()[:16]
+        last_dir = os.path.join(jobs_dir, job)
+        job_dir = tempfile.mkdtemp(prefix=f'{job}.{os.getpid()}.', dir=jobs_dir)
+        try:
+            _seed(last_dir, job_dir)
+            pieces = []
+            if len(body) >= self.split_threshold and self.jobs > 1 \
+                    and not UNSPLITTABLE_PATTERN.search(body):
+                pieces = plan_pieces(body, self.jobs)
+            if len(pieces) > 1:
+                pdf = self._compile_pieces(preamble, pieces, fmt, job_dir)
+            else:
+                source = f'{preamble}\\begin{{document}}{body}\\end{{document}}\n'
+                pdf = self._run(source, fmt, os.path.join(job_dir, 'single'))
+            shutil.copyfile(pdf, output_file)
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        _publish(job_dir, last_dir)
+        return output_file
+
+    def missing_media(self, latex: str) -> List[str]:
+        """
+        Images in media_dir that LaTeX refers to but that no longer exist.
+
+        LaTeX converted with --extract-media (e.g. from the conversion cache)
+        is only complete while the extracted images are still in place.
+        """
+        prefixes = {self.media_dir, _tex_path(self.media_dir)}
+        pattern = '|'.join(re.escape(prefix) for prefix in prefixes)
+        paths = re.findall(rf'(?:{pattern})[/\\][^{{}}]+', latex)
+        return [path for path in paths if not os.path.exists(path)]
+
+    def _compile_pieces(self, preamble: str, pieces: List[str], fmt: Optional[str],
+                        job_dir: str) -> str:
+        """Compile pieces in parallel with carried counters and merge them."""
+        # How far each piece advances the counters, by piece content, from earlier runs
+        deltas_file = os.path.join(job_dir, 'counters.json')
+        try:
+            with open(deltas_file, 'r', encoding='utf-8') as f:
+                known = json.load(f)
+        except (OSError, ValueError):
+            known = {}
+        keys = [hashlib.sha256(piece.encode('utf-8')).hexdigest() for piece in pieces]
+        deltas = [known.get(key) for key in keys]
+
+        def compile_round(indices, starts):
+            def compile_piece(index):
+                source = _piece_source(preamble, pieces[index], starts[index])
+                pdf = self._run(source, fmt, os.path.join(job_dir, f'piece-{index}'))
+                return pdf, _read_counters(pdf)
+            with ThreadPoolExecutor(max_workers=min(self.jobs, len(indices))) as executor:
+                return dict(zip(indices, executor.map(compile_piece, indices)))
+
+        # Unknown pieces are assumed not to advance the counters; the pieces
+        # after them are compiled again once the real values are known
+        used_starts = _starts(deltas)
+        results = compile_round(list(range(len(pieces))), used_starts)
+        for index, (_, counters) in results.items():
+            deltas[index] = {name: counters[name] - used_starts[index][name]
+                             for name in CARRIED_COUNTERS}
+        starts = _starts(deltas)
+        stale = [index for index in range(len(pieces)) if starts[index] != used_starts[index]]
+        if stale:
+            results.update(compile_round(stale, starts))
+
+        known = dict(zip(keys, deltas))
+        with open(deltas_file, 'w', encoding='utf-8') as f:
+            json.dump(known, f)
+        merged = os.path.join(job_dir, 'merged.pdf')
+        self._merge([results[index][0] for index in range(len(pieces))], merged)
+        return merged
+
+    def _run(self, source: str, fmt: Optional[str], directory: str) -> str:
+        """Run the engine in a working directory until the auxiliary files settle."""
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'document.tex'), 'w', encoding='utf-8') as f:
+            f.write(source)
+
+        args = [self.engine, '-interaction=nonstopmode', '-halt-on-error']
+        if fmt:
+            args.append(f'-fmt={fmt}')
+        args.append('document.tex')
+        for _ in range(self.max_passes):
+            before = _pass_files(directory)
+            result = subprocess.run(args, cwd=directory, stdin=subprocess.DEVNULL,
+                                    capture_output=True, creationflags=CREATION_FLAGS)
+            if result.returncode != 0:
+                raise RuntimeError(f"{self.engine} failed: {_log_errors(directory, result)}")
+            if _pass_files(directory) == before:
+                break
+        return os.path.join(directory, 'document.pdf')
+
+    def _format(self, preamble: str) -> Optional[str]:
+        """Return the precompiled format for a preamble, building it on first use."""
+        key = hashlib.sha256(f'{self.engine}\0{preamble}'.encode('utf-8')).hexdigest()[:20]
+        format_dir = os.path.join(self.work_dir, 'formats')
+        path = os.path.join(format_dir, f'{key}.fmt')
+        with self._lock:
+            if os.path.exists(path):
+                return path
+            if key in self._failed_formats:
+                return None
+
+            os.makedirs(format_dir, exist_ok=True)
+            with open(os.path.join(format_dir, f'{key}.tex'), 'w', encoding='utf-8') as f:
+                f.write(_dumpable(preamble) + '\\begin{document}\n\\end{document}\n')
+            result = subprocess.run([self.engine, '-ini', f'-jobname={key}',
+                                     '-interaction=nonstopmode', f'&{self.engine}',
+                                     'mylatexformat.ltx', f'{key}.tex'],
+                                    cwd=format_dir, stdin=subprocess.DEVNULL,
+                                    capture_output=True, creationflags=CREATION_FLAGS)
+            if result.returncode != 0 or not os.path.exists(path):
+                # Usually mylatexformat is not installed; compile without a format
+                print(f"Could not precompile LaTeX preamble, continuing without: "
+                      f"{_log_errors(format_dir, result, f'{key}.log')}")
+                self._failed_formats.add(key)
+                return None
+            return path
+
+    def _merge(self, pdfs: List[str], output_file: str):
+        """Concatenate PDFs with the first merge tool found."""
+        if shutil.which('qpdf'):
+            args = ['qpdf', '--empty', '--pages', *pdfs, '--', output_file]
+        elif shutil.which('pdfunite'):
+            args = ['pdfunite', *pdfs, output_file]
+        elif shutil.which('gs'):
+            args = ['gs', '-dBATCH', '-dNOPAUSE', '-dQUIET', '-sDEVICE=pdfwrite',
+                    f'-sOutputFile={output_file}', *pdfs]
+        else:
+            # Fall back to including the pages into a new document with pdfpages
+            directory = os.path.join(os.path.dirname(output_file), 'merge')
+            pages = ''.join(f'\\includepdf[pages=-]{{{_tex_path(pdf)}}}\n' for pdf in pdfs)
+            source = ('\\documentclass{article}\n\\usepackage{pdfpages}\n'
+                      f'\\begin{{document}}\n{pages}\\end{{document}}\n')
+            shutil.copyfile(self._run(source, None, directory), output_file)
+            return
+        result = subprocess.run(args, stdin=subprocess.DEVNULL, capture_output=True,
+                                creationflags=CREATION_FLAGS)
+        # qpdf exits with 3 for warnings
+        if result.returncode not in (0, 3) or not os.path.exists(output_file):
+            raise RuntimeError(f"Merging PDFs failed: "
+                               f"{result.stderr.decode('utf-8', errors='replace').strip()}")
+
+
+def split_document(latex: str) -> Tuple[str, str]:
+    """
+    Split a standalone LaTeX document into its preamble and body.
+
+    Returns:
+        Tuple of (everything before \\begin{document}, the text between
+        \\begin{document} and \\end{document})
+
+    Raises:
+        ValueError: If the document is not standalone LaTeX
+    """
+    start = latex.find('\\begin{document}')
+    end = latex.rfind('\\end{document}')
+    if start < 0 or end < start:
+        raise ValueError("Not a standalone LaTeX document; convert with --standalone")
+    return latex[:start], latex[start + len('\\begin{document}'):end]
+
+
+def plan_pieces(body: str, pieces: int) -> List[str]:
+    """
+    Split a document body at headings into about equally large pieces.
+
+    Text before the first section (title, abstract) stays with the first piece.
+
+    Returns:
+        The pieces in order; a single piece if the body has no headings
+    """
+    starts = [match.start() for match in SPLIT_PATTERN.finditer(body) if match.start() > 0]
+    target = len(body) / pieces
+    result = []
+    begin = 0
+    for start in starts:
+        if start - begin >= target and len(result) < pieces - 1:
+            result.append(body[begin:start])
+            begin = start
+    result.append(body[begin:])
+    return result
+
+
+def _piece_source(preamble: str, piece: str, starts: Dict[str, int]) -> str:
+    """A standalone document for one piece that reports its counters at the end."""
+    setup = ''.join(f'\\setcounter{{{name}}}{{{value}}}' for name, value in starts.items())
+    report = ';'.join(f'{name}=\\the\\value{{{name}}}' for name in CARRIED_COUNTERS)
+    return (f'{preamble}\\begin{{document}}\n{setup}\n{piece}\n'
+            f'\\clearpage\\typeout{{OMVANDLARE-COUNTERS: {report}}}\n\\end{{document}}\n')
+
+
+def _starts(deltas: List[Optional[Dict[str, int]]]) -> List[Dict[str, int]]:
+    """Counter values each piece starts from, given how much each piece advances them."""
+    current = {name: 0 for name in CARRIED_COUNTERS}
+    current['page'] = 1
+    starts = []
+    for delta in deltas:
+        starts.append(dict(current))
+        for name, value in (delta or {}).items():
+            current[name] += value
+    return starts
+
+
+def _read_counters(pdf: str) -> Dict[str, int]:
+    """Read the counters a piece reported to its log file."""
+    with open(os.path.splitext(pdf)[0] + '.log', 'r', encoding='utf-8', errors='replace') as f:
+        match = COUNTERS_PATTERN.search(f.read())
+    if not match:
+        raise RuntimeError("LaTeX log is missing the counters of a document piece")
+    return {name: int(value) for name, value in
+            (item.split('=') for item in match.group(1).strip().split(';'))}
+
+
+def _dumpable(preamble: str) -> str:
+    """Mark where the part of the preamble that cannot be dumped starts."""
+    match = UNDUMPABLE_PATTERN.search(preamble)
+    if not match:
+        return preamble
+    return f'{preamble[:match.start()]}\\endofdump\n{preamble[match.start():]}'
+
+
+def _seed(source: str, target: str):
+    """Copy the auxiliary files of an earlier export into a new working directory."""
+    for directory, _, files in os.walk(source):
+        relative = os.path.relpath(directory, source)
+        for name in files:
+            if name == 'counters.json' or name.endswith(PASS_FILE_EXTENSIONS):
+                os.makedirs(os.path.join(target, relative), exist_ok=True)
+                try:
+                    shutil.copyfile(os.path.join(directory, name),
+                                    os.path.join(target, relative, name))
+                except OSError:
+                    pass  # Replaced by a concurrent export; it only costs a pass
+
+
+def _publish(job_dir: str, last_dir: str):
+    """Make a finished working directory the seed of the next export to the same output."""
+    retired = f'{last_dir}.{os.getpid()}.{uuid.uuid4().hex}.old'
+    try:
+        os.rename(last_dir, retired)
+    except OSError:
+        retired = None  # No earlier export, or another one retired it
+    try:
+        os.rename(job_dir, last_dir)
+    except OSError:
+        # Another export published first; its files are as good a seed
+        shutil.rmtree(job_dir, ignore_errors=True)
+    if retired:
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def _pass_files(directory: str) -> Dict[str, bytes]:
+    """Contents of the auxiliary files whose changes require another pass."""
+    contents = {}
+    for extension in PASS_FILE_EXTENSIONS:
+        try:
+            with open(os.path.join(directory, 'document' + extension), 'rb') as f:
+                contents[extension] = f.read()
+        except OSError:
+            pass
+    return contents
+
+
+def _log_errors(directory: str, result: subprocess.CompletedProcess,
+                log_name: str = 'document.log') -> str:
+    """The error lines of a LaTeX log, or the process output if there are none."""
+    try:
+        with open(os.path.join(directory, log_name), 'r', encoding='utf-8', errors='replace') as f:
+            errors = [line.rstrip() for line in f if line.startswith('!')]
+    except OSError:
+        errors = []
+    if errors:
+        return '\n'.join(errors)
+    return result.stdout.decode('utf-8', errors='replace').strip()[-2000:]
+
+
+def _tex_path(path: str) -> str:
+    return path.replace(os.sep, '/')
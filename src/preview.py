@@ -0,0 +1,202 @@
+"""
+Incremental live preview rendering.
+
+The document is split into top-level blocks (headings, paragraphs, fenced
+code blocks, ...). Rendered HTML is cached per block, so after an edit only
+the blocks that changed are converted again, all in a single pandoc call.
+"""
+
+import re
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import List, Tuple
+
+from converter import DocumentConverter
+from fast_markdown import render_html
+
+
+# Raw HTML comment placed between blocks so one pandoc run can render many
+# blocks and the output can be split back apart
+CHUNK_SEPARATOR = '<!--omvandlare-preview-split-->'
+
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+HEADING_PATTERN = re.compile(r'^ {0,3}#{1,6}(\s|$)')
+
+
+def split_blocks(text: str) -> List[str]:
+    """
+    Split Markdown into independently renderable top-level blocks.
+
+    Blocks are separated by blank lines and ATX headings are blocks of their own.
+    Fenced code blocks are never split, and indented lines following a
+    blank line (list item continuations, indented code) stay with the block
+    before them.
+    """
+    blocks = []
+    current = []
+    fence = None
+
+    def flush():
+        if current:
+            blocks.append('\n'.join(current))
+            current.clear()
+
+    for line in text.splitlines():
+        if fence:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+
+        match = FENCE_PATTERN.match(line)
+        if match:
+            fence = match.group(1)[0] * 3
+            current.append(line)
+        elif not line.strip():
+            flush()
+        elif HEADING_PATTERN.match(line) and not current:
+            # Pandoc only starts a heading after a blank line
+            blocks.append(line)
+        elif line[:1] in (' ', '\t') and not current and blocks:
+            # Continuation of the previous block across a blank line
+            current.extend(blocks.pop().split('\n') + [''])
+            current.append(line)
+        else:
+            current.append(line)
+    flush()
+    return blocks
+
+
+class IncrementalPreview:
+    """Renders Markdown to HTML, reconverting only blocks that changed."""
+
+    def __init__(self, converter: DocumentConverter, max_cached_blocks: int = 2048):
+        """
+        Initialize the renderer.
+
+        Args:
+            converter: Converter used for markdown_to_html
+            max_cached_blocks: Number of rendered blocks to keep
+        """
+        self.converter = converter
+        self.max_cached_blocks = max_cached_blocks
+        self._rendered = OrderedDict()
+        self.last_converted = 0
+
+    def render(self, text: str) -> str:
+        """Render a whole document, reusing cached renders of unchanged blocks."""
+        blocks = split_blocks(text)
+        missing = list(OrderedDict.fromkeys(block for block in blocks
+                                            if block not in self._rendered))
+        self.last_converted = len(missing)
+        if missing:
+            for block, html in zip(missing, self._convert_blocks(missing)):
+                self._rendered[block] = html
+
+        parts = []
+        for block in blocks:
+            self._rendered.move_to_end(block)
+            parts.append(self._rendered[block])
+        while len(self._rendered) > self.max_cached_blocks:
+            self._rendered.popitem(last=False)
+        return '\n'.join(parts)
+
+    def _convert_blocks(self, blocks: List[str]) -> List[str]:
+        """Convert several blocks, rendering simple ones in-process if enabled."""
+        if not self.converter.native_markdown:
+            return self._convert_with_pandoc(blocks)
+        rendered = [render_html(block) for block in blocks]
+        pending = [block for block, html in zip(blocks, rendered) if html is None]
+        converted = iter(self._convert_with_pandoc(pending) if pending else [])
+        return [html.strip() if html is not None else next(converted) for html in rendered]
+
+    def _convert_with_pandoc(self, blocks: List[str]) -> List[str]:
+        """Convert several blocks with one pandoc run."""
+        separator = f'\n\n{CHUNK_SEPARATOR}\n\n'
+        html = self.converter.markdown_to_html(separator.join(blocks))
+        parts = [part.strip() for part in html.split(CHUNK_SEPARATOR)]
+        if len(parts) == len(blocks):
+            return parts
+        # A block swallowed or produced a separator; render one at a time
+        return [self.converter.markdown_to_html(block).strip() for block in blocks]
+
+
+class HtmlTextSegments(HTMLParser):
+    """
+    Turn pandoc's HTML into (text, tags) segments for a Tk Text widget.
+
+    Only the handful of elements pandoc produces for typical chat-style
+    Markdown get special styling; everything else is shown as plain text.
+    """
+
+    BLOCK_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'blockquote',
+                  'ul', 'ol', 'li', 'table', 'tr', 'hr', 'div'}
+    # Blocks followed by an empty line, as paragraphs are in a document
+    SPACED_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'pre', 'table', 'blockquote',
+                   'ul', 'ol'}
+    STYLE_TAGS = {'h1': 'h1', 'h2': 'h2', 'h3': 'h3', 'h4': 'h4', 'h5': 'h4', 'h6': 'h4',
+                  'strong': 'bold', 'b': 'bold', 'em': 'italic', 'i': 'italic',
+                  'code': 'code', 'pre': 'code', 'blockquote': 'quote', 'a': 'link'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.segments = []
+        self._styles = []
+        self._lists = []
+        self._line_start = True
+
+    @classmethod
+    def parse(cls, html: str) -> List[Tuple[str, tuple]]:
+        """Parse HTML into a list of (text, tags) segments."""
+        parser = cls()
+        parser.feed(html)
+        parser.close()
+        return parser.segments
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.BLOCK_TAGS:
+            self._newline()
+        if tag in ('ul', 'ol'):
+            self._lists.append([tag, 0])
+        elif tag == 'li' and self._lists:
+            self._lists[-1][1] += 1
+            kind, number = self._lists[-1]
+            marker = f"{number}. " if kind == 'ol' else "• "
+            self._append("  " * (len(self._lists) - 1) + marker, ())
+            self._line_start = True
+        elif tag == 'br':
+            self._newline(force=True)
+        elif tag == 'td' or tag == 'th':
+            self._append("\t", ())
+        if tag in self.STYLE_TAGS:
+            self._styles.append(self.STYLE_TAGS[tag])
+
+    def handle_endtag(self, tag):
+        if tag in self.STYLE_TAGS and self.STYLE_TAGS[tag] in self._styles:
+            # Remove the innermost matching style
+            index = len(self._styles) - 1 - self._styles[::-1].index(self.STYLE_TAGS[tag])
+            del self._styles[index]
+        if tag in ('ul', 'ol') and self._lists:
+            self._lists.pop()
+        if tag in self.BLOCK_TAGS:
+            self._newline()
+        if tag in self.SPACED_TAGS and not self._lists:
+            self._newline(force=True)
+
+    def handle_data(self, data):
+        if 'code' not in self._styles:
+            data = re.sub(r'\s+', ' ', data)
+            if self._line_start:
+                data = data.lstrip()
+        if data:
+            self._append(data, tuple(self._styles))
+            self._line_start = False
+
+    def _append(self, text: str, tags: tuple):
+        self.segments.append((text, tags))
+
+    def _newline(self, force: bool = False):
+        if force or not self._line_start:
+            if self.segments:
+                self._append("\n", ())
+            self._line_start = True
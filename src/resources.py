@@ -0,0 +1,342 @@
+"""
+Local cache for images referenced from Markdown documents.
+
+Exports to DOCX, ODT, EPUB and PDF embed every image, so pandoc reads (or
+downloads) each one again on every export. ResourceCache resolves the image
+references of a document once into a content-addressed store and rewrites
+the document to point at the cached copies, so later exports only read
+local files and identical images are stored once.
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+from pandoc_setup import get_cache_dir
+
+
+# Input formats whose image references rewrite() understands
+MARKDOWN_FORMATS = {'markdown', 'md', 'gfm', 'commonmark', 'commonmark_x',
+                    'markdown_strict', 'markdown_phpextra', 'markdown_mmd'}
+
+# ![alt](destination "title") and <img src="destination">
+MARKDOWN_IMAGE_PATTERN = re.compile(r'(!\[[^\]\n]*\]\(\s*)(<[^>\n]+>|[^\s)]+)')
+HTML_IMAGE_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc\s*=\s*)(["\'])([^"\'\n]+)\2',
+                                re.IGNORECASE)
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+EXTENSION_PATTERN = re.compile(r'^\.[A-Za-z0-9]{1,5}$')
+
+INDEX_FILE = 'index.json'
+
+
+class ResourceCache:
+    """
+    Content-addressed store of images referenced from documents.
+
+    Remote images are downloaded once; local images are copied once per
+    version of the file (path, size and modification time). Files are named
+    by a hash of their content and the store is kept under a size limit by
+    evicting the least recently used files.
+    """
+
+    def __init__(self, store_dir: Optional[str] = None,
+                 store_limit: int = 256 * 1024 * 1024,
+                 max_resource_size: int = 32 * 1024 * 1024,
+                 timeout: float = 15.0, max_fetches: int = 8):
+        """
+        Initialize the cache.
+
+        Args:
+            store_dir: Directory of the store (default: 'resources' in the cache directory)
+            store_limit: Maximum size of the store in bytes
+            max_resource_size: Larger images are left for pandoc to load itself
+            timeout: Timeout in seconds for downloading one image
+            max_fetches: Images resolved at once
+        """
+        self.store_limit = store_limit
+        self.max_resource_size = max_resource_size
+        self.timeout = timeout
+        self.max_fetches = max_fetches
+        self._store_dir = store_dir
+        self._index = None
+        self._store_size = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    @property
+    def store_dir(self) -> str:
+        """Directory of the store."""
+        if self._store_dir is None:
+            self._store_dir = os.path.join(get_cache_dir(), 'resources')
+        os.makedirs(self._store_dir, exist_ok=True)
+        return self._store_dir
+
+    def rewrite(self, text: str, base_dir: Optional[str] = None) -> str:
+        """
+        Point the images of a Markdown document at cached copies.
+
+        References that cannot be resolved (missing files, failed or too
+        large downloads, data URIs) are left unchanged. Code blocks are not
+        touched.
+
+        Args:
+            text: Markdown text
+            base_dir: Directory relative image paths are resolved against
+                (default: the current directory)
+
+        Returns:
+            The text with resolved image references replaced by local paths
+        """
+        references = image_references(text)
+        if not references:
+            return text
+
+        with ThreadPoolExecutor(max_workers=min(self.max_fetches, len(references))) as executor:
+            resolved = dict(zip(references, executor.map(
+                lambda reference: self.resolve(reference, base_dir), references)))
+
+        def markdown_image(match):
+            path = resolved.get(_strip_brackets(match.group(2)))
+            return match.group(0) if path is None else f'{match.group(1)}<{_destination(path)}>'
+
+        def html_image(match):
+            path = resolved.get(match.group(3))
+            if path is None:
+                return match.group(0)
+            return f'{match.group(1)}{match.group(2)}{_destination(path)}{match.group(2)}'
+
+        parts = []
+        for segment, is_code in _split_code_blocks(text):
+            if not is_code:
+                segment = MARKDOWN_IMAGE_PATTERN.sub(markdown_image, segment)
+                segment = HTML_IMAGE_PATTERN.sub(html_image, segment)
+            parts.append(segment)
+        return ''.join(parts)
+
+    def resolve(self, reference: str, base_dir: Optional[str] = None) -> Optional[str]:
+        """
+        Resolve one image reference to a path in the store.
+
+        Args:
+            reference: URL or file path of the image
+            base_dir: Directory relative paths are resolved against
+
+        Returns:
+            Path of the cached copy, or None if the image cannot be cached
+        """
+        parts = urlsplit(reference)
+        scheme = parts.scheme.lower()
+        if scheme in ('http', 'https'):
+            key = reference
+            load = lambda: self._download(reference)
+        elif scheme in ('', 'file') or len(scheme) == 1:  # One letter: a Windows drive
+            file_path = unquote(parts.path) if scheme == 'file' else reference
+            file_path = os.path.abspath(os.path.join(base_dir or os.getcwd(), file_path))
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                return None
+            if stat.st_size > self.max_resource_size:
+                return None
+            key = f'file:{file_path}:{stat.st_size}:{stat.st_mtime_ns}'
+            load = lambda: _read_file(file_path)
+        else:
+            return None
+
+        with self._lock:
+            cached = self._lookup(key)
+            if cached is not None:
+                return cached
+            # Several documents may reference the same image at once
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = Future()
+        if not owner:
+            return pending.result()
+
+        path = None
+        try:
+            loaded = load()
+            if loaded is not None:
+                path = self._store(key, *loaded)
+        except (OSError, ValueError):
+            path = None
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set_result(path)
+        return path
+
+    def clear(self):
+        """Remove all cached images."""
+        with self._lock:
+            for path, _, _ in self._store_entries():
+                os.remove(path)
+            self._index = {}
+            self._store_size = 0
+            self._save_index()
+
+    def _download(self, url: str) -> Optional[Tuple[bytes, str]]:
+        """Download an image, returning (data, extension) or None if too large."""
+        import http.client  # Imported on first use to keep startup fast
+        import urllib.request
+
+        request = urllib.request.Request(url, headers={'User-Agent': 'erics-omvandlare'})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read(self.max_resource_size + 1)
+                content_type = response.headers.get_content_type()
+        except http.client.HTTPException:
+            return None
+        if len(data) > self.max_resource_size:
+            return None
+
+        extension = os.path.splitext(unquote(urlsplit(url).path))[1]
+        if not EXTENSION_PATTERN.match(extension):
+            extension = mimetypes.guess_extension(content_type) or ''
+        return data, extension.lower()
+
+    def _lookup(self, key: str) -> Optional[str]:
+        """Return the cached copy for a reference if it is still in the store."""
+        name = self._load_index().get(key)
+        if name is None:
+            return None
+        path = os.path.join(self.store_dir, name)
+        try:
+            # Refresh the mtime so eviction is least-recently-used
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def _store(self, key: str, data: bytes, extension: str) -> str:
+        """Add content to the store and remember it for the reference."""
+        name = hashlib.sha256(data).hexdigest() + extension
+        path = os.path.join(self.store_dir, name)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                if self._store_size is None:
+                    self._store_size = sum(size for _, size, _ in self._store_entries())
+                else:
+                    self._store_size += len(data)
+
+            self._load_index()[key] = name
+            if self._store_size is not None and self._store_size > self.store_limit:
+                self._evict()
+            self._save_index()
+        return path
+
+    def _load_index(self) -> Dict[str, str]:
+        """Mapping of reference keys to file names in the store, loaded on first use."""
+        if self._index is None:
+            try:
+                with open(os.path.join(self.store_dir, INDEX_FILE), 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        path = os.path.join(self.store_dir, INDEX_FILE)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._index, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write resource cache index: {e}")
+
+    def _store_entries(self) -> list:
+        """List (path, size, mtime) for every file in the store."""
+        entries = []
+        for entry in os.scandir(self.store_dir):
+            if entry.is_file() and entry.name != INDEX_FILE and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """Delete least recently used files until the store is under its size limit."""
+        entries = sorted(self._store_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = set()
+        # The newest file is the one just stored; always keep it
+        for path, size, _ in entries[:-1]:
+            if total <= self.store_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed.add(os.path.basename(path))
+            total -= size
+        self._store_size = total
+        self._index = {key: name for key, name in self._index.items() if name not in removed}
+
+
+def image_references(text: str) -> List[str]:
+    """
+    List the images a Markdown document references, outside code blocks.
+
+    Returns:
+        URLs and paths as written in the document, each listed once, in order
+    """
+    references = {}
+    for segment, is_code in _split_code_blocks(text):
+        if not is_code:
+            for match in MARKDOWN_IMAGE_PATTERN.finditer(segment):
+                references[_strip_brackets(match.group(2))] = None
+            for match in HTML_IMAGE_PATTERN.finditer(segment):
+                references[match.group(3)] = None
+    return list(references)
+
+
+def _read_file(path: str) -> Tuple[bytes, str]:
+    with open(path, 'rb') as f:
+        return f.read(), os.path.splitext(path)[1].lower()
+
+
+def _strip_brackets(destination: str) -> str:
+    if destination.startswith('<') and destination.endswith('>'):
+        return destination[1:-1]
+    return destination
+
+
+def _destination(path: str) -> str:
+    """Write a path so pandoc reads it as one link destination on every platform."""
+    return path.replace(os.sep, '/')
+
+
+def _split_code_blocks(text: str) -> list:
+    """Split text into (segment, is_code) pieces around fenced code blocks."""
+    segments = []
+    current = []
+    fence = None
+    for line in text.splitlines(keepends=True):
+        match = FENCE_PATTERN.match(line)
+        if fence is None and match:
+            segments.append((''.join(current), False))
+            current = [line]
+            fence = match.group(1)
+        elif fence is not None and match and match.group(1)[0] == fence[0] \
+                and len(match.group(1)) >= len(fence) and not line.strip(fence[0] + ' \n\r\t'):
+            current.append(line)
+            segments.append((''.join(current), True))
+            current = []
+            fence = None
+        else:
+            current.append(line)
+    segments.append((''.join(current), fence is not None))
+    return segments
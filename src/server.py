@@ -0,0 +1,510 @@
+"""
+Local HTTP conversion service.
+
+Tools that need conversions can share one long-running service instead of
+each embedding a DocumentConverter and paying pandoc's startup separately.
+The service is a small asyncio HTTP/1.1 server with JSON endpoints:
+
+    POST /convert/text  {"text": ..., "to": "html", "from": "markdown",
+                         "extra_args": [...], "output_file": ...}
+    POST /convert/file  {"input_file": ..., "to": "docx", "output_file": ...}
+    GET  /health
+
+Any web page open in a browser can send requests to a local port, so
+conversion requests must be JSON and carry the service's token, which is
+generated at every launch and written to a file only the user can read:
+
+    Authorization: Bearer <token>
+
+Only pandoc options that neither read nor write files nor run code are
+accepted in extra_args, and pandoc runs with --sandbox, so documents cannot
+read files either (LaTeX \\input, RST include, org #+INCLUDE, images); PDF
+output, whose LaTeX engine cannot be sandboxed, is refused. Input and output
+files must lie in directories the service was started with; without any,
+only text conversions are served.
+
+Conversions run on a bounded thread pool backed by warm pandoc workers.
+Requests beyond the concurrency limit wait in a bounded queue, and once
+that is full the service answers 429 so clients can back off. Small text
+requests arriving close together are micro-batched onto a single worker,
+and all results go through a shared ConversionCache.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
+
+from converter import ENGINE_POOL, ConversionCache, DocumentConverter
+from pandoc_pool import SANDBOX_FORMATS
+from pandoc_setup import get_cache_dir
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# File the token is written to, in the cache directory
+TOKEN_FILENAME = 'server.token'
+
+# Largest request body accepted, in bytes
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# Most header lines accepted per request; each line is limited to the
+# stream reader's 64 KiB
+MAX_HEADER_LINES = 100
+
+REASONS = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+           404: 'Not Found', 405: 'Method Not Allowed', 413: 'Payload Too Large',
+           415: 'Unsupported Media Type', 422: 'Unprocessable Entity',
+           429: 'Too Many Requests', 431: 'Request Header Fields Too Large',
+           500: 'Internal Server Error'}
+
+# Pandoc options allowed in extra_args: none of them reads or writes files or runs code.
+# Options with a value must be given as --option=value.
+SAFE_FLAGS = {'--standalone', '-s', '--toc', '--table-of-contents', '--number-sections', '-N',
+              '--section-divs', '--html-q-tags', '--ascii', '--reference-links',
+              '--preserve-tabs', '--strip-comments', '--no-highlight', '--mathml', '--mathjax',
+              '--katex', '--webtex', '--gladtex', '--list-tables', '--incremental', '-i'}
+SAFE_VALUE_OPTIONS = {'--toc-depth', '--wrap', '--columns', '--shift-heading-level-by',
+                      '--top-level-division', '--eol', '--tab-stop', '--reference-location',
+                      '--number-offset', '--slide-level', '--markdown-headings',
+                      '--metadata', '--variable', '--title-prefix', '--id-prefix'}
+
+
+class HttpError(Exception):
+    """An error answered with an HTTP status code."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ConversionServer:
+    """Asyncio HTTP service exposing a shared DocumentConverter."""
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 max_concurrency: Optional[int] = None, max_queue: int = 64,
+                 batch_window: float = 0.005, max_batch_size: int = 16,
+                 batch_max_bytes: int = 64 * 1024,
+                 converter: Optional[DocumentConverter] = None,
+                 token: Optional[str] = None, file_roots: Iterable[str] = ()):
+        """
+        Initialize the service.
+
+        Args:
+            host: Interface to bind (default: localhost only)
+            port: Port to listen on, or 0 for any free port
+            max_concurrency: Conversions running at once (default: CPU count)
+            max_queue: Requests allowed to wait for a free slot before the
+                service answers 429
+            batch_window: Seconds to wait for more small requests to batch
+            max_batch_size: Maximum number of requests per batch
+            batch_max_bytes: Text requests up to this size may be batched
+            converter: Converter to use, which must be created with
+                sandbox=True (default: pooled engine with a cache)
+            token: Token clients must send (default: a new random token)
+            file_roots: Directories input and output files may lie in
+
+        Raises:
+            ValueError: If the converter is not sandboxed
+        """
+        if converter is not None and not converter.sandbox:
+            raise ValueError("The service needs a converter created with sandbox=True")
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.batch_max_bytes = batch_max_bytes
+        self.token = token or secrets.token_urlsafe(32)
+        self.file_roots = [os.path.realpath(root) for root in file_roots]
+        self.converter = converter or DocumentConverter(engine=ENGINE_POOL,
+                                                        pool_size=self.max_concurrency,
+                                                        cache=ConversionCache(),
+                                                        sandbox=True)
+        self.stats = {'requests': 0, 'rejected': 0, 'cache_hits': 0, 'batches': 0,
+                      'batched_requests': 0}
+        self._in_flight = 0
+        self._executor = None
+        self._slots = None
+        self._batch_queue = None
+        self._batcher = None
+        self._server = None
+        self._loop = None
+        self._stopping = None
+        self._connections = set()
+
+    async def start(self) -> int:
+        """Start listening and return the bound port."""
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix='omvandlare-convert')
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._batch_queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batcher())
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def serve(self, ready: Optional[threading.Event] = None):
+        """Run until stop() is called. Sets ready once listening."""
+        await self.start()
+        if ready is not None:
+            ready.set()
+        try:
+            await self.wait_stopped()
+        finally:
+            await self.close()
+
+    async def wait_stopped(self):
+        """Wait until stop() is called on a started service."""
+        await self._stopping.wait()
+
+    def stop(self):
+        """Stop a running serve() from any thread."""
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    async def close(self):
+        """Stop listening and release workers."""
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise keep the server open
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._batcher is not None:
+            self._batcher.cancel()
+            self._batcher = None
+        if self._executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._shutdown_workers)
+            self._executor = None
+
+    def _shutdown_workers(self):
+        self._executor.shutdown(wait=True)
+        self.converter.close()
+
+    # HTTP handling
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        """Serve requests on one keep-alive connection."""
+        self._connections.add(writer)
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except HttpError as e:
+                    await self._respond(writer, e.status, {'error': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                status, payload = await self._dispatch(method, path, headers, body)
+                extra = {'Retry-After': '1'} if status == 429 else None
+                await self._respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Read one request, or return None when the client hung up."""
+        line = await _read_line(reader)
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise HttpError(400, "Malformed request line")
+        method, path, _ = parts
+
+        headers = {}
+        for _ in range(MAX_HEADER_LINES + 1):
+            line = await _read_line(reader)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise HttpError(431, "Too many header lines")
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HttpError(400, "Invalid Content-Length")
+        if length > MAX_BODY_SIZE:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method, path.split('?')[0], headers, body
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: dict,
+                       keep_alive: bool = True, extra_headers: Optional[dict] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                   "Content-Type: application/json; charset=utf-8",
+                   f"Content-Length: {len(body)}",
+                   f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        for name, value in (extra_headers or {}).items():
+            headers.append(f"{name}: {value}")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, path: str, headers: dict,
+                        body: bytes) -> Tuple[int, dict]:
+        """Route a request and turn errors into status codes."""
+        routes = {'/convert/text': self._convert_text, '/convert/file': self._convert_file}
+        if path == '/health':
+            if method != 'GET':
+                return 405, {'error': "Use GET"}
+            return 200, {'status': 'ok', 'in_flight': self._in_flight, **self.stats}
+        if path not in routes:
+            return 404, {'error': f"Unknown endpoint: {path}"}
+        if method != 'POST':
+            return 405, {'error': "Use POST"}
+        content_type = headers.get('content-type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            return 415, {'error': "Use Content-Type: application/json"}
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(),
+                                                                 self.token.encode()):
+            return 401, {'error': "Missing or wrong token"}
+
+        self.stats['requests'] += 1
+        if self._in_flight >= self.max_concurrency + self.max_queue:
+            self.stats['rejected'] += 1
+            return 429, {'error': "Server is busy, retry later"}
+
+        self._in_flight += 1
+        try:
+            return 200, await routes[path](_parse_json(body))
+        except HttpError as e:
+            return e.status, {'error': str(e)}
+        except RuntimeError as e:
+            # Pandoc rejected the conversion
+            return 422, {'error': str(e).strip()}
+        except Exception as e:
+            return 500, {'error': f"{type(e).__name__}: {e}"}
+        finally:
+            self._in_flight -= 1
+
+    # Conversions
+
+    async def _convert_text(self, request: dict) -> dict:
+        text = _require(request, 'text', str)
+        output_format = _require(request, 'to', str)
+        input_format = request.get('from') or 'markdown'
+        extra_args = request.get('extra_args') or []
+        output_file = request.get('output_file')
+        if not isinstance(extra_args, list) or not all(isinstance(arg, str) for arg in extra_args):
+            raise HttpError(400, "'extra_args' must be a list of strings")
+        for arg in extra_args:
+            if arg not in SAFE_FLAGS and arg.split('=', 1)[0] not in SAFE_VALUE_OPTIONS:
+                raise HttpError(403, f"Option not allowed: {arg}")
+        if output_file is not None:
+            output_file = self._confine(output_file, 'output_file', parent=True)
+
+        cache = self.converter.cache
+        key = None
+        if cache is not None and not output_file:
+            # As the converter keys its sandboxed results
+            key = cache.make_key(text, output_format, input_format, extra_args + ['--sandbox'])
+            cached = await asyncio.to_thread(_cache_get, cache, key)
+            if cached is not None:
+                self.stats['cache_hits'] += 1
+                return {'output': cached[0], 'messages': cached[1], 'cached': True}
+
+        if self._can_batch(text, output_format, extra_args, output_file):
+            future = self._loop.create_future()
+            self._batch_queue.put_nowait(({'text': text, 'from': input_format,
+                                           'to': output_format, 'sandbox': True}, future))
+            output, messages = await future
+            if key is not None:
+                await asyncio.to_thread(_cache_put, cache, key, output, messages)
+        else:
+            # Cached inside the converter
+            output, messages = await self._run(self.converter.convert_text_with_messages,
+                                               text, output_format, input_format,
+                                               output_file, extra_args)
+        if output_file:
+            return {'output_file': output, 'messages': messages}
+        return {'output': output, 'messages': messages, 'cached': False}
+
+    async def _convert_file(self, request: dict) -> dict:
+        input_file = self._confine(_require(request, 'input_file', str), 'input_file')
+        output_format = _require(request, 'to', str)
+        output_file = request.get('output_file')
+        if output_file is not None:
+            output_file = self._confine(output_file, 'output_file', parent=True)
+        if not os.path.isfile(input_file):
+            raise HttpError(400, f"Input file not found: {input_file}")
+        output = await self._run(self.converter.convert_file, input_file, output_format,
+                                 output_file)
+        if output_file:
+            return {'output_file': output}
+        return {'output': output}
+
+    def _confine(self, path, name: str, parent: bool = False) -> str:
+        """
+        Resolve a client supplied path, which must lie in one of the file roots.
+
+        Args:
+            path: Path from the request
+            name: Request field, for error messages
+            parent: Only the directory has to exist, as for output files
+
+        Raises:
+            HttpError: If the path is invalid or outside the file roots
+        """
+        if not isinstance(path, str) or not path:
+            raise HttpError(400, f"Missing or invalid '{name}'")
+        if not self.file_roots:
+            raise HttpError(403, "File access is disabled; start the service with --allow-dir")
+        # Resolved first, so neither '..' nor symbolic links lead outside a root
+        resolved = os.path.realpath(path)
+        checked = os.path.dirname(resolved) if parent else resolved
+        for root in self.file_roots:
+            if os.path.commonpath([root, checked]) == root:
+                return resolved
+        raise HttpError(403, f"'{name}' is outside the allowed directories")
+
+    def _can_batch(self, text: str, output_format: str, extra_args: list,
+                   output_file: Optional[str]) -> bool:
+        """Check whether a text request is small and simple enough to batch."""
+        pool = self.converter.pool
+        return (pool is not None and not extra_args and not output_file
+                and len(text) <= self.batch_max_bytes and output_format in SANDBOX_FORMATS)
+
+    async def _run(self, function, *args):
+        """Run a blocking conversion on the thread pool once a slot is free."""
+        async with self._slots:
+            return await self._loop.run_in_executor(self._executor, function, *args)
+
+    async def _run_batcher(self):
+        """Collect small requests for a short window and send them as one batch."""
+        while True:
+            batch = [await self._batch_queue.get()]
+            deadline = self._loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._batch_queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Waiting for a slot here keeps the batch growing while workers are busy
+            await self._slots.acquire()
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: list):
+        try:
+            self.stats['batches'] += 1
+            self.stats['batched_requests'] += len(batch)
+            results = await self._loop.run_in_executor(
+                self._executor, self.converter.pool.convert_batch,
+                [request for request, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            self._slots.release()
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+async def _read_line(reader: asyncio.StreamReader) -> bytes:
+    """Read one line of the request head, which must fit the reader's limit."""
+    try:
+        return await reader.readline()
+    except ValueError:
+        # The line overran the limit (asyncio.LimitOverrunError)
+        raise HttpError(431, "Request line or header line too long")
+
+
+def _parse_json(body: bytes) -> dict:
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError as e:
+        raise HttpError(400, f"Invalid JSON: {e}")
+    if not isinstance(request, dict):
+        raise HttpError(400, "Request body must be a JSON object")
+    return request
+
+
+def _require(request: dict, name: str, kind: type):
+    value = request.get(name)
+    if not isinstance(value, kind) or not value:
+        raise HttpError(400, f"Missing or invalid '{name}'")
+    return value
+
+
+def _cache_get(cache: ConversionCache, key: str):
+    """Look up a text result and its messages in the converter's cache layout."""
+    data = cache.get(key)
+    log_data = cache.get(key + '.log')
+    if data is None or log_data is None:
+        return None
+    return data.decode('utf-8'), json.loads(log_data)
+
+
+def _cache_put(cache: ConversionCache, key: str, output: str, messages: list):
+    cache.put(key, output.encode('utf-8'))
+    cache.put(key + '.log', json.dumps(messages).encode('utf-8'))
+
+
+def write_token(token_file: str, token: str):
+    """Write the service token to a file only the current user can read."""
+    os.makedirs(os.path.dirname(os.path.abspath(token_file)), exist_ok=True)
+    tmp_file = f"{token_file}.{os.getpid()}.tmp"
+    fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    os.replace(tmp_file, token_file)
+
+
+def default_token_file() -> str:
+    """Where the service writes its token unless told otherwise."""
+    return os.path.join(get_cache_dir(), TOKEN_FILENAME)
+
+
+def run_server(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+               token_file: Optional[str] = None, **options) -> int:
+    """Run the service in the foreground until interrupted."""
+    server = ConversionServer(host, port, **options)
+    token_file = token_file or default_token_file()
+    write_token(token_file, server.token)
+
+    async def main():
+        await server.start()
+        print(f"Serving conversions on http://{server.host}:{server.port} "
+              f"({server.max_concurrency} workers, queue {server.max_queue})", flush=True)
+        print(f"Token for the Authorization header is in {token_file}", flush=True)
+        try:
+            await server.wait_stopped()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("Stopped.")
+    return 0
@@ -0,0 +1,288 @@
+"""
+Prepared DOCX reference documents.
+
+Pandoc takes styles, numbering, page setup, headers and footers from a
+reference document, but it reads the whole file on every export and copies
+its media into the output. A corporate template full of sample text and
+pictures therefore makes every document larger and slower to write. Each
+reference document is validated once and stored as a stripped copy, with
+the body reduced to its section properties and the media only the body used
+removed. The copies live in the cache directory, indexed by the template's
+path, size and modification time, so later exports and worker processes only
+stat the template.
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import threading
+import zipfile
+from typing import Callable, Dict, Optional
+from xml.etree import ElementTree
+
+from pandoc_setup import CREATION_FLAGS, get_cache_dir, lazy_import
+
+
+pypandoc = lazy_import('pypandoc')
+
+
+INDEX_FILENAME = 'index.json'
+
+# Parts pandoc needs to find in a reference document
+REQUIRED_PARTS = ('[Content_Types].xml', 'word/document.xml', 'word/styles.xml')
+
+# Relationships of the main document that only body content refers to
+BODY_RELATIONSHIPS = {'image', 'hyperlink', 'oleObject', 'package', 'chart', 'video', 'audio',
+                      'media'}
+
+# Folders whose parts are dropped once no relationship refers to them
+MEDIA_FOLDERS = ('word/media/', 'word/embeddings/', 'word/charts/')
+
+# Markup of document.xml: comments and processing instructions, or a tag as
+# (closing slash, name, self-closing slash)
+_MARKUP = re.compile(rb'<!--.*?-->|<\?.*?\?>|<!\[CDATA\[.*?\]\]>'
+                     rb'|<(/?)([^\s/>!?]+)(?:"[^"]*"|\'[^\']*\'|[^"\'>])*?(/?)>', re.S)
+
+# Entries of relationship and content type parts
+_ENTRY = re.compile(rb'<(?:Relationship|Override)\b(?:"[^"]*"|\'[^\']*\'|[^"\'>])*/>')
+
+
+class ReferenceTemplates:
+    """Validated, stripped copies of DOCX reference documents, kept on disk."""
+
+    def __init__(self, store_dir: Optional[str] = None):
+        """
+        Initialize the store. Nothing is read until a template is prepared.
+
+        Args:
+            store_dir: Directory for the prepared copies
+                (default: templates in the cache directory)
+        """
+        self._store_dir = store_dir
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def store_dir(self) -> str:
+        """Directory of the prepared copies."""
+        if self._store_dir is None:
+            self._store_dir = os.path.join(get_cache_dir(), 'templates')
+        os.makedirs(self._store_dir, exist_ok=True)
+        return self._store_dir
+
+    def prepare(self, path: str) -> str:
+        """
+        Get the prepared copy of a reference document, preparing it on first use.
+
+        Args:
+            path: DOCX file to use as reference document
+
+        Returns:
+            Path of the prepared copy, for pandoc's --reference-doc
+
+        Raises:
+            FileNotFoundError: If the file does not exist
+            ValueError: If the file is not a reference document pandoc can use
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        key = f"{path}|{stat.st_size}|{stat.st_mtime_ns}"
+
+        with self._lock:
+            index = self._load_index()
+            name = index.get(key)
+            if name and os.path.exists(os.path.join(self.store_dir, name)):
+                return os.path.join(self.store_dir, name)
+
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Named by content, so touched or copied templates share one copy
+            name = hashlib.sha256(data).hexdigest() + '.docx'
+            prepared = os.path.join(self.store_dir, name)
+            if not os.path.exists(prepared):
+                tmp_file = f"{prepared}.{os.getpid()}.tmp.docx"
+                try:
+                    with open(tmp_file, 'wb') as f:
+                        f.write(strip_reference_doc(data))
+                    check_with_pandoc(tmp_file)
+                    os.replace(tmp_file, prepared)
+                finally:
+                    if os.path.exists(tmp_file):
+                        os.remove(tmp_file)
+
+            index[key] = name
+            self._save_index(index)
+            return prepared
+
+    def clear(self):
+        """Remove all prepared copies."""
+        with self._lock:
+            self._index = {}
+            for name in os.listdir(self.store_dir):
+                os.remove(os.path.join(self.store_dir, name))
+
+    def _load_index(self) -> Dict[str, str]:
+        if self._index is None:
+            try:
+                with open(os.path.join(self.store_dir, INDEX_FILENAME), encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self, index: Dict[str, str]):
+        index_file = os.path.join(self.store_dir, INDEX_FILENAME)
+        tmp_file = f"{index_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(tmp_file, index_file)
+        except OSError as e:
+            # The index only saves re-reading templates; failing to write it is not fatal
+            print(f"Could not write template index: {e}")
+
+
+def strip_reference_doc(data: bytes) -> bytes:
+    """
+    Validate a reference document and strip everything pandoc does not use.
+
+    Args:
+        data: Contents of the DOCX file
+
+    Returns:
+        Contents of the stripped DOCX file
+
+    Raises:
+        ValueError: If the file is not a usable reference document
+    """
+    try:
+        source = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Reference document is not a DOCX file: {e}") from e
+    with source:
+        infos = source.infolist()
+        parts = {info.filename: source.read(info) for info in infos}
+    missing = [part for part in REQUIRED_PARTS if part not in parts]
+    if missing:
+        raise ValueError(f"Reference document lacks {', '.join(missing)}")
+    for name in REQUIRED_PARTS:
+        try:
+            ElementTree.fromstring(parts[name])
+        except ElementTree.ParseError as e:
+            raise ValueError(f"Reference document has invalid XML in {name}: {e}") from e
+
+    parts['word/document.xml'] = _strip_body(parts['word/document.xml'])
+    _drop_unused_media(parts)
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in infos:
+            if info.filename in parts:
+                target.writestr(info, parts[info.filename], zipfile.ZIP_DEFLATED)
+    return output.getvalue()
+
+
+def check_with_pandoc(reference_doc: str):
+    """
+    Export a tiny document with a reference document, to be sure pandoc accepts it.
+
+    Raises:
+        ValueError: If pandoc fails with the reference document
+    """
+    try:
+        subprocess.run([pypandoc.get_pandoc_path(), '--from=markdown', '--to=docx',
+                        f'--reference-doc={reference_doc}', f'--output={os.devnull}'],
+                       input=b'Test', capture_output=True, check=True,
+                       creationflags=CREATION_FLAGS)
+    except subprocess.CalledProcessError as e:
+        message = e.stderr.decode('utf-8', errors='replace').strip()
+        raise ValueError(f"Pandoc cannot use the reference document: {message}") from e
+
+
+def _strip_body(document: bytes) -> bytes:
+    """Remove the body content of document.xml, keeping its final section properties."""
+    start = document.find(b'<w:body>')
+    end = document.rfind(b'</w:body>')
+    if start < 0 or end < start:
+        return document
+    body = document[start + len(b'<w:body>'):end]
+    # Find the last child of w:body; nested sectPr elements, e.g. the previous
+    # properties inside w:sectPrChange, belong to other elements
+    depth = 0
+    child = last = None
+    for match in _MARKUP.finditer(body):
+        closing, name, empty = match.groups()
+        if name is None:
+            continue
+        if closing:
+            depth -= 1
+            if depth == 0:
+                last = (child[0], match.end(), child[1])
+        elif depth == 0 and empty:
+            last = (match.start(), match.end(), name)
+        elif not empty:
+            if depth == 0:
+                child = (match.start(), name)
+            depth += 1
+    keep = body[last[0]:last[1]] if last and last[2] == b'w:sectPr' else b''
+    return document[:start] + b'<w:body>' + keep + document[end:]
+
+
+def _drop_unused_media(parts: Dict[str, bytes]):
+    """Drop relationships and media the stripped body no longer refers to."""
+    rels_name = 'word/_rels/document.xml.rels'
+    if rels_name in parts:
+        used = set(re.findall(rb'="([^"]*)"', parts['word/document.xml']))
+
+        def unused(rel):
+            kind = rel.get('Type', '').rsplit('/', 1)[-1]
+            return kind in BODY_RELATIONSHIPS and rel.get('Id', '').encode('utf-8') not in used
+        parts[rels_name] = _drop_entries(parts[rels_name], unused)
+
+    # Parts still referred to from any relationship file, e.g. a logo in a header
+    referenced = set()
+    for name, content in parts.items():
+        if not name.endswith('.rels'):
+            continue
+        base = os.path.dirname(os.path.dirname(name))
+        for rel in ElementTree.fromstring(content):
+            if rel.get('TargetMode') != 'External':
+                target = rel.get('Target', '')
+                target = target.lstrip('/') if target.startswith('/') else \
+                    os.path.normpath(os.path.join(base, target)).replace(os.sep, '/')
+                referenced.add(target)
+
+    removed = {name for name in parts
+               if name.startswith(MEDIA_FOLDERS) and name not in referenced}
+    if not removed:
+        return
+    for name in removed:
+        del parts[name]
+
+    def media(override):
+        return override.get('PartName', '').lstrip('/') in removed
+    parts['[Content_Types].xml'] = _drop_entries(parts['[Content_Types].xml'], media)
+
+
+def _drop_entries(part: bytes, drop: Callable[[ElementTree.Element], bool]) -> bytes:
+    """
+    Remove Relationship or Override entries from a package part.
+
+    The entries are cut from the original bytes rather than the part being
+    serialized again, which keeps its namespace declarations as they were.
+    """
+    def replace(match):
+        return b'' if drop(ElementTree.fromstring(match.group())) else match.group()
+    return _ENTRY.sub(replace, part)
+
+
+# Shared store used by all converters in this process
+templates = ReferenceTemplates()
+
+
+def prepare_reference_doc(path: str) -> str:
+    """Get the prepared copy of a reference document from the shared store."""
+    return templates.prepare(path)
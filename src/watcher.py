@@ -0,0 +1,434 @@
+"""
+Watch a directory tree and keep converted siblings of its documents up to date.
+
+A manifest remembers a fingerprint of every converted document: a hash of
+its content and of every local image it references. Only documents whose
+fingerprint changed are converted again, so touching a file, saving it
+unchanged or restarting the watcher does not cause any conversions. Changes
+are picked up with inotify on Linux and by polling elsewhere, and bursts of
+edits are debounced into one round of conversions on a worker pool.
+
+Images outside the watched tree are hashed when a document is checked, but
+only changes inside the tree are noticed while watching.
+"""
+
+import ctypes
+import ctypes.util
+import fnmatch
+import hashlib
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import unquote, urlsplit
+
+from batch import DEFAULT_PATTERNS, BatchResult, output_path_for
+from converter import ENGINE_POOL, DocumentConverter
+from pandoc_setup import get_cache_dir
+from resources import image_references
+
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0)
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class _InotifyMonitor:
+    """Reports changed paths in a directory tree with Linux inotify."""
+
+    def __init__(self, root: str, libc):
+        self._libc = libc
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._directories = {}
+        self._add_tree(root)
+
+    def _add_tree(self, root: str):
+        for directory, _, _ in os.walk(root):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                raise OSError(error, f"Cannot watch {directory}: {os.strerror(error)}")
+            self._directories[wd] = directory
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """
+        Wait for changes.
+
+        Returns:
+            Changed paths (empty if nothing changed within the timeout), or
+            None if events were lost and everything must be checked
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = self._directories.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                del self._directories[wd]
+                changed.add(directory)
+                continue
+            path = os.path.join(directory, os.fsdecode(name.rstrip(b'\0')))
+            changed.add(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may already be inside a directory moved or created in the tree
+                self._add_tree(path)
+                changed.update(_files_under(path))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+class _PollingMonitor:
+    """Reports changed paths by comparing snapshots of a directory tree."""
+
+    def __init__(self, root: str, interval: float):
+        self._root = root
+        self._interval = interval
+        self._snapshot = self._take_snapshot()
+        self._next_poll = time.monotonic() + interval
+
+    def _take_snapshot(self) -> Dict[str, tuple]:
+        snapshot = {}
+        for path in _files_under(self._root):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def wait(self, timeout: float) -> Optional[Set[str]]:
+        """Wait for changes; see _InotifyMonitor.wait."""
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(delay, 0))
+        self._next_poll = time.monotonic() + self._interval
+
+        snapshot = self._take_snapshot()
+        changed = {path for path in snapshot.keys() | self._snapshot.keys()
+                   if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def _load_inotify():
+    """Load libc if it provides inotify, or return None."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, 'inotify_init1'):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def _files_under(root: str) -> List[str]:
+    return [os.path.join(directory, name)
+            for directory, _, names in os.walk(root) for name in names]
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stat_key(path: str) -> Optional[list]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class FolderWatcher:
+    """Converts the documents of a directory tree whenever their content changes."""
+
+    def __init__(self, root: str, output_formats: Iterable[str],
+                 output_dir: Optional[str] = None, patterns: Iterable[str] = DEFAULT_PATTERNS,
+                 workers: Optional[int] = None, debounce: float = 0.3,
+                 poll_interval: float = 1.0, use_inotify: bool = True,
+                 manifest_file: Optional[str] = None,
+                 converter: Optional[DocumentConverter] = None,
+                 progress: Optional[Callable[[BatchResult], None]] = None):
+        """
+        Initialize the watcher.
+
+        Args:
+            root: Directory tree to watch
+            output_formats: Formats every document is converted to
+            output_dir: Directory for outputs (default: next to each input)
+            patterns: File name patterns of documents
+            workers: Parallel conversions (default: CPU count)
+            debounce: Seconds without changes before a burst of edits is converted
+            poll_interval: Seconds between scans when inotify is not available
+            use_inotify: Use inotify where available instead of polling
+            manifest_file: Where fingerprints are kept between runs
+                (default: 'watch' in the cache directory)
+            converter: Converter to use (default: a pooled converter owned by the watcher)
+            progress: Called with the result of every conversion
+        """
+        self.root = os.path.abspath(root)
+        self.output_formats = list(output_formats)
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.patterns = list(patterns)
+        self.workers = workers or os.cpu_count() or 1
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.progress = progress
+        if manifest_file is None:
+            key = hashlib.sha256(f'{self.root}\0{self.output_dir}'.encode('utf-8')).hexdigest()
+            manifest_file = os.path.join(get_cache_dir(), 'watch', f'{key[:16]}.json')
+        self.manifest_file = manifest_file
+        self._owns_converter = converter is None
+        self.converter = converter or DocumentConverter(engine=ENGINE_POOL,
+                                                        pool_size=self.workers)
+        self._manifest = self._load_manifest()
+        self._stop = threading.Event()
+
+    def scan(self) -> List[BatchResult]:
+        """Convert every document in the tree whose content changed since it was last converted."""
+        documents = {path for path in _files_under(self.root) if self._is_document(path)}
+        return self._refresh(documents | set(self._manifest))
+
+    def update(self, paths: Optional[Iterable[str]]) -> List[BatchResult]:
+        """
+        Convert the documents affected by changes to some paths.
+
+        Args:
+            paths: Changed files or directories, or None to check everything
+        """
+        if paths is None:
+            return self.scan()
+        outputs = {output for entry in self._manifest.values()
+                   for output in entry['outputs'].values()}
+        documents = set()
+        for path in paths:
+            if path in outputs:
+                continue
+            if self._is_document(path):
+                documents.add(path)
+            prefix = path + os.sep
+            for document, entry in self._manifest.items():
+                if path in entry['resources'] or document.startswith(prefix):
+                    documents.add(document)
+            if os.path.isdir(path):
+                documents.update(file for file in _files_under(path) if self._is_document(file))
+        return self._refresh(documents)
+
+    def run(self, ready: Optional[threading.Event] = None):
+        """
+        Watch the tree until stop() is called.
+
+        Changes made while the watcher was not running are converted first.
+
+        Args:
+            ready: Optional event set once changes are being watched
+        """
+        self.scan()
+        monitor = self._monitor()
+        try:
+            if ready is not None:
+                ready.set()
+            while not self._stop.is_set():
+                changed = monitor.wait(0.2)
+                if changed is not None and not changed:
+                    continue
+                # Wait until the tree has been quiet for a while
+                while changed is not None:
+                    more = monitor.wait(self.debounce)
+                    if more is None:
+                        changed = None
+                    elif not more:
+                        break
+                    else:
+                        changed |= more
+                self.update(changed)
+        finally:
+            monitor.close()
+
+    def stop(self):
+        """Stop run(); safe to call from any thread."""
+        self._stop.set()
+
+    def close(self):
+        """Release the converter if the watcher created it."""
+        if self._owns_converter:
+            self.converter.close()
+
+    def _monitor(self):
+        libc = _load_inotify() if self.use_inotify else None
+        if libc is not None:
+            try:
+                return _InotifyMonitor(self.root, libc)
+            except OSError as e:
+                # Usually the limit on inotify watches; polling still works
+                print(f"inotify unavailable, polling instead: {e}")
+        return _PollingMonitor(self.root, self.poll_interval)
+
+    def _is_document(self, path: str) -> bool:
+        name = os.path.basename(path)
+        return (os.path.commonpath([self.root, path]) == self.root
+                and any(fnmatch.fnmatch(name, pattern) for pattern in self.patterns))
+
+    def _refresh(self, documents: Set[str]) -> List[BatchResult]:
+        """Convert the documents whose fingerprint or outputs are out of date."""
+        jobs = {}
+        for document in sorted(documents):
+            previous = self._manifest.get(document)
+            if not os.path.isfile(document):
+                self._manifest.pop(document, None)
+                continue
+            try:
+                entry = self._fingerprint(document, previous)
+            except OSError:
+                continue  # Deleted or still being written; a later event follows
+            outputs = {fmt: output_path_for(document, self.root, fmt, self.output_dir)
+                       for fmt in self.output_formats}
+            entry['outputs'] = outputs
+            stale = {fmt: output for fmt, output in outputs.items()
+                     if os.path.abspath(output) != document}
+            if previous and previous['fingerprint'] == entry['fingerprint']:
+                # Unchanged content: only outputs that were deleted or added
+                stale = {fmt: output for fmt, output in stale.items()
+                         if previous['outputs'].get(fmt) != output or not os.path.exists(output)}
+            if stale:
+                jobs[document] = (entry, stale)
+            else:
+                self._manifest[document] = entry
+
+        results = []
+        if jobs:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [(document, executor.submit(self._convert, document, fmt, output))
+                           for document, (_, stale) in jobs.items()
+                           for fmt, output in stale.items()]
+                failed = set()
+                for document, future in futures:
+                    result = future.result()
+                    results.append(result)
+                    if result.status == 'failed':
+                        failed.add(document)
+                    if self.progress:
+                        self.progress(result)
+            for document, (entry, _) in jobs.items():
+                # Failed documents are tried again on their next change or restart
+                if document in failed:
+                    self._manifest.pop(document, None)
+                else:
+                    self._manifest[document] = entry
+        self._save_manifest()
+        return results
+
+    def _convert(self, document: str, output_format: str, output_file: str) -> BatchResult:
+        start = time.perf_counter()
+        try:
+            os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+            self.converter.convert_file(document, output_format, output_file=output_file)
+        except Exception as e:
+            return BatchResult(document, output_file, 'failed',
+                               time.perf_counter() - start, error=str(e))
+        return BatchResult(document, output_file, 'converted', time.perf_counter() - start,
+                           os.path.getsize(document))
+
+    def _fingerprint(self, document: str, previous: Optional[dict]) -> dict:
+        """Hash a document and the local images it references, reusing unchanged hashes."""
+        stat = _stat_key(document)
+        if stat is None:
+            raise FileNotFoundError(document)
+        if previous and previous['stat'] == stat and all(
+                _stat_key(path) == resource['stat']
+                for path, resource in previous['resources'].items()):
+            return dict(previous)
+
+        with open(document, 'rb') as f:
+            content = f.read()
+        resources = {}
+        base_dir = os.path.dirname(document)
+        old_resources = previous['resources'] if previous else {}
+        for reference in image_references(content.decode('utf-8', errors='replace')):
+            parts = urlsplit(reference)
+            if parts.scheme.lower() not in ('', 'file') and len(parts.scheme) != 1:
+                continue  # Remote images are left to the resource cache
+            path = unquote(parts.path) if parts.scheme.lower() == 'file' else reference
+            path = os.path.abspath(os.path.join(base_dir, path))
+            resource_stat = _stat_key(path)
+            old = old_resources.get(path)
+            if old and old['stat'] == resource_stat:
+                resources[path] = old
+            else:
+                resources[path] = {'stat': resource_stat,
+                                   'hash': _hash_file(path) if resource_stat else None}
+
+        digest = hashlib.sha256(content)
+        for path in sorted(resources):
+            digest.update(f"\0{path}\0{resources[path]['hash']}".encode('utf-8'))
+        return {'stat': stat, 'fingerprint': digest.hexdigest(), 'resources': resources,
+                'outputs': previous['outputs'] if previous else {}}
+
+    def _load_manifest(self) -> Dict[str, dict]:
+        try:
+            with open(self.manifest_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        directory = os.path.dirname(self.manifest_file) or '.'
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._manifest, f)
+            os.replace(tmp_path, self.manifest_file)
+        except OSError as e:
+            print(f"Could not write watch manifest: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
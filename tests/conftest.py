@@ -0,0 +1,7 @@
+"""Shared test configuration."""
+
+import os
+import tempfile
+
+# Keep on-disk caches out of the user's real cache directory
+os.environ.setdefault('OMVANDLARE_CACHE_DIR', tempfile.mkdtemp(prefix='omvandlare_test_cache_'))
@@ -0,0 +1,153 @@
+"""Tests for the asyncio conversion API."""
+
+import sys
+import os
+import asyncio
+import subprocess
+import zipfile
+import pypandoc
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import converter as converter_module
+from converter import ConversionCache, ConversionTimeout, DocumentConverter
+
+
+needs_proc = pytest.mark.skipif(not os.path.isdir('/proc'), reason="needs /proc")
+
+
+def pandoc_children():
+    """PIDs of pandoc processes started by this test process."""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            with open(f'/proc/{entry}/comm') as f:
+                name = f.read().strip()
+        except OSError:
+            continue
+        if int(fields[1]) == os.getpid() and name.startswith('pandoc'):
+            pids.append(int(entry))
+    return pids
+
+
+def test_aconvert_text_matches_sync():
+    """Test that async conversions give the same result as sync ones."""
+    converter = DocumentConverter()
+    text = "# Rubrik\n\nText med **fetstil**."
+    assert asyncio.run(converter.aconvert_text(text, 'html')) == converter.convert_text(text, 'html')
+
+
+def test_many_conversions_in_flight():
+    """Test that many conversions share one loop, limited by the semaphore."""
+    converter = DocumentConverter(max_async_conversions=4)
+    running = 0
+    peak = 0
+    real_run = converter_module.arun_pandoc
+
+    async def counting_run(*args, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        try:
+            return await real_run(*args, **kwargs)
+        finally:
+            running -= 1
+
+    async def convert_all():
+        return await asyncio.gather(*(converter.aconvert_text(f"Stycke {i}", 'html')
+                                      for i in range(40)))
+
+    converter_module.arun_pandoc = counting_run
+    try:
+        results = asyncio.run(convert_all())
+    finally:
+        converter_module.arun_pandoc = real_run
+
+    assert [result.strip() for result in results] == [f"<p>Stycke {i}</p>" for i in range(40)]
+    assert peak == 4
+
+
+def test_aconvert_file_to_binary_output(tmp_path):
+    """Test converting a file to a docx output file."""
+    source = tmp_path / "in.md"
+    source.write_text("# Fil\n", encoding='utf-8')
+    output = tmp_path / "out.docx"
+    result = asyncio.run(DocumentConverter().aconvert_file(str(source), 'docx', str(output)))
+    assert result == str(output)
+    assert zipfile.is_zipfile(output)
+
+
+@needs_proc
+def test_timeout_kills_pandoc(tmp_path):
+    """Test that a timeout kills pandoc and leaves no partial output."""
+    big = "Stycke med *text*.\n\n" * 400000
+    output = tmp_path / "out.html"
+    converter = DocumentConverter(async_timeout=0.2)
+    with pytest.raises(ConversionTimeout):
+        asyncio.run(converter.aconvert_text(big, 'html', output_file=str(output)))
+    assert pandoc_children() == []
+    assert not output.exists()
+
+
+@needs_proc
+def test_cancelling_task_kills_pandoc():
+    """Test that cancelling the awaiting task stops the child process."""
+    big = "Stycke med *text*.\n\n" * 400000
+
+    async def cancel_soon():
+        task = asyncio.create_task(DocumentConverter().aconvert_text(big, 'html'))
+        await asyncio.sleep(0.2)
+        assert pandoc_children()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_soon())
+    assert pandoc_children() == []
+
+
+def test_async_results_are_cached(tmp_path):
+    """Test that async conversions share the converter's cache."""
+    converter = DocumentConverter(cache=ConversionCache(disk_dir=str(tmp_path)))
+    first = asyncio.run(converter.aconvert_text("# Cachad", 'html'))
+    assert converter.convert_text("# Cachad", 'html') == first
+    assert asyncio.run(converter.aconvert_text("# Cachad", 'html')) == first
+
+
+def test_async_paths_route_like_sync(tmp_path, monkeypatch):
+    """Test the native renderer, reference document and cached logs on the async paths."""
+    reference = tmp_path / "mall.docx"
+    reference.write_bytes(subprocess.run([pypandoc.get_pandoc_path(), '--print-default-data-file',
+                                          'reference.docx'], capture_output=True, check=True).stdout)
+    monkeypatch.setattr(converter_module, 'prepare_reference_doc', lambda path: path)
+    runs = []
+    real_run = converter_module.arun_pandoc
+
+    async def recording_run(args, *rest, **kwargs):
+        runs.append(args)
+        return await real_run(args, *rest, **kwargs)
+    monkeypatch.setattr(converter_module, 'arun_pandoc', recording_run)
+
+    cache = ConversionCache(disk_dir=str(tmp_path / "cache"))
+    converter = DocumentConverter(cache=cache, native_markdown=True, reference_doc=str(reference))
+    assert asyncio.run(converter.aconvert_text("# Snabb", 'html')) == \
+        converter.convert_text("# Snabb", 'html')
+    assert runs == []
+
+    source = tmp_path / "in.md"
+    source.write_text("# Fil\n", encoding='utf-8')
+    output = tmp_path / "out.docx"
+    asyncio.run(converter.aconvert_file(str(source), 'docx', str(output)))
+    asyncio.run(converter.aconvert_text("# Text", 'docx', output_file=str(output)))
+    assert all(f'--reference-doc={reference}' in args for args in runs) and len(runs) == 2
+    assert zipfile.is_zipfile(output)
+
+    # The log is cached with the result, as convert_text_with_messages expects
+    key = cache.make_key("# Text", 'docx', 'markdown', [f'--reference-doc={reference}'])
+    assert cache.get(key + '.log') is not None
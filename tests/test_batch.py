@@ -0,0 +1,81 @@
+"""Tests for parallel batch conversion."""
+
+import sys
+import os
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from batch import collect_inputs, convert_batch, output_path_for
+from main import main
+
+
+@pytest.fixture
+def docs(tmp_path):
+    """A small tree of Markdown documents."""
+    source = tmp_path / "docs"
+    (source / "nested").mkdir(parents=True)
+    (source / "a.md").write_text("# A\n\nFirst", encoding='utf-8')
+    (source / "b.md").write_text("# B\n\nSecond", encoding='utf-8')
+    (source / "nested" / "c.md").write_text("# C", encoding='utf-8')
+    (source / "notes.txt").write_text("ignored", encoding='utf-8')
+    return source
+
+
+def test_collect_inputs_from_directory_and_glob(docs):
+    """Test that directories are searched recursively and globs expanded."""
+    names = [os.path.basename(path) for path, _ in collect_inputs([str(docs)])]
+    assert names == ['a.md', 'b.md', 'c.md']
+    
+    names = [os.path.basename(path) for path, _ in collect_inputs([str(docs / "*.md")])]
+    assert names == ['a.md', 'b.md']
+
+
+def test_output_path_mirrors_tree(docs, tmp_path):
+    """Test that outputs mirror the input tree under the output directory."""
+    output = output_path_for(str(docs / "nested" / "c.md"), str(docs), 'html', str(tmp_path / "out"))
+    assert output == str(tmp_path / "out" / "nested" / "c.html")
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def test_batch_converts_and_skips_up_to_date(docs, tmp_path, executor):
+    """Test a batch run, then a second run that skips everything."""
+    out_dir = str(tmp_path / "out")
+    seen = []
+    summary = convert_batch([str(docs)], 'html', output_dir=out_dir, workers=2,
+                            executor=executor, progress=seen.append)
+    assert summary.count('converted') == 3
+    assert len(seen) == 3
+    with open(os.path.join(out_dir, "nested", "c.html"), encoding='utf-8') as f:
+        assert '<h1 id="c">C</h1>' in f.read()
+    
+    summary = convert_batch([str(docs)], 'html', output_dir=out_dir, executor=executor)
+    assert summary.count('skipped') == 3
+    assert summary.count('converted') == 0
+
+
+def test_batch_isolates_failures(docs, tmp_path):
+    """Test that one failing file does not stop the batch."""
+    summary = convert_batch([str(docs)], 'no-such-format', output_dir=str(tmp_path / "out"),
+                            executor='thread')
+    assert summary.count('failed') == 3
+    assert all(result.error for result in summary.results)
+
+
+@pytest.mark.parametrize('force', [False, True])
+def test_batch_never_overwrites_its_inputs(docs, force):
+    """Test that outputs landing on their own inputs are refused, not written."""
+    summary = convert_batch([str(docs)], 'markdown', executor='thread', force=force)
+    assert summary.count('failed') == 3 and summary.count('converted') == 0
+    assert all('overwrite the input' in result.error for result in summary.results)
+    assert (docs / "a.md").read_text(encoding='utf-8') == "# A\n\nFirst"
+
+
+def test_batch_command(docs, tmp_path, capsys):
+    """Test the batch command line entry point."""
+    exit_code = main(['batch', str(docs), '--to', 'html', '--output-dir', str(tmp_path / "out"),
+                      '--executor', 'thread'])
+    assert exit_code == 0
+    out = capsys.readouterr().out
+    assert "3 converted, 0 skipped, 0 failed" in out
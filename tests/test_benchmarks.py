@@ -0,0 +1,47 @@
+"""Tests for the benchmark corpus and regression check."""
+
+import sys
+import os
+import pytest
+
+# Add benchmarks directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+
+from corpus import KINDS, build_document, parse_size
+from run_benchmarks import find_regressions, percentile
+
+
+@pytest.mark.parametrize('kind', sorted(KINDS))
+def test_documents_reach_requested_size(kind, tmp_path):
+    """Test that synthetic documents are at least the requested size."""
+    document = build_document(kind, 4096, str(tmp_path / "images"))
+    assert 4096 <= len(document.encode('utf-8')) < 4096 + 1024
+
+
+def test_parse_size():
+    """Test parsing of human readable sizes."""
+    assert parse_size("1KB") == 1024
+    assert parse_size("50MB") == 50 * 1024 * 1024
+    assert parse_size("512") == 512
+
+
+def test_percentile():
+    """Test nearest-rank percentiles."""
+    values = [5, 1, 4, 2, 3]
+    assert percentile(values, 0.5) == 3
+    assert percentile(values, 0.99) == 5
+
+
+def test_find_regressions():
+    """Test that only significant slowdowns are reported."""
+    baseline = {'results': [
+        {'kind': 'note', 'size': 1024, 'format': 'html', 'p50_ms': 100.0},
+        {'kind': 'note', 'size': 1024, 'format': 'docx', 'p50_ms': 10.0},
+    ]}
+    results = [
+        {'kind': 'note', 'size': 1024, 'format': 'html', 'p50_ms': 150.0},
+        {'kind': 'note', 'size': 1024, 'format': 'docx', 'p50_ms': 14.0},
+        {'kind': 'note', 'size': 2048, 'format': 'html', 'p50_ms': 500.0},
+    ]
+    regressions = find_regressions(results, baseline, tolerance=0.25, min_delta_ms=5.0)
+    assert [regression['case'] for regression in regressions] == ['note/1024/html']
@@ -0,0 +1,91 @@
+"""Tests for the conversion result cache."""
+
+import sys
+import os
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import converter as converter_module
+from converter import ConversionCache, DocumentConverter
+
+
+@pytest.fixture
+def pandoc_calls(monkeypatch):
+    """Count the conversions that actually reach pypandoc."""
+    calls = []
+    real_convert_text = converter_module.pypandoc.convert_text
+    
+    def counting_convert_text(*args, **kwargs):
+        calls.append(args)
+        return real_convert_text(*args, **kwargs)
+    
+    monkeypatch.setattr(converter_module.pypandoc, 'convert_text', counting_convert_text)
+    return calls
+
+
+def test_repeated_text_conversion_hits_cache(tmp_path, pandoc_calls):
+    """Test that identical conversions only run pandoc once."""
+    converter = DocumentConverter(cache=ConversionCache(disk_dir=str(tmp_path)))
+    first = converter.markdown_to_html("# Cached\n\nText")
+    second = converter.markdown_to_html("# Cached\n\nText")
+    assert first == second
+    assert len(pandoc_calls) == 1
+    
+    converter.markdown_to_html("# Different")
+    converter.convert_text("# Cached\n\nText", 'html', extra_args=['--standalone'])
+    assert len(pandoc_calls) == 3
+
+
+def test_output_files_are_served_from_cache(tmp_path, pandoc_calls):
+    """Test that binary exports are written from the cache."""
+    converter = DocumentConverter(cache=ConversionCache(disk_dir=str(tmp_path / "cache")))
+    first = tmp_path / "first.docx"
+    second = tmp_path / "second.docx"
+    converter.convert_text("# Export", 'docx', output_file=str(first))
+    converter.convert_text("# Export", 'docx', output_file=str(second))
+    assert first.read_bytes() == second.read_bytes()
+    assert len(pandoc_calls) == 1
+
+
+def test_disk_tier_survives_new_cache_instance(tmp_path, pandoc_calls):
+    """Test that results persist on disk across cache instances."""
+    DocumentConverter(cache=ConversionCache(disk_dir=str(tmp_path))).markdown_to_html("Persist")
+    DocumentConverter(cache=ConversionCache(disk_dir=str(tmp_path))).markdown_to_html("Persist")
+    assert len(pandoc_calls) == 1
+
+
+def test_memory_tier_is_lru():
+    """Test that the memory tier evicts the least recently used entry."""
+    cache = ConversionCache(memory_entries=2, disk_limit=None)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    cache.get('a')
+    cache.put('c', b'3')
+    assert cache.get('a') == b'1'
+    assert cache.get('b') is None
+    assert cache.get('c') == b'3'
+
+
+def test_disk_tier_is_size_bounded(tmp_path):
+    """Test that the disk tier evicts old entries beyond its size limit."""
+    cache = ConversionCache(memory_entries=1, disk_dir=str(tmp_path), disk_limit=250)
+    for i in range(5):
+        cache.put(f'key{i}', bytes(100))
+        os.utime(tmp_path / f'key{i}', (i, i))
+    
+    remaining = sorted(os.listdir(tmp_path))
+    assert sum(os.path.getsize(tmp_path / name) for name in remaining) <= 250
+    assert 'key4' in remaining
+    assert 'key0' not in remaining
+
+
+def test_overwriting_an_entry_keeps_the_disk_size(tmp_path):
+    """Test that replacing an entry does not count its old size towards the limit."""
+    cache = ConversionCache(memory_entries=1, disk_dir=str(tmp_path), disk_limit=250)
+    cache.put('other', bytes(100))
+    for _ in range(5):
+        cache.put('log', bytes(100))
+    assert cache._disk_size == 200
+    assert sorted(os.listdir(tmp_path)) == ['log', 'other']
@@ -0,0 +1,105 @@
+"""Tests for converting many small documents in packed pandoc runs."""
+
+import sys
+import os
+import zipfile
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import converter as converter_module
+from converter import ConversionCache, DocumentConverter
+from pandoc_pool import WorkerError
+
+
+SNIPPETS = [
+    "# Svar\n\nFörsta svaret med en fotnot.[^1]\n\n[^1]: Den första.\n",
+    "# Svar\n\nAndra svaret med en annan fotnot.[^1]\n\n[^1]: Den andra.\n",
+    "```python\nprint('öppet kodblock utan slut')\n",
+    "[länk]\n\n[länk]: https://example.com\n",
+    "Bara *en* rad.",
+]
+
+
+@pytest.mark.parametrize('engine', ['subprocess', 'pool'])
+def test_convert_many_matches_convert_text(engine):
+    """Test that packed documents convert exactly as they do one by one."""
+    with DocumentConverter(engine=engine, pool_size=2) as converter:
+        expected = [converter.convert_text(text, 'html') for text in SNIPPETS]
+        assert converter.convert_many(SNIPPETS, 'html') == expected
+
+
+def test_convert_many_packs_documents(monkeypatch):
+    """Test that documents are grouped into few pandoc runs."""
+    packs = []
+    convert_packed = converter_module.convert_packed
+
+    def recording(requests):
+        packs.append(len(requests))
+        return convert_packed(requests)
+
+    monkeypatch.setattr(converter_module, 'convert_packed', recording)
+    monkeypatch.setattr(converter_module, 'PACK_DOCUMENTS', 20)
+    texts = [f"Dokument {i}" for i in range(45)]
+    results = DocumentConverter().convert_many(texts, 'plain', max_workers=1)
+    assert results == [f"Dokument {i}\n" for i in range(45)]
+    assert packs == [20, 20, 5]
+
+
+def test_convert_many_retries_only_failures(monkeypatch):
+    """Test that a failing document is retried alone and reported in place."""
+    converter = DocumentConverter()
+    valid = converter.parse("Hej")
+    retried = []
+    convert_text = converter.convert_text
+
+    def recording(text, *args, **kwargs):
+        retried.append(text)
+        return convert_text(text, *args, **kwargs)
+
+    monkeypatch.setattr(converter, 'convert_text', recording)
+    results = converter.convert_many([valid, "{inte json", valid], 'plain', input_format='json')
+    assert results[0] == results[2] == "Hej\n"
+    assert isinstance(results[1], RuntimeError)
+    assert retried == ["{inte json"]
+
+
+def test_convert_many_falls_back_when_the_run_fails(monkeypatch):
+    """Test that every document of a crashed pandoc run is converted on its own."""
+    def crash(requests):
+        raise WorkerError("Pandoc worker exited unexpectedly")
+
+    monkeypatch.setattr(converter_module, 'convert_packed', crash)
+    assert DocumentConverter().convert_many(["a", "b"], 'plain') == ["a\n", "b\n"]
+
+
+def test_convert_many_files_and_cache(tmp_path):
+    """Test binary outputs, cache hits and documents that cannot be packed."""
+    cache = ConversionCache(disk_dir=str(tmp_path / 'cache'))
+    converter = DocumentConverter(cache=cache)
+    outputs = [str(tmp_path / f"{i}.docx") for i in range(2)]
+    assert converter.convert_many(["# Ett", "# Två"], 'docx', output_files=outputs) == outputs
+    assert all(zipfile.is_zipfile(output) for output in outputs)
+
+    for output in outputs:
+        os.remove(output)
+    assert converter.convert_many(["# Ett", "# Två"], 'docx', output_files=outputs) == outputs
+    assert all(zipfile.is_zipfile(output) for output in outputs)
+    assert converter.convert_text("# Ett", 'html') == converter.convert_many(["# Ett"], 'html')[0]
+
+    # DOCX needs an output file; the error is returned in place
+    [error] = converter.convert_many(["# Tre"], 'docx')
+    assert isinstance(error, RuntimeError)
+    with pytest.raises(ValueError):
+        converter.convert_many(["a", "b"], 'docx', output_files=outputs[:1])
+
+
+@pytest.mark.parametrize('output_format', ['html', 'markdown', 'gfm', 'latex', 'rst'])
+def test_packed_writes_match_separate_writes(output_format):
+    """Test that documents written in one call split back into their own output."""
+    texts = [f"## Rubrik\n\nStycke {i} med [länk](https://example.com/{i}).\n\n"
+             f"    kod {i}\n" for i in range(5)] + SNIPPETS
+    converter = DocumentConverter()
+    expected = [converter.convert_text(text, output_format) for text in texts]
+    assert converter.convert_many(texts, output_format) == expected
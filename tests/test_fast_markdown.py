@@ -0,0 +1,122 @@
+"""Conformance tests for the in-process Markdown renderer."""
+
+import sys
+import os
+import random
+import re
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from fast_markdown import render_html
+from preview import IncrementalPreview
+
+
+# Documents inside the supported subset
+SUPPORTED = [
+    "# Rubrik\n\nText med **fetstil** och *kursiv*.\nNy rad här.",
+    "## Don't `x` *é*\n# 1. Intro: a & b\n\n# Rubrik\n# Rubrik",
+    "- ett\n- två\n- tre",
+    "* stjärna\n* två\n\nMellan listorna.\n\n+ plus\n+ två",
+    "3. tre\n4. fyra\n\nMellan.\n\n1. ett\n   - under\n   - under två\n2. två",
+    "- a\n  fortsätter här\n- b\n  - c\n    - d\n- e",
+    "> citat\n> mer\n\n> ## Rubrik i citat\n>\n> - a\n> - b",
+    "```\nkod <x> & y\n  indrag\n```\n\nEfter koden.",
+    "***båda*** och 2*3*4, **fet `kod` här** och *a **b** c*",
+    "x > y & z < 3, snake_case_name och it's fine! Really?",
+    "- **Steg 1**: gör så här\n- `kommando --flagga`\n\nSedan:\n\n1. **Punkt**: ok",
+    "# 😀 Emoji\n\nemoji 😀 fungerar, liksom ä ö å.",
+]
+
+# Documents that use constructs outside the subset
+UNSUPPORTED = [
+    "[länk](https://example.com)",
+    "<b>rå html</b>",
+    "```python\nprint('hej')\n```",
+    "| a | b |\n|---|---|\n| 1 | 2 |",
+    "- a\n\n- b",
+    "text\n- inte en lista",
+    'Hon sa "hej"',
+    "Rad ett  \nrad två",
+    "    indragen kod",
+    "Pris $5 och x^2^",
+    "Text\n---",
+    "`a``b`",
+]
+
+SNIPPETS = SUPPORTED + [
+    "Line one\nline *two*\nline three",
+    "# x\n# x",
+    "- a\n  - b\n- c",
+    "Hello.",
+]
+
+
+def normalize(html):
+    """Treat runs of whitespace outside <pre> as equal, as browsers do."""
+    parts = re.split(r'(<pre>.*?</pre>)', html, flags=re.DOTALL)
+    return ''.join(part if part.startswith('<pre>') else re.sub(r'\s+', ' ', part)
+                   for part in parts).strip()
+
+
+@pytest.fixture(scope='module')
+def pandoc():
+    with DocumentConverter(engine='pool') as converter:
+        yield converter
+
+
+@pytest.mark.parametrize('document', SUPPORTED)
+def test_supported_documents_match_pandoc(pandoc, document):
+    """Test that supported documents render natively and match pandoc."""
+    html = render_html(document)
+    assert html is not None
+    assert normalize(html) == normalize(pandoc.convert_text(document, 'html'))
+
+
+@pytest.mark.parametrize('document', UNSUPPORTED)
+def test_unsupported_documents_fall_back(document):
+    """Test that documents outside the subset are left to pandoc."""
+    assert render_html(document) is None
+
+
+def test_generated_corpus_matches_pandoc(pandoc):
+    """Test random combinations of snippets; native output must match pandoc."""
+    rng = random.Random(1)
+    native = 0
+    for _ in range(150):
+        document = "\n\n".join(rng.choice(SNIPPETS + UNSUPPORTED) for _ in range(rng.randint(1, 5)))
+        html = render_html(document)
+        if html is None:
+            continue
+        native += 1
+        assert normalize(html) == normalize(pandoc.convert_text(document, 'html')), document
+    assert native > 15
+
+
+def test_converter_uses_native_path_only_when_enabled(monkeypatch):
+    """Test that the fast path skips pandoc and falls back transparently."""
+    import converter as converter_module
+    calls = []
+    real_convert_text = converter_module.pypandoc.convert_text
+    monkeypatch.setattr(converter_module.pypandoc, 'convert_text',
+                        lambda *args, **kwargs: calls.append(args) or real_convert_text(*args, **kwargs))
+
+    converter = DocumentConverter(native_markdown=True)
+    assert converter.markdown_to_html("# Snabb\n\n*text*") == \
+        '<h1 id="snabb">Snabb</h1>\n<p><em>text</em></p>\n'
+    assert calls == []
+
+    assert 'href' in converter.markdown_to_html("[länk](https://example.com)")
+    assert len(calls) == 1
+    DocumentConverter().markdown_to_html("# Snabb")
+    assert len(calls) == 2
+
+
+def test_preview_renders_simple_blocks_natively():
+    """Test that the preview mixes native and pandoc-rendered blocks."""
+    text = "# Rubrik\n\nEnkel text.\n\n[länk](https://example.com)\n\n- a\n- b"
+    expected = DocumentConverter().markdown_to_html(text)
+    rendered = IncrementalPreview(DocumentConverter(native_markdown=True)).render(text)
+    assert normalize(rendered) == normalize(expected)
@@ -0,0 +1,62 @@
+"""Tests for the cached pandoc format registry."""
+
+import sys
+import os
+import json
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import format_registry
+from format_registry import FormatRegistry
+from converter import DocumentConverter
+
+
+def test_formats_are_discovered_once(tmp_path, monkeypatch):
+    """Test that discovery runs once and is then memoized and persisted."""
+    calls = []
+    real_discover = format_registry.discover_formats
+    monkeypatch.setattr(format_registry, 'discover_formats',
+                        lambda path: calls.append(path) or real_discover(path))
+    
+    cache_file = str(tmp_path / "formats.json")
+    registry = FormatRegistry(cache_file)
+    formats = registry.get_formats()
+    assert 'markdown' in formats['input']
+    assert 'docx' in formats['output']
+    assert registry.get_formats() is formats
+    assert len(calls) == 1
+    
+    # A fresh registry (e.g. a new process) reads the on-disk cache
+    assert FormatRegistry(cache_file).get_formats() == formats
+    assert len(calls) == 1
+    with open(cache_file, encoding='utf-8') as f:
+        assert len(json.load(f)) == 1
+
+
+def test_cache_is_keyed_by_binary(tmp_path):
+    """Test that replacing the pandoc binary changes the cache key."""
+    binary = tmp_path / "pandoc"
+    binary.write_text("v1")
+    key = format_registry.binary_key(str(binary))
+    
+    binary.write_text("version 2")
+    assert format_registry.binary_key(str(binary)) != key
+
+
+def test_converter_construction_is_lazy(monkeypatch):
+    """Test that building a converter does not discover formats."""
+    def fail(*args, **kwargs):
+        raise AssertionError("formats discovered eagerly")
+    monkeypatch.setattr(format_registry.registry, 'get_formats', fail)
+    DocumentConverter()
+
+
+def test_invalid_formats_are_rejected():
+    """Test that cached validation still rejects bad conversions."""
+    converter = DocumentConverter()
+    with pytest.raises(RuntimeError):
+        converter.convert_text("text", 'no-such-format')
+    with pytest.raises(RuntimeError):
+        converter.convert_text("text", 'docx')
@@ -65,3 +65,197 @@ def test_gui_filename_generation():
         
     except Exception as e:
         pytest.fail(f"Failed to test filename generation: {e}")
+
+
+def test_gui_background_export(tmp_path):
+    """Test that exports run off the Tk thread and report through the queue."""
+    import queue
+    from gui import OmvandlareGUI, ExportJob
+    from converter import ConversionCancelled, DocumentConverter
+    
+    gui = OmvandlareGUI.__new__(OmvandlareGUI)  # Create without calling __init__
+    gui.converter = DocumentConverter()
+    gui.completion_queue = queue.Queue()
+    
+    job = ExportJob("# Rubrik\n\nText", str(tmp_path / "out.docx"))
+    gui.run_export(job)
+    finished, error, messages = gui.completion_queue.get_nowait()
+    assert finished is job
+    assert error is None
+    assert messages == []
+    assert (tmp_path / "out.docx").exists()
+    
+    cancelled = ExportJob("# Rubrik", str(tmp_path / "cancelled.docx"))
+    cancelled.cancel_event.set()
+    gui.run_export(cancelled)
+    _, error, _ = gui.completion_queue.get_nowait()
+    assert isinstance(error, ConversionCancelled)
+    assert not (tmp_path / "cancelled.docx").exists()
+
+
+class FakeText:
+    """Enough of a Tk text widget for large-document mode, without a display."""
+    
+    def __init__(self):
+        self.text = ""
+        self.marks = {}
+        self.modified = False
+        self.copies = 0
+    
+    def _offset(self, index):
+        if index == "1.0":
+            return 0
+        if index == "end":
+            return len(self.text)
+        return self.marks[index]
+    
+    def insert(self, index, text):
+        offset = self._offset(index)
+        self.text = self.text[:offset] + text + self.text[offset:]
+        for name, position in self.marks.items():
+            if position >= offset:
+                self.marks[name] = position + len(text)
+        self.modified = True
+    
+    def get(self, start, end):
+        self.copies += 1
+        return self.text + "\n"
+    
+    def search(self, pattern, start, end, regexp=False):
+        import re
+        return "1.0" if re.search(pattern, self.text) else ""
+    
+    def mark_set(self, name, index):
+        self.marks[name] = self._offset(index)
+    
+    def mark_gravity(self, name, gravity):
+        assert gravity == "right"
+    
+    def mark_unset(self, name):
+        del self.marks[name]
+    
+    def edit_modified(self, flag=None):
+        if flag is None:
+            return self.modified
+        self.modified = flag
+
+
+class FakeWidget:
+    def __init__(self):
+        self.options = {}
+    
+    def config(self, **options):
+        self.options.update(options)
+    
+    def set(self, value):
+        self.options['value'] = value
+
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+    
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+        return len(self.scheduled)
+
+
+def make_fake_gui():
+    from gui import OmvandlareGUI
+    
+    gui = OmvandlareGUI.__new__(OmvandlareGUI)  # Create without calling __init__
+    gui.root = FakeRoot()
+    gui.text_area = FakeText()
+    gui.status_var = FakeWidget()
+    gui.paste_button = FakeWidget()
+    gui.docx_button = FakeWidget()
+    gui.content_cache = None
+    gui.pending_paste = None
+    gui.paste_after_id = None
+    return gui
+
+
+def test_gui_large_paste_is_chunked():
+    """Test that large pastes are inserted over several scheduled steps."""
+    from gui import LARGE_DOCUMENT_CHARS, PASTE_CHUNK_CHARS
+    
+    gui = make_fake_gui()
+    gui.text_area.insert("end", "Början")
+    text = "".join(f"Rad {i}\n" for i in range(LARGE_DOCUMENT_CHARS // 4))
+    gui.insert_text("1.0", text, "Klart")
+    assert len(gui.text_area.text) == PASTE_CHUNK_CHARS + len("Början")
+    assert gui.docx_button.options['state'] == "disabled"
+    
+    steps = 1
+    while gui.root.scheduled:
+        gui.root.scheduled.pop()()
+        steps += 1
+    assert steps == -(-len(text) // PASTE_CHUNK_CHARS)
+    assert gui.text_area.text == text + "Början"
+    assert gui.pending_paste is None and not gui.text_area.marks
+    assert gui.docx_button.options['state'] == "normal"
+    assert gui.status_var.options['value'] == "Klart"
+
+
+def test_gui_content_is_copied_once_per_edit():
+    """Test that the text area is only copied again after it was edited."""
+    gui = make_fake_gui()
+    gui.text_area.insert("end", "  # Rubrik  ")
+    assert gui.has_text()
+    assert gui.get_text_content() == "# Rubrik"
+    # The modified flag is only reset by the <<Modified>> handler
+    gui.text_area.edit_modified(False)
+    assert gui.get_text_content() == "# Rubrik"
+    assert gui.get_text_content() == "# Rubrik"
+    assert gui.text_area.copies == 1
+    
+    gui.text_area.insert("end", "\n\nText")
+    assert gui.get_text_content() == "# Rubrik  \n\nText"
+    assert gui.text_area.copies == 2
+
+
+def test_gui_large_export_goes_through_file(tmp_path):
+    """Test that large exports are converted from a temporary file."""
+    import queue
+    from gui import LARGE_DOCUMENT_CHARS, ExportJob
+    from converter import DocumentConverter
+    
+    converted = []
+    
+    class RecordingConverter(DocumentConverter):
+        def convert_file(self, input_file, output_format, output_file=None, cancel_event=None):
+            with open(input_file, encoding='utf-8') as f:
+                converted.append(f.read())
+            return super().convert_file(input_file, output_format, output_file, cancel_event)
+    
+    gui = make_fake_gui()
+    gui.converter = RecordingConverter()
+    gui.completion_queue = queue.Queue()
+    
+    content = "# Rubrik\n\n" + "Lång rad med åäö. " * (LARGE_DOCUMENT_CHARS // 16)
+    job = ExportJob(content, str(tmp_path / "stor.docx"))
+    gui.run_export(job)
+    _, error, _ = gui.completion_queue.get_nowait()
+    assert error is None
+    assert converted == [content]
+    assert (tmp_path / "stor.docx").exists()
+
+
+def test_convert_file_can_be_cancelled(tmp_path):
+    """Test that convert_file honours a cancel event and leaves no output."""
+    import threading
+    from converter import ConversionCancelled, DocumentConverter
+    
+    source = tmp_path / "in.md"
+    source.write_text("# Rubrik\n", encoding='utf-8')
+    converter = DocumentConverter()
+    event = threading.Event()
+    output = str(tmp_path / "ut.docx")
+    assert converter.convert_file(str(source), 'docx', output, cancel_event=event) == output
+    assert os.path.getsize(output) > 0
+    
+    event.set()
+    with pytest.raises(ConversionCancelled):
+        converter.convert_file(str(source), 'docx', str(tmp_path / "avbruten.docx"),
+                               cancel_event=event)
+    assert not (tmp_path / "avbruten.docx").exists()
@@ -0,0 +1,129 @@
+"""Tests for per-stage conversion instrumentation."""
+
+import sys
+import os
+import json
+import logging
+import urllib.request
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from instrumentation import Instrumentation, JsonLinesSink, LoggingSink, PrometheusSink, stage
+import pandoc_setup
+from pandoc_setup import get_pandoc_version
+
+
+class ListSink:
+    """Collects records in memory."""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.mark.parametrize('engine', ['subprocess', 'pool'])
+def test_conversion_records_stages_and_sizes(engine):
+    """Test that a conversion emits one record with timings and sizes."""
+    sink = ListSink()
+    with DocumentConverter(engine=engine, instrumentation=Instrumentation(sink)) as converter:
+        html = converter.markdown_to_html("# Timed\n\nSome *text*.")
+
+    assert len(sink.records) == 1
+    record = sink.records[0]
+    assert record['operation'] == 'convert_text'
+    assert record['engine'] == engine
+    assert record['output_format'] == 'html'
+    assert record['exit_status'] == 0
+    assert record['error'] is None
+    assert record['input_bytes'] == len("# Timed\n\nSome *text*.")
+    assert record['output_bytes'] == len(html.encode('utf-8'))
+    assert 'pandoc' in record['stages']
+    assert record['total_seconds'] >= sum(
+        seconds for name, seconds in record['stages'].items()
+        if name in ('pandoc', 'format_discovery', 'pandoc_discovery'))
+    if engine == 'pool':
+        assert 'pandoc_read' in record['stages']
+        assert 'pandoc_write' in record['stages']
+
+
+def test_failed_conversion_records_error():
+    """Test that failures are emitted with a nonzero exit status."""
+    sink = ListSink()
+    converter = DocumentConverter(instrumentation=Instrumentation(sink))
+    with pytest.raises(RuntimeError):
+        converter.convert_text("text", 'nosuchformat')
+
+    record = sink.records[0]
+    assert record['exit_status'] != 0
+    assert 'nosuchformat' in record['error']
+
+
+def test_stage_outside_trace_is_noop():
+    """Test that uninstrumented code paths are unaffected."""
+    with stage('anything'):
+        pass
+    assert DocumentConverter().markdown_to_html("plain").strip() == "<p>plain</p>"
+
+
+def test_failing_sink_does_not_break_conversion():
+    """Test that a broken sink never turns into a conversion error."""
+    class BrokenSink:
+        def emit(self, record):
+            raise OSError("disk full")
+
+    converter = DocumentConverter(instrumentation=Instrumentation(BrokenSink()))
+    assert "<h1" in converter.markdown_to_html("# Still works")
+
+
+def test_json_lines_sink(tmp_path):
+    """Test that each record becomes one JSON line."""
+    path = tmp_path / 'metrics.jsonl'
+    converter = DocumentConverter(instrumentation=Instrumentation(JsonLinesSink(str(path))))
+    converter.markdown_to_html("# One")
+    converter.markdown_to_html("# Two")
+
+    records = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert len(records) == 2
+    assert all(record['exit_status'] == 0 for record in records)
+
+
+def test_logging_sink(caplog):
+    """Test that the logging sink writes a readable summary line."""
+    converter = DocumentConverter(instrumentation=Instrumentation(LoggingSink()))
+    with caplog.at_level(logging.INFO, logger='omvandlare.metrics'):
+        converter.markdown_to_html("# Logged")
+    assert any('convert_text markdown->html' in message for message in caplog.messages)
+
+
+def test_prometheus_endpoint():
+    """Test that aggregated metrics are served over HTTP."""
+    sink = PrometheusSink()
+    converter = DocumentConverter(instrumentation=Instrumentation(sink))
+    converter.markdown_to_html("# Scraped")
+    port = sink.serve()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5) as response:
+            body = response.read().decode('utf-8')
+    finally:
+        sink.close()
+
+    assert ('omvandlare_conversions_total{operation="convert_text",'
+            'output_format="html",status="ok"} 1') in body
+    assert 'omvandlare_stage_seconds_count{stage="pandoc"} 1' in body
+
+
+def test_pandoc_version_is_traced():
+    """Test that pandoc probing can be traced as well."""
+    sink = ListSink()
+    # Without a manifest, pandoc is run to find its version
+    pandoc_setup.manifest.clear()
+    version = get_pandoc_version(instrumentation=Instrumentation(sink))
+    record = sink.records[0]
+    assert record['operation'] == 'pandoc_version'
+    assert record['pandoc_version'] == version
+    assert 'pandoc_startup' in record['stages']
@@ -0,0 +1,146 @@
+"""Tests for the shared job queues and queue workers."""
+
+import sys
+import os
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from job_queue import (DirectoryJobQueue, Job, JobQueue, SQLiteJobQueue, enqueue_batch,
+                       open_queue, run_worker, run_workers)
+from main import main
+
+
+@pytest.fixture(params=['queue.db', 'queue'])
+def location(request, tmp_path):
+    return str(tmp_path / request.param)
+
+
+def jobs(count, output_format='html'):
+    return [Job(f'in{i}.md', f'out{i}.html', output_format) for i in range(count)]
+
+
+def test_open_queue_picks_by_location(tmp_path):
+    assert isinstance(open_queue(str(tmp_path / 'q.sqlite')), SQLiteJobQueue)
+    assert isinstance(open_queue(str(tmp_path / 'q')), DirectoryJobQueue)
+
+
+def test_incomplete_queues_fail_on_creation():
+    class Incomplete(JobQueue):
+        def submit(self, jobs):
+            return 0
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_requeue_and_finish_never_duplicate_a_job(tmp_path):
+    """Test a late finisher racing a worker that returns its expired job."""
+    expiring = DirectoryJobQueue(str(tmp_path / 'queue'), lease=0)
+    queue = DirectoryJobQueue(str(tmp_path / 'queue'))
+    expiring.submit(jobs(1))
+    late, = expiring.claim('late')
+    # Another worker has just taken over the expired claim to return it
+    taken = queue._take_over(late.claim, 'other')
+    assert taken is not None
+    expiring.complete(late)
+    assert queue.counts() == {'pending': 0, 'running': 1, 'done': 0, 'failed': 0}
+    # Nobody else can claim it while it is taken over
+    assert queue.claim('third') == []
+    queue._move(queue._read(str(tmp_path / 'queue' / 'running' / taken)), taken, 'pending')
+    again, = queue.claim('next')
+    queue.complete(again)
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 1, 'failed': 0}
+
+
+def test_enqueue_leaves_out_outputs_onto_inputs(location, tmp_path):
+    (tmp_path / 'a.md').write_text('# A\n', encoding='utf-8')
+    assert enqueue_batch(open_queue(location), [str(tmp_path / 'a.md')], 'markdown') == 0
+
+
+def test_claims_are_exclusive(location):
+    """Test that two workers never get the same job, and that results are recorded."""
+    queue = open_queue(location)
+    assert queue.submit(jobs(5)) == 5
+    first = queue.claim('a', 3)
+    second = open_queue(location).claim('b', 3)
+    assert [job.input_file for job in first] == ['in0.md', 'in1.md', 'in2.md']
+    assert [job.input_file for job in second] == ['in3.md', 'in4.md']
+    assert queue.claim('c', 3) == []
+    for job in first + second:
+        queue.complete(job)
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 5, 'failed': 0}
+
+
+def test_failures_are_retried_then_recorded(location):
+    """Test the attempt count and last error of a job that keeps failing."""
+    queue = open_queue(location, max_attempts=2)
+    queue.submit(jobs(1))
+    job, = queue.claim('a')
+    queue.fail(job, 'first error')
+    assert queue.counts()['pending'] == 1
+    job, = queue.claim('a')
+    assert job.attempts == 2
+    queue.fail(job, 'second error')
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 0, 'failed': 1}
+    failed, = queue.failures()
+    assert (failed.input_file, failed.attempts, failed.error) == ('in0.md', 2, 'second error')
+
+
+def test_expired_leases_move_to_another_worker(location):
+    """Test that a job of a worker that stopped responding is handed out again."""
+    queue = open_queue(location, lease=0)
+    queue.submit(jobs(1))
+    stalled, = queue.claim('stalled')
+    taken_over, = queue.claim('other')
+    assert taken_over.input_file == stalled.input_file and taken_over.attempts == 2
+    # The stalled worker no longer owns the job
+    queue.complete(stalled)
+    assert queue.counts()['running'] == 1
+    queue.complete(taken_over)
+    assert queue.counts()['done'] == 1
+
+
+def test_worker_converts_queued_documents(location, tmp_path):
+    """Test a worker converting real documents and recording a bad one as failed."""
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    for name in 'abc':
+        (docs / f'{name}.md').write_text(f'# {name.upper()}\n', encoding='utf-8')
+    queue = open_queue(location, max_attempts=2)
+    assert enqueue_batch(queue, [str(docs)], 'html', str(tmp_path / 'out')) == 3
+    queue.submit([Job(str(docs / 'a.md'), str(tmp_path / 'out' / 'bad'), 'no-such-format')])
+
+    results = []
+    assert run_worker(queue, progress=results.append) == 3
+    assert '<h1 id="b">B</h1>' in (tmp_path / 'out' / 'b.html').read_text(encoding='utf-8')
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 3, 'failed': 1}
+    assert queue.failures()[0].attempts == 2
+    assert sorted(result.status for result in results) == ['converted'] * 3 + ['failed'] * 2
+    assert not os.path.exists(tmp_path / 'out' / 'bad')
+
+
+def test_worker_processes_share_a_queue(location, tmp_path):
+    """Test several worker processes converting every document exactly once."""
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    for i in range(12):
+        (docs / f'{i:02}.md').write_text(f'# {i}\n', encoding='utf-8')
+    enqueue_batch(open_queue(location), [str(docs)], 'html')
+    assert run_workers(location, 3, claim_size=2) == 12
+    assert open_queue(location).counts()['done'] == 12
+    assert len(list(docs.glob('*.html'))) == 12
+
+
+def test_queue_commands(tmp_path, capsys):
+    """Test the enqueue and worker command line entry points."""
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'a.md').write_text('# A\n', encoding='utf-8')
+    queue = str(tmp_path / 'queue.db')
+    assert main(['enqueue', queue, str(docs), '-t', 'html']) == 0
+    assert "1 jobs added" in capsys.readouterr().out
+    assert main(['worker', queue, '-j', '2']) == 0
+    assert "0 pending, 0 running, 1 done, 0 failed" in capsys.readouterr().out
+    assert (docs / 'a.html').exists()
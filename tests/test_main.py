@@ -44,3 +44,65 @@ def test_html_to_markdown_conversion():
     markdown = converter.html_to_markdown(html)
     assert "# Test" in markdown
     assert "**bold**" in markdown
+
+
+def test_cancelled_conversion_raises():
+    """Test that setting the cancel event kills the conversion."""
+    import threading
+    from converter import ConversionCancelled
+    
+    converter = DocumentConverter()
+    cancel_event = threading.Event()
+    assert "<h1" in converter.convert_text("# Test", 'html', cancel_event=cancel_event)
+    
+    cancel_event.set()
+    with pytest.raises(ConversionCancelled):
+        converter.convert_text("# Test", 'html', cancel_event=cancel_event)
+
+
+def test_cancel_kills_running_pandoc(tmp_path):
+    """Test that a running pandoc process is killed and leaves no output."""
+    import threading
+    import time
+    from converter import ConversionCancelled
+    
+    converter = DocumentConverter()
+    cancel_event = threading.Event()
+    output_file = tmp_path / "big.docx"
+    large_text = "Paragraph with *emphasis* and `code`.\n\n" * 200000
+    
+    threading.Timer(0.2, cancel_event.set).start()
+    start = time.perf_counter()
+    with pytest.raises(ConversionCancelled):
+        converter.convert_text(large_text, 'docx', output_file=str(output_file),
+                               cancel_event=cancel_event)
+    assert time.perf_counter() - start < 5
+    assert not output_file.exists()
+
+
+@pytest.mark.parametrize('engine', ['subprocess', 'pool'])
+def test_conversion_warnings_are_structured(engine):
+    """Test that pandoc warnings are returned per conversion."""
+    from converter import warnings_only
+    
+    with DocumentConverter(engine=engine) as converter:
+        html, messages = converter.convert_text_with_messages("x $\\frac{1}{$ y", 'html')
+        assert "<p>" in html
+        warnings = warnings_only(messages)
+        assert [message['type'] for message in warnings] == ['CouldNotConvertTeXMath']
+        
+        _, messages = converter.convert_text_with_messages("Clean text", 'html')
+        assert warnings_only(messages) == []
+
+
+def test_parallel_conversions_keep_warnings_separate():
+    """Test that concurrent conversions do not mix up their warnings."""
+    from concurrent.futures import ThreadPoolExecutor
+    
+    converter = DocumentConverter()
+    texts = ["x $\\frac{1}{$ y" if i % 2 else f"Clean {i}" for i in range(8)]
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(
+            lambda text: converter.convert_text_with_messages(text, 'html'), texts))
+    for i, (_, messages) in enumerate(results):
+        assert bool(messages) == bool(i % 2)
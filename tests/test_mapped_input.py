@@ -0,0 +1,81 @@
+"""Tests for memory-mapped file input."""
+
+import sys
+import os
+import codecs
+import tracemalloc
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import converter as converter_module
+from converter import DocumentConverter
+from mapped_input import SAMPLE_WINDOW_SIZE, SAMPLE_WINDOWS, MappedFile, detect_encoding
+
+
+TEXT = "# Rubrik\n\nCitat: “åäö” – slut.\n"
+
+
+def test_detect_encoding():
+    """Test byte order marks, UTF-8 and legacy encodings."""
+    assert detect_encoding(codecs.BOM_UTF8 + TEXT.encode('utf-8')) == ('utf-8', 3)
+    assert detect_encoding(codecs.BOM_UTF16_LE + TEXT.encode('utf-16-le')) == ('utf-16-le', 2)
+    assert detect_encoding(codecs.BOM_UTF16_BE + TEXT.encode('utf-16-be')) == ('utf-16-be', 2)
+    assert detect_encoding(codecs.BOM_UTF32_LE + TEXT.encode('utf-32-le')) == ('utf-32-le', 4)
+    assert detect_encoding(TEXT.encode('utf-8')) == ('utf-8', 0)
+    assert detect_encoding(b'') == ('utf-8', 0)
+    assert detect_encoding(TEXT.encode('cp1252')) == ('cp1252', 0)
+    # 0x81 is not defined in Windows-1252
+    assert detect_encoding('åäö'.encode('latin-1') + b'\x81') == ('latin-1', 0)
+
+
+def test_detect_encoding_samples_large_files():
+    """Test that sampled windows may cut characters, and that late bytes are seen."""
+    size = SAMPLE_WINDOWS * SAMPLE_WINDOW_SIZE * 4
+    utf8 = ('å' * (size // 2)).encode('utf-8')
+    for offset in range(4):
+        assert detect_encoding(b'x' * offset + utf8)[0] == 'utf-8'
+    assert detect_encoding(utf8[:-2] + 'ä'.encode('cp1252'))[0] == 'cp1252'
+
+
+@pytest.mark.parametrize('encoding', ['utf-8-sig', 'utf-16', 'cp1252'])
+@pytest.mark.parametrize('engine', ['subprocess', 'pool'])
+def test_convert_file_normalizes_encoding(encoding, engine, tmp_path):
+    """Test that files in other encodings convert like UTF-8 ones."""
+    path = tmp_path / 'dokument.md'
+    path.write_bytes(TEXT.encode(encoding))
+    with MappedFile(path) as mapped:
+        assert mapped.read_text() == TEXT
+        assert b''.join(bytes(chunk) for chunk in mapped.chunks(5)) == TEXT.encode('utf-8')
+
+    with DocumentConverter(engine=engine) as converter:
+        expected = converter.convert_text(TEXT, 'html')
+        assert converter.convert_file(str(path), 'html') == expected
+        output = str(tmp_path / 'ut.html')
+        assert converter.convert_file(str(path), 'html', output) == output
+        with open(output, encoding='utf-8') as f:
+            assert f.read().strip() == expected.strip()
+
+
+def test_large_files_stream_without_copies(monkeypatch, tmp_path):
+    """Test that Python memory stays flat while a file is converted."""
+    path = tmp_path / 'stor.md'
+    with open(path, 'w', encoding='utf-8') as f:
+        i = 0
+        while f.tell() < 1024 * 1024:
+            f.write(f"Rad {i} med lite text och åäö.\n\n")
+            i += 1
+    monkeypatch.setattr(converter_module, 'MAPPED_INPUT_THRESHOLD', 0)
+
+    with DocumentConverter(engine='pool', pool_size=1) as converter:
+        tracemalloc.start()
+        try:
+            written = converter.convert_stream(str(path), 'html', str(tmp_path / 'a.html'))
+            converter.convert_file(str(path), 'html', str(tmp_path / 'b.html'))
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    assert written == os.path.getsize(tmp_path / 'a.html') > 1024 * 1024
+    assert os.path.getsize(tmp_path / 'b.html') == written
+    assert peak < 512 * 1024
@@ -0,0 +1,57 @@
+"""Tests for parsing once and rendering several output formats."""
+
+import sys
+import os
+import json
+import zipfile
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+
+
+TEXT = "# Rubrik\n\nText med **fetstil**, *kursiv* och `kod`.\n\n- ett\n- två\n"
+
+
+@pytest.mark.parametrize('engine', ['subprocess', 'pool'])
+def test_convert_to_formats_matches_direct_conversions(engine, tmp_path):
+    """Test that rendering from the AST gives the same results as converting directly."""
+    with DocumentConverter(engine=engine) as converter:
+        docx = str(tmp_path / "out.docx")
+        results = converter.convert_to_formats(TEXT, {'html': None, 'markdown': None,
+                                                      'docx': docx})
+        assert results['html'] == converter.convert_text(TEXT, 'html')
+        assert results['markdown'] == converter.convert_text(TEXT, 'markdown')
+        assert results['docx'] == docx
+        assert zipfile.is_zipfile(docx)
+
+
+def test_ast_is_parsed_once_and_reusable(monkeypatch):
+    """Test that the AST is cached and can be edited before rendering."""
+    converter = DocumentConverter()
+    parses = []
+    real_convert_cached = converter._convert_cached
+
+    def counting_convert_cached(text, output_format, *args, **kwargs):
+        if output_format == 'json':
+            parses.append(text)
+        return real_convert_cached(text, output_format, *args, **kwargs)
+
+    monkeypatch.setattr(converter, '_convert_cached', counting_convert_cached)
+
+    ast = converter.parse(TEXT)
+    converter.convert_to_formats(TEXT, {'html': None, 'plain': None})
+    assert converter.parse(TEXT) is ast
+    assert len(parses) == 1
+
+    document = json.loads(ast)
+    document['blocks'] = document['blocks'][:1]
+    assert converter.render(document, 'html').strip() == '<h1 id="rubrik">Rubrik</h1>'
+
+
+def test_failed_render_raises():
+    """Test that a failing output format is reported."""
+    with pytest.raises(RuntimeError):
+        DocumentConverter().convert_to_formats(TEXT, {'html': None, 'nosuchformat': None})
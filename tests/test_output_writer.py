@@ -0,0 +1,110 @@
+"""Tests for atomic background output writing."""
+
+import sys
+import os
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import output_writer
+from batch import convert_batch
+from converter import DocumentConverter
+from main import build_parser, main
+from output_writer import OutputWriter
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    """Record what is synced: 'file' or 'dir' for every fsync call."""
+    calls = []
+    real_fsync = os.fsync
+
+    def fsync(fd):
+        calls.append('dir' if os.path.isdir(f'/proc/self/fd/{fd}') else 'file')
+        real_fsync(fd)
+    monkeypatch.setattr(os, 'fsync', fsync)
+    return calls
+
+
+@pytest.mark.parametrize('same_file_system', [True, False])
+def test_commit_replaces_outputs_atomically(tmp_path, fsyncs, same_file_system):
+    """Test renames and cross file system copies, with directory syncs batched."""
+    out_dir = tmp_path / 'ut' / 'nested'
+    with OutputWriter(str(tmp_path), sync_batch=100) as writer:
+        if not same_file_system:
+            writer._staging_dev = -1
+        commits = []
+        for i in range(5):
+            output_file = str(out_dir / f'{i}.html')
+            staged = writer.staging_path(output_file)
+            assert staged.endswith(f'{i}.html') and staged.startswith(writer.staging_dir)
+            with open(staged, 'w', encoding='utf-8') as f:
+                f.write(f'<p>{i}</p>')
+            commits.append(writer.commit(staged, output_file))
+        assert [commit.result(10) for commit in commits] == [str(out_dir / f'{i}.html')
+                                                             for i in range(5)]
+        writer.flush()
+        staging_dir = writer.staging_dir
+        assert os.listdir(staging_dir) == []
+
+    assert sorted(os.listdir(out_dir)) == [f'{i}.html' for i in range(5)]
+    assert (out_dir / '3.html').read_text(encoding='utf-8') == '<p>3</p>'
+    assert not os.path.exists(staging_dir)
+    if output_writer.CAN_SYNC_DIRECTORIES:
+        assert fsyncs.count('file') == 5 and fsyncs.count('dir') == 1
+
+
+def test_failed_move_is_reported(tmp_path):
+    """Test that a destination that cannot be written fails the commit's future."""
+    (tmp_path / 'fil').write_text('not a directory', encoding='utf-8')
+    with OutputWriter(str(tmp_path), sync=False) as writer:
+        staged = writer.staging_path('x.html')
+        with open(staged, 'w', encoding='utf-8') as f:
+            f.write('x')
+        with pytest.raises(OSError):
+            writer.commit(staged, str(tmp_path / 'fil' / 'x.html')).result(10)
+
+
+def test_failed_batch_conversion_keeps_previous_output(tmp_path, monkeypatch):
+    """Test that a conversion failing halfway leaves no partial output behind."""
+    docs = tmp_path / 'docs'
+    docs.mkdir()
+    (docs / 'a.md').write_text('# A\n', encoding='utf-8')
+    (docs / 'b.md').write_text('# B\n', encoding='utf-8')
+    (docs / 'b.html').write_text('old output', encoding='utf-8')
+    convert_file = DocumentConverter.convert_file
+
+    def half_written(self, input_file, output_format, output_file=None, cancel_event=None):
+        if input_file.endswith('b.md'):
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write('<h1 id="b">partial')
+            raise RuntimeError('pandoc crashed')
+        return convert_file(self, input_file, output_format, output_file, cancel_event)
+    monkeypatch.setattr(DocumentConverter, 'convert_file', half_written)
+
+    seen = []
+    summary = convert_batch([str(docs)], 'html', executor='thread', force=True,
+                            staging_dir=str(tmp_path), progress=seen.append)
+    assert summary.count('converted') == 1 and summary.count('failed') == 1
+    assert len(seen) == 2
+    assert '<h1 id="a">A</h1>' in (docs / 'a.html').read_text(encoding='utf-8')
+    assert (docs / 'b.html').read_text(encoding='utf-8') == 'old output'
+    assert sorted(os.listdir(docs)) == ['a.html', 'a.md', 'b.html', 'b.md']
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('omvandlare-output-')]
+
+
+def test_batch_output_arguments():
+    """Test parsing of the staging options."""
+    args = build_parser().parse_args(['batch', 'docs', '-t', 'html', '--staging-dir', '/tmp',
+                                      '--no-sync'])
+    assert args.staging_dir == '/tmp' and args.no_sync
+
+
+def test_batch_command_reports_bad_staging_dir(tmp_path, capsys):
+    """Test that a missing staging directory is not blamed on the reference document."""
+    (tmp_path / 'a.md').write_text('# A\n', encoding='utf-8')
+    assert main(['batch', str(tmp_path), '-t', 'html',
+                 '--staging-dir', str(tmp_path / 'saknas')]) == 1
+    error = capsys.readouterr().err
+    assert 'Staging directory' in error and 'reference document' not in error
@@ -0,0 +1,79 @@
+"""Tests for the pooled pandoc engine."""
+
+import sys
+import os
+import signal
+import time
+import zipfile
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from pandoc_pool import PandocWorkerPool, WorkerTimeout
+
+
+SAMPLE_MARKDOWN = "# Test\n\nThis is **bold** and *emphasis*.\n\n- One\n- Two\n"
+
+
+def test_pool_matches_subprocess_engine():
+    """Test that pooled conversions produce the same output as pypandoc."""
+    subprocess_converter = DocumentConverter()
+    with DocumentConverter(engine='pool', pool_size=2) as pooled:
+        for fmt in ('html', 'markdown', 'plain'):
+            expected = subprocess_converter.convert_text(SAMPLE_MARKDOWN, fmt)
+            assert pooled.convert_text(SAMPLE_MARKDOWN, fmt) == expected
+
+
+def test_pool_writes_binary_output(tmp_path):
+    """Test that binary formats are written to the output file."""
+    output_file = str(tmp_path / "out.docx")
+    with DocumentConverter(engine='pool', pool_size=1) as pooled:
+        result = pooled.convert_text(SAMPLE_MARKDOWN, 'docx', output_file=output_file)
+    assert result == output_file
+    assert zipfile.is_zipfile(output_file)
+
+
+def test_pool_reuses_and_recycles_workers():
+    """Test that workers are reused, and replaced after they die."""
+    with PandocWorkerPool(size=1) as pool:
+        pool.convert_text("a", 'html')
+        pool.convert_text("b", 'html')
+        worker = next(iter(pool._workers))
+        assert worker.requests_served == 2
+        
+        worker.process.kill()
+        worker.process.wait()
+        assert "<p>c</p>" in pool.convert_text("c", 'html')
+        assert worker not in pool._workers
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGSTOP'), reason="needs SIGSTOP")
+def test_pool_replaces_hung_workers():
+    """Test that a worker that stops answering is killed and replaced."""
+    with PandocWorkerPool(size=1, request_timeout=1) as pool:
+        pool.convert_text("a", 'html')
+        worker = next(iter(pool._workers))
+        os.kill(worker.process.pid, signal.SIGSTOP)
+        start = time.perf_counter()
+        with pytest.raises(WorkerTimeout):
+            pool.convert_text("b", 'html')
+        assert time.perf_counter() - start < 10
+        assert not worker.is_alive() and worker not in pool._workers
+        assert "<p>c</p>" in pool.convert_text("c", 'html')
+
+
+def test_pool_reports_conversion_errors():
+    """Test that pandoc errors surface as RuntimeError."""
+    with PandocWorkerPool(size=1) as pool:
+        with pytest.raises(RuntimeError):
+            pool.convert_text("text", 'html', input_format='no-such-format')
+        # The worker survives a failed conversion
+        assert "<p>ok</p>" in pool.convert_text("ok", 'html')
+
+
+def test_invalid_engine():
+    """Test that unknown engines are rejected."""
+    with pytest.raises(ValueError):
+        DocumentConverter(engine='magic')
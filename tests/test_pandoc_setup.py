@@ -0,0 +1,101 @@
+"""Tests for resolving the pandoc binary through the persisted manifest."""
+
+import sys
+import os
+import json
+import subprocess
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pandoc_setup
+from pandoc_setup import PandocManifest
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+FAKE_PANDOC = """#!/bin/sh
+echo "pandoc {version}"
+echo "Features: +server -lua"
+echo "Scripting engine: Lua 5.4"
+"""
+
+
+@pytest.fixture
+def fake_pandoc(tmp_path, monkeypatch):
+    if sys.platform == 'win32':
+        pytest.skip("needs a shell script as pandoc")
+    binary = tmp_path / "pandoc"
+    binary.write_text(FAKE_PANDOC.format(version='3.1.2'))
+    binary.chmod(0o755)
+    monkeypatch.setenv('PYPANDOC_PANDOC', str(binary))
+    return binary
+
+
+def test_manifest_probes_only_new_binaries(tmp_path, fake_pandoc, monkeypatch):
+    """Test that pandoc is run once, then again only after it changes."""
+    probes = []
+    real_probe = pandoc_setup.probe_pandoc
+    monkeypatch.setattr(pandoc_setup, 'probe_pandoc',
+                        lambda path: probes.append(path) or real_probe(path))
+
+    manifest_file = str(tmp_path / "pandoc.json")
+    entry = PandocManifest(manifest_file).resolve()
+    assert entry['path'] == str(fake_pandoc)
+    assert entry['version'] == '3.1.2'
+    assert entry['features'] == ['server']
+    assert entry['scripting_engine'] == 'Lua 5.4'
+
+    # A later launch only reads the manifest
+    assert PandocManifest(manifest_file).resolve() == entry
+    assert len(probes) == 1
+
+    fake_pandoc.write_text(FAKE_PANDOC.format(version='3.2'))
+    os.utime(fake_pandoc, ns=(1, 1))
+    assert PandocManifest(manifest_file).resolve()['version'] == '3.2'
+    assert len(probes) == 2
+    with open(manifest_file, encoding='utf-8') as f:
+        assert list(json.load(f)) == [str(fake_pandoc)]
+
+
+def test_manifest_reports_missing_pandoc(tmp_path, monkeypatch):
+    """Test that an unusable pandoc raises OSError and is not recorded."""
+    monkeypatch.setenv('PYPANDOC_PANDOC', str(tmp_path / "missing"))
+    manifest = PandocManifest(str(tmp_path / "pandoc.json"))
+    with pytest.raises(OSError):
+        manifest.resolve()
+    assert not os.path.exists(manifest.manifest_file)
+
+
+SPAWN_SCRIPT = r"""
+import json, subprocess, sys
+sys.path.insert(0, sys.argv[1])
+spawned = []
+real_init = subprocess.Popen.__init__
+def counting_init(self, args, *rest, **kwargs):
+    spawned.append(str(args))
+    real_init(self, args, *rest, **kwargs)
+subprocess.Popen.__init__ = counting_init
+
+from converter import pypandoc
+path = pypandoc.get_pandoc_path()
+version = pypandoc.get_pandoc_version()
+print(json.dumps({'path': path, 'version': version, 'spawned': spawned}))
+"""
+
+
+def test_later_processes_do_not_run_pandoc(tmp_path):
+    """Test that pypandoc is handed the recorded pandoc in new processes."""
+    env = dict(os.environ, OMVANDLARE_CACHE_DIR=str(tmp_path))
+    env.pop('PYPANDOC_PANDOC', None)
+
+    def run():
+        output = subprocess.run([sys.executable, '-c', SPAWN_SCRIPT, SRC_DIR], env=env,
+                                capture_output=True, text=True, timeout=60, check=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    first = run()
+    assert first['spawned']
+    second = run()
+    assert second['spawned'] == []
+    assert (second['path'], second['version']) == (first['path'], first['version'])
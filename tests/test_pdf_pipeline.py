@@ -0,0 +1,146 @@
+"""Tests for the LaTeX PDF pipeline."""
+
+import sys
+import os
+import base64
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import ConversionCache, DocumentConverter
+from pdf_pipeline import (CARRIED_COUNTERS, PdfPipeline, UNSPLITTABLE_PATTERN, _dumpable,
+                          _starts, plan_pieces, split_document)
+
+requires_pdflatex = pytest.mark.skipif(shutil.which('pdflatex') is None,
+                                       reason="pdflatex is not installed")
+
+
+def long_markdown(sections: int) -> str:
+    return "".join(f"## Avsnitt {i}\n\nText med en fotnot[^{i}].\n\n[^{i}]: Fotnot {i}.\n\n"
+                   for i in range(sections))
+
+
+@pytest.fixture(scope='module')
+def latex():
+    return DocumentConverter().convert_text(long_markdown(40), 'latex',
+                                            extra_args=['--standalone'])
+
+
+def test_split_document_and_plan_pieces(latex):
+    """Test that pandoc's LaTeX splits into balanced pieces at headings."""
+    preamble, body = split_document(latex)
+    assert preamble.lstrip().startswith('%') or '\\documentclass' in preamble
+    assert '\\begin{document}' not in body and '\\end{document}' not in body
+
+    pieces = plan_pieces(body, 4)
+    assert len(pieces) == 4
+    assert ''.join(pieces) == body
+    assert all(piece.lstrip().startswith('\\subsection') for piece in pieces[1:])
+    assert max(map(len, pieces)) < 2 * len(body) / 4
+
+    assert plan_pieces("Bara text utan rubriker.", 4) == ["Bara text utan rubriker."]
+    with pytest.raises(ValueError):
+        split_document("\\section{Inte fristående}")
+
+
+def test_format_boundary_and_unsplittable_documents(latex):
+    """Test where the dumped preamble ends and which documents stay whole."""
+    preamble, body = split_document(latex)
+    dumpable = _dumpable(preamble)
+    before, after = dumpable.split('\\endofdump\n')
+    assert 'bookmark' not in before and 'bookmark' in after
+    assert not UNSPLITTABLE_PATTERN.search(body)
+    assert UNSPLITTABLE_PATTERN.search("Se avsnitt \\ref{intro}.")
+    assert UNSPLITTABLE_PATTERN.search("\\tableofcontents")
+
+
+def test_counters_carry_across_pieces():
+    """Test the start values of pieces from how far each advances the counters."""
+    deltas = [{'page': 3, 'footnote': 2, 'figure': 0, 'table': 1},
+              None,
+              {'page': 1, 'footnote': 0, 'figure': 1, 'table': 0}]
+    starts = _starts(deltas)
+    assert starts[0] == {'page': 1, 'footnote': 0, 'figure': 0, 'table': 0}
+    assert starts[1] == {'page': 4, 'footnote': 2, 'figure': 0, 'table': 1}
+    assert starts[2] == starts[1]
+    assert set(starts[0]) == set(CARRIED_COUNTERS)
+
+
+def test_missing_engine_is_reported(monkeypatch, tmp_path):
+    """Test the error when the LaTeX engine is not installed."""
+    monkeypatch.setattr(shutil, 'which', lambda name: None)
+    pipeline = PdfPipeline(work_dir=str(tmp_path))
+    with pytest.raises(RuntimeError, match="pdflatex not found"):
+        pipeline.compile("\\documentclass{article}\\begin{document}x\\end{document}",
+                         str(tmp_path / "out.pdf"))
+    with pytest.raises(ValueError):
+        PdfPipeline(engine='context')
+
+
+@requires_pdflatex
+@pytest.mark.parametrize('split_threshold', [10 ** 9, 0])
+def test_markdown_to_pdf_with_pipeline(split_threshold, tmp_path):
+    """Test whole and split compilation, and reuse of the working directory."""
+    pipeline = PdfPipeline(work_dir=str(tmp_path / "work"), jobs=4,
+                           split_threshold=split_threshold)
+    converter = DocumentConverter(pdf_pipeline=pipeline)
+    output = str(tmp_path / "out.pdf")
+
+    for _ in range(2):
+        assert converter.markdown_to_pdf(long_markdown(40), output) == output
+        with open(output, 'rb') as f:
+            assert f.read(5) == b'%PDF-'
+
+
+FAKE_ENGINE = """#!/usr/bin/env python3
+import os, sys, time
+previous = open('document.aux').read() if os.path.exists('document.aux') else ''
+time.sleep(0.2)
+open('document.aux', 'w').write(previous + 'x')
+open('document.pdf', 'w').write('%PDF-' + str(len(previous)))
+"""
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason="fake engine is a script")
+def test_concurrent_exports_use_their_own_working_directories(tmp_path, monkeypatch):
+    """Test that exports to one output never share a working directory, but seed the next."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    (bin_dir / "pdflatex").write_text(FAKE_ENGINE, encoding='utf-8')
+    (bin_dir / "pdflatex").chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    pipeline = PdfPipeline(work_dir=str(tmp_path / "work"), precompile=False, max_passes=1)
+    document = "\\documentclass{article}\\begin{document}x\\end{document}"
+    output = str(tmp_path / "out.pdf")
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        list(executor.map(lambda _: pipeline.compile(document, output), range(3)))
+    # Each export started from an empty working directory
+    assert open(output).read() == '%PDF-0'
+    assert len(os.listdir(tmp_path / "work" / "jobs")) == 1
+
+    pipeline.compile(document, output)
+    assert open(output).read() == '%PDF-1'
+
+
+def test_cached_latex_extracts_missing_media(tmp_path, monkeypatch):
+    """Test that LaTeX from the cache gets its images back once they were removed."""
+    (tmp_path / "bild.png").write_bytes(base64.b64decode(
+        'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='))
+    pipeline = PdfPipeline(work_dir=str(tmp_path / "work"))
+    compiled = []
+    monkeypatch.setattr(pipeline, 'compile',
+                        lambda latex, output_file: compiled.append(latex) or output_file)
+    converter = DocumentConverter(cache=ConversionCache(disk_dir=str(tmp_path / "cache")),
+                                  pdf_pipeline=pipeline)
+    markdown = f"![Bild]({tmp_path / 'bild.png'})"
+
+    converter.markdown_to_pdf(markdown, str(tmp_path / "out.pdf"))
+    assert os.listdir(pipeline.media_dir) and pipeline.missing_media(compiled[0]) == []
+    shutil.rmtree(pipeline.media_dir)
+    assert pipeline.missing_media(compiled[0])
+    converter.markdown_to_pdf(markdown, str(tmp_path / "out.pdf"))
+    assert compiled[1] == compiled[0] and pipeline.missing_media(compiled[1]) == []
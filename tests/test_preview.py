@@ -0,0 +1,80 @@
+"""Tests for the incremental live preview."""
+
+import sys
+import os
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from preview import HtmlTextSegments, IncrementalPreview, split_blocks
+
+
+DOCUMENT = """# Rubrik
+
+Ett stycke med **fetstil**.
+Fortsättning på stycket.
+
+- Punkt ett
+- Punkt två
+
+    Indragen fortsättning
+
+```python
+x = 1
+
+y = 2
+```
+
+## Slut
+"""
+
+
+def test_split_blocks():
+    """Test that blocks split at blank lines and headings, but not inside fences."""
+    blocks = split_blocks(DOCUMENT)
+    assert blocks == [
+        "# Rubrik",
+        "Ett stycke med **fetstil**.\nFortsättning på stycket.",
+        "- Punkt ett\n- Punkt två\n\n    Indragen fortsättning",
+        "```python\nx = 1\n\ny = 2\n```",
+        "## Slut",
+    ]
+
+
+def test_heading_needs_blank_line_before():
+    """Test that a heading-like line inside a paragraph stays in the paragraph."""
+    assert split_blocks("text\n# not a heading") == ["text\n# not a heading"]
+
+
+def test_preview_matches_full_render():
+    """Test that block-wise rendering matches converting the whole document."""
+    converter = DocumentConverter()
+    preview = IncrementalPreview(converter)
+    expected = converter.markdown_to_html(DOCUMENT)
+    assert preview.render(DOCUMENT).split() == expected.split()
+
+
+def test_preview_only_reconverts_changed_blocks():
+    """Test that unchanged blocks are served from the block cache."""
+    preview = IncrementalPreview(DocumentConverter())
+    preview.render(DOCUMENT)
+    assert preview.last_converted == 5
+    
+    html = preview.render(DOCUMENT.replace("Punkt två", "Punkt 2"))
+    assert preview.last_converted == 1
+    assert "Punkt 2" in html
+    
+    preview.render(DOCUMENT)
+    assert preview.last_converted == 0
+
+
+def test_html_segments():
+    """Test conversion of pandoc HTML into styled text segments."""
+    segments = HtmlTextSegments.parse(
+        '<h1 id="a">Title</h1>\n<p>Some <strong>bold</strong> text</p>\n<ul>\n<li>one</li>\n</ul>')
+    text = "".join(segment for segment, _ in segments)
+    assert text.startswith("Title\n\nSome bold text\n\n• one")
+    assert ("Title", ('h1',)) in segments
+    assert ("bold", ('bold',)) in segments
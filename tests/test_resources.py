@@ -0,0 +1,141 @@
+"""Tests for the image resource cache."""
+
+import sys
+import os
+import struct
+import threading
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from resources import ResourceCache
+
+
+def make_png(shade: int, size: int = 4) -> bytes:
+    """Build a small grayscale PNG."""
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+    rows = b''.join(b'\0' + bytes([shade]) * size for _ in range(size))
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+IMAGES = {
+    '/a.png': make_png(10),
+    '/same-as-a.png': make_png(10),
+    '/b.png': make_png(200),
+    '/large.png': make_png(30, size=400),
+    '/noextension': make_png(60),
+}
+
+
+@pytest.fixture
+def image_server():
+    """Serve IMAGES over HTTP and record the requested paths."""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            data = IMAGES.get(self.path)
+            if data is None:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/png')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_port}', requests
+    server.shutdown()
+    server.server_close()
+
+
+def test_rewrite_downloads_each_image_once(image_server, tmp_path):
+    """Test that remote images are fetched once and stored by content."""
+    url, requests = image_server
+    cache = ResourceCache(store_dir=str(tmp_path / 'store'))
+    text = (f"![a]({url}/a.png \"Titel\")\n\n![igen]({url}/a.png)\n\n"
+            f"![samma]({url}/same-as-a.png)\n\n<img src=\"{url}/b.png\">\n\n"
+            f"![saknas]({url}/missing.png)\n\n![typ]({url}/noextension)\n\n"
+            f"```\n![kod]({url}/b.png)\n```\n")
+
+    rewritten = cache.rewrite(text)
+    store = str(tmp_path / 'store').replace(os.sep, '/')
+    assert f"![a](<{store}/" in rewritten and '"Titel")' in rewritten
+    assert f'<img src="{store}/' in rewritten
+    assert f"![saknas]({url}/missing.png)" in rewritten
+    assert f"```\n![kod]({url}/b.png)\n```" in rewritten
+    assert sorted(requests) == ['/a.png', '/b.png', '/missing.png', '/noextension',
+                                '/same-as-a.png']
+    # Identical content is stored once; the extension comes from the content type
+    files = sorted(name for name in os.listdir(tmp_path / 'store') if name != 'index.json')
+    assert len(files) == 3
+    assert all(name.endswith('.png') for name in files)
+
+    # A new cache on the same store does not download anything again
+    requests.clear()
+    assert ResourceCache(store_dir=str(tmp_path / 'store')).rewrite(text) == rewritten
+    assert requests == ['/missing.png']
+
+
+def test_local_images_and_size_limits(image_server, tmp_path):
+    """Test relative paths, the per-image limit and eviction of the store."""
+    url, requests = image_server
+    (tmp_path / 'docs').mkdir()
+    (tmp_path / 'docs' / 'bild.png').write_bytes(IMAGES['/b.png'])
+    store_limit = len(IMAGES['/a.png']) + len(IMAGES['/b.png'])
+    cache = ResourceCache(store_dir=str(tmp_path / 'store'), store_limit=store_limit,
+                          max_resource_size=len(IMAGES['/large.png']) - 1)
+
+    local = cache.resolve('bild.png', base_dir=str(tmp_path / 'docs'))
+    assert open(local, 'rb').read() == IMAGES['/b.png']
+    assert cache.resolve(f'{url}/large.png') is None
+    first = cache.resolve(f'{url}/a.png')
+    # The store only fits two images, so the least recently used one goes
+    second = cache.resolve(f'{url}/noextension')
+    assert os.path.exists(first) and os.path.exists(second)
+    assert not os.path.exists(local)
+
+    requests.clear()
+    assert cache.resolve('bild.png', base_dir=str(tmp_path / 'docs')) is not None
+    assert requests == []
+
+
+def test_exports_use_cached_images(image_server, tmp_path, monkeypatch):
+    """Test that DOCX exports embed the images and only fetch them once."""
+    url, requests = image_server
+    converter = DocumentConverter(resources=ResourceCache(store_dir=str(tmp_path / 'store')))
+    text = f"# Bilder\n\n![a]({url}/a.png)\n\n![b]({url}/b.png)\n"
+
+    for name in ('first.docx', 'second.docx'):
+        output = converter.convert_text(text, 'docx', output_file=str(tmp_path / name))
+        with zipfile.ZipFile(output) as docx:
+            assert len([n for n in docx.namelist() if n.startswith('word/media/')]) == 2
+    assert sorted(requests) == ['/a.png', '/b.png']
+
+    # HTML output keeps the original references
+    assert f'{url}/a.png' in converter.convert_text(text, 'html')
+
+    (tmp_path / 'doc.md').write_text("![lokal](bild.png)\n", encoding='utf-8')
+    (tmp_path / 'bild.png').write_bytes(IMAGES['/b.png'])
+    # Relative images are found next to the input file, not the working directory
+    monkeypatch.chdir(os.path.dirname(__file__))
+    output = converter.convert_file(str(tmp_path / 'doc.md'), 'docx',
+                                    output_file=str(tmp_path / 'doc.docx'))
+    with zipfile.ZipFile(output) as docx:
+        assert any(n.startswith('word/media/') for n in docx.namelist())
@@ -0,0 +1,204 @@
+"""Tests for the local HTTP conversion service."""
+
+import sys
+import os
+import asyncio
+import json
+import socket
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from converter import DocumentConverter
+from server import ConversionServer
+
+
+@pytest.fixture
+def start_server():
+    """Start a service on a free port in a background thread."""
+    servers = []
+
+    def start(**options):
+        server = ConversionServer(port=0, **options)
+        ready = threading.Event()
+        thread = threading.Thread(target=asyncio.run, args=(server.serve(ready),), daemon=True)
+        thread.start()
+        assert ready.wait(10)
+        servers.append((server, thread))
+        return server
+
+    yield start
+    for server, thread in servers:
+        server.stop()
+        thread.join(10)
+
+
+def post(server, path, payload, headers=None):
+    """POST JSON with the server's token and return (status, decoded body)."""
+    headers = headers or {'Content-Type': 'application/json',
+                          'Authorization': f'Bearer {server.token}'}
+    request = urllib.request.Request(f'http://127.0.0.1:{server.port}{path}',
+                                     data=json.dumps(payload).encode('utf-8'), headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_convert_text_and_cache(start_server):
+    """Test text conversion and that repeats come from the shared cache."""
+    server = start_server()
+    status, body = post(server, '/convert/text', {'text': '# Hej\n\n*världen*', 'to': 'html'})
+    assert status == 200
+    assert '<h1 id="hej">Hej</h1>' in body['output']
+    assert body['cached'] is False
+
+    status, again = post(server, '/convert/text', {'text': '# Hej\n\n*världen*', 'to': 'html'})
+    assert again['cached'] is True
+    assert again['output'] == body['output']
+
+
+def test_convert_file(start_server, tmp_path):
+    """Test converting a file on disk to a binary output file."""
+    source = tmp_path / 'in.md'
+    source.write_text('# Fil\n', encoding='utf-8')
+    output = tmp_path / 'out.docx'
+    status, body = post(start_server(file_roots=[str(tmp_path)]), '/convert/file',
+                        {'input_file': str(source), 'to': 'docx', 'output_file': str(output)})
+    assert status == 200
+    assert body['output_file'] == str(output)
+    assert output.stat().st_size > 0
+
+
+def test_bad_requests(start_server):
+    """Test that client mistakes get 4xx answers instead of crashing."""
+    server = start_server()
+    assert post(server, '/convert/text', {'to': 'html'})[0] == 400
+    assert post(server, '/nowhere', {})[0] == 404
+    status, body = post(server, '/convert/text', {'text': 'x', 'to': 'nosuchformat'})
+    assert status == 422
+    assert 'nosuchformat' in body['error']
+
+
+def test_small_requests_are_batched(start_server):
+    """Test that concurrent small requests share batches and stay in order."""
+    server = start_server(max_concurrency=2, batch_window=0.05)
+    texts = [f'Stycke nummer {i}' for i in range(24)]
+    with ThreadPoolExecutor(max_workers=24) as executor:
+        results = list(executor.map(
+            lambda text: post(server, '/convert/text', {'text': text, 'to': 'html'}), texts))
+
+    for text, (status, body) in zip(texts, results):
+        assert status == 200
+        assert body['output'].strip() == f'<p>{text}</p>'
+    assert server.stats['batched_requests'] == 24
+    assert server.stats['batches'] < 24
+
+
+def test_saturated_server_answers_429(start_server):
+    """Test backpressure once both running slots and the queue are full."""
+    server = start_server(max_concurrency=1, max_queue=0,
+                          file_roots=[os.path.dirname(__file__)])
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_convert(*args):
+        started.set()
+        release.wait(10)
+        return 'done'
+
+    server.converter.convert_file = slow_convert
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        first = executor.submit(post, server, '/convert/file',
+                                {'input_file': __file__, 'to': 'html'})
+        assert started.wait(10)
+        status, body = post(server, '/convert/text', {'text': 'busy', 'to': 'html'})
+        release.set()
+        assert first.result()[0] == 200
+
+    assert status == 429
+    assert server.stats['rejected'] == 1
+
+
+def test_requests_need_json_and_token(start_server):
+    """Test that requests a web page could forge are refused."""
+    server = start_server()
+    payload = {'text': '# Hej', 'to': 'html'}
+    # A plain form post, as any web page can send without asking the browser
+    assert post(server, '/convert/text', payload,
+                {'Content-Type': 'text/plain', 'Authorization': f'Bearer {server.token}'})[0] == 415
+    assert post(server, '/convert/text', payload, {'Content-Type': 'application/json'})[0] == 401
+    assert post(server, '/convert/text', payload,
+                {'Content-Type': 'application/json', 'Authorization': 'Bearer fel'})[0] == 401
+    assert server.stats['requests'] == 0
+
+
+@pytest.mark.parametrize('extra_args', [['--lua-filter=evil.lua'], ['--filter', 'sh'],
+                                        ['--include-in-header=/etc/passwd'], ['-o', '/tmp/x']])
+def test_unsafe_options_are_refused(start_server, extra_args):
+    """Test that options reading files or running code are rejected."""
+    status, body = post(start_server(), '/convert/text',
+                        {'text': 'x', 'to': 'html', 'extra_args': extra_args})
+    assert status == 403 and 'not allowed' in body['error']
+
+
+def test_safe_options_are_allowed(start_server):
+    status, body = post(start_server(), '/convert/text',
+                        {'text': '# Hej', 'to': 'html', 'extra_args': ['--shift-heading-level-by=1']})
+    assert status == 200 and '<h2' in body['output']
+
+
+def test_files_are_confined_to_allowed_directories(start_server, tmp_path):
+    """Test that paths outside the allowed directories, also via '..', are refused."""
+    allowed = tmp_path / 'tillatet'
+    allowed.mkdir()
+    (allowed / 'in.md').write_text('# Fil\n', encoding='utf-8')
+    (tmp_path / 'hemlig.md').write_text('hemlig\n', encoding='utf-8')
+    server = start_server(file_roots=[str(allowed)])
+    outside = str(allowed / '..' / 'hemlig.md')
+    assert post(server, '/convert/file', {'input_file': outside, 'to': 'html'})[0] == 403
+    assert post(server, '/convert/file', {'input_file': str(allowed / 'in.md'), 'to': 'html',
+                                          'output_file': str(tmp_path / 'ut.html')})[0] == 403
+    assert post(server, '/convert/text', {'text': 'x', 'to': 'html',
+                                          'output_file': str(tmp_path / 'ut.html')})[0] == 403
+    assert not (tmp_path / 'ut.html').exists()
+    assert post(server, '/convert/file', {'input_file': str(allowed / 'in.md'),
+                                          'to': 'html'})[0] == 200
+    # Without allowed directories, only text conversions are served
+    assert post(start_server(), '/convert/file',
+                {'input_file': str(allowed / 'in.md'), 'to': 'html'})[0] == 403
+
+
+@pytest.mark.parametrize('extra_args', [[], ['--standalone']])
+def test_documents_cannot_read_files(start_server, tmp_path, extra_args):
+    """Test that include directives are sandboxed, on the batched and the converter path."""
+    secret = tmp_path / 'hemlig.txt'
+    secret.write_text('topphemligt', encoding='utf-8')
+    server = start_server()
+    for input_format, text in (('latex', f'\\input{{{secret}}}'),
+                               ('rst', f'.. include:: {secret}\n'),
+                               ('org', f'#+INCLUDE: "{secret}"\n')):
+        status, body = post(server, '/convert/text', {'text': text, 'from': input_format,
+                                                      'to': 'plain', 'extra_args': extra_args})
+        assert status == 200 and 'topphemligt' not in body['output'], input_format
+    status, body = post(server, '/convert/text', {'text': '\\input{/etc/passwd}',
+                                                  'from': 'latex', 'to': 'pdf'})
+    assert status == 422 and 'sandbox' in body['error']
+    with pytest.raises(ValueError):
+        ConversionServer(converter=DocumentConverter())
+
+
+def test_oversized_request_heads_are_refused(start_server):
+    """Test that overlong header lines and too many headers get 431, not a dropped connection."""
+    server = start_server()
+    for head in (b'POST /convert/text HTTP/1.1\r\nX-Lang: ' + b'a' * 70000 + b'\r\n\r\n',
+                 b'POST /convert/text HTTP/1.1\r\n' + b'X-Rad: 1\r\n' * 101 + b'\r\n'):
+        with socket.create_connection(('127.0.0.1', server.port), timeout=10) as connection:
+            connection.sendall(head)
+            assert connection.recv(100).startswith(b'HTTP/1.1 431 ')
@@ -0,0 +1,82 @@
+"""Startup time of the GUI and CLI."""
+
+import sys
+import os
+import json
+import subprocess
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+# Generous budgets; the point is to catch pandoc or heavy imports creeping
+# back into startup, not to benchmark the machine
+IMPORT_BUDGET_SECONDS = 1.0
+FIRST_PAINT_BUDGET_SECONDS = 2.0
+
+# Measured in a fresh interpreter so earlier tests cannot pre-import anything.
+# Process creation is counted to prove pandoc is not run before first paint.
+MEASURE_SCRIPT = r"""
+import json, subprocess, sys, time
+start = time.perf_counter()
+spawned = []
+real_init = subprocess.Popen.__init__
+def counting_init(self, args, *rest, **kwargs):
+    spawned.append(str(args))
+    real_init(self, args, *rest, **kwargs)
+subprocess.Popen.__init__ = counting_init
+
+sys.path.insert(0, sys.argv[1])
+import gui
+imported = time.perf_counter() - start
+result = {'import_seconds': imported, 'spawned': list(spawned),
+          'heavy_modules': [name for name in ('pypandoc', 'asyncio', 'http.server', 'ssl')
+                            if name in sys.modules]}
+if sys.argv[2] == 'paint':
+    import tkinter
+    try:
+        app = gui.OmvandlareGUI()
+    except tkinter.TclError as e:
+        result['no_display'] = str(e)
+    else:
+        app.root.update()
+        result['first_paint_seconds'] = time.perf_counter() - start
+        result['spawned_before_paint'] = list(spawned)
+        app.on_close()
+print(json.dumps(result))
+"""
+
+
+def measure(mode):
+    output = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT, SRC_DIR, mode],
+                            capture_output=True, text=True, timeout=60, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_gui_import_is_fast_and_lazy():
+    """Test that importing the GUI neither runs pandoc nor loads heavy modules."""
+    result = measure('import')
+    print(f"GUI import: {result['import_seconds'] * 1000:.0f} ms")
+    assert result['spawned'] == []
+    assert result['heavy_modules'] == []
+    assert result['import_seconds'] < IMPORT_BUDGET_SECONDS
+
+
+def test_gui_first_paint_does_not_wait_for_pandoc():
+    """Test that the window paints before pandoc is ever started."""
+    result = measure('paint')
+    if 'no_display' in result:
+        pytest.skip(f"No display available: {result['no_display']}")
+    print(f"GUI first paint: {result['first_paint_seconds'] * 1000:.0f} ms")
+    assert result['spawned_before_paint'] == []
+    assert result['first_paint_seconds'] < FIRST_PAINT_BUDGET_SECONDS
+
+
+def test_warm_up_reports_pandoc():
+    """Test the background warm-up the GUI runs after first paint."""
+    sys.path.insert(0, SRC_DIR)
+    from converter import DocumentConverter
+
+    info = DocumentConverter().warm_up()
+    assert os.path.exists(info['pandoc_path'])
+    assert info['pandoc_version']
+    assert 'markdown' in info['formats']['input']
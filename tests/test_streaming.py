@@ -0,0 +1,83 @@
+"""Tests for the streaming conversion API."""
+
+import sys
+import os
+import io
+import tracemalloc
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import converter as converter_module
+from converter import DocumentConverter
+
+
+def test_iter_convert_matches_convert_text():
+    """Test that streamed output equals the regular conversion."""
+    converter = DocumentConverter()
+    text = "# Rubrik\n\nText med **fetstil**.\n\n- ett\n- två\n"
+    expected = converter.convert_text(text, 'html')
+    
+    streamed = b"".join(converter.iter_convert(io.StringIO(text), 'html', chunk_size=7))
+    assert streamed.decode('utf-8') == expected
+    
+    from_iterable = b"".join(converter.iter_convert(iter(["# Rubrik\n\n", "Text med **fetstil**.\n\n",
+                                                          "- ett\n- två\n"]), 'html'))
+    assert from_iterable.decode('utf-8') == expected
+
+
+def test_convert_stream_writes_binary_destination(tmp_path):
+    """Test streaming a binary format straight to a destination file."""
+    destination = tmp_path / "out.docx"
+    written = DocumentConverter().convert_stream(io.BytesIO(b"# Rubrik\n"), 'docx', str(destination))
+    assert written == destination.stat().st_size
+    assert zipfile.is_zipfile(destination)
+
+
+def test_failed_stream_leaves_no_output(tmp_path):
+    """Test that a failed conversion does not replace the destination."""
+    destination = tmp_path / "out.html"
+    destination.write_text("previous", encoding='utf-8')
+    with pytest.raises(RuntimeError):
+        DocumentConverter().convert_stream(io.StringIO("x"), 'html', str(destination),
+                                           extra_args=['--no-such-option'])
+    assert destination.read_text(encoding='utf-8') == "previous"
+
+
+def test_threads_streaming_to_one_destination(tmp_path):
+    """Test that concurrent streams to one file each write a whole document, with no leftovers."""
+    destination = tmp_path / "out.html"
+    converter = DocumentConverter()
+    texts = [f"# Dokument {i}\n\n" + "Text.\n\n" * 2000 for i in range(6)]
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda text: converter.convert_stream(io.StringIO(text), 'html',
+                                                                str(destination)), texts))
+    assert os.listdir(tmp_path) == ["out.html"]
+    assert destination.read_text(encoding='utf-8').count('<h1') == 1
+    assert destination.stat().st_mode & 0o777 == 0o666 & ~converter_module._UMASK
+
+
+def test_streaming_memory_stays_bounded(tmp_path):
+    """Test that Python memory does not grow with the document size."""
+    source = tmp_path / "large.md"
+    paragraph = "Ett stycke med *betoning* och `kod`, upprepat många gånger.\n\n"
+    with open(source, 'w', encoding='utf-8') as f:
+        for _ in range(60000):
+            f.write(paragraph)
+    input_size = source.stat().st_size
+    assert input_size > 3 * 1024 * 1024
+    
+    converter = DocumentConverter()
+    tracemalloc.start()
+    try:
+        with open(source, 'rb') as f:
+            written = converter.convert_stream(f, 'html', str(tmp_path / "large.html"))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    assert written > input_size
+    assert peak < input_size // 4
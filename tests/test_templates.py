@@ -0,0 +1,165 @@
+"""Tests for prepared DOCX reference documents."""
+
+import sys
+import os
+import io
+import subprocess
+import zipfile
+from xml.etree import ElementTree
+import pypandoc
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import templates as templates_module
+from batch import convert_batch
+from converter import DocumentConverter
+from main import main
+from templates import ReferenceTemplates, _strip_body, strip_reference_doc
+
+
+BODY = (b'<w:body><w:p><w:r><w:t>Exempeltext</w:t></w:r></w:p>'
+        b'<w:p><w:r><w:drawing><a:blip r:embed="rId9"/></w:drawing></w:r></w:p>'
+        b'<w:sectPr><w:headerReference r:id="rId8"/><w:pgSz w:w="11906"/></w:sectPr></w:body>')
+
+RELS = ('<?xml version="1.0"?><Relationships xmlns="http://schemas.openxmlformats.org/'
+        'package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://x/relationships/styles" Target="styles.xml"/>'
+        '<Relationship Id="rId8" Type="http://x/relationships/header" Target="header1.xml"/>'
+        '<Relationship Id="rId9" Type="http://x/relationships/image" Target="media/bild.png"/>'
+        '</Relationships>')
+
+HEADER_RELS = ('<?xml version="1.0"?><Relationships xmlns="http://schemas.openxmlformats.org/'
+               'package/2006/relationships">'
+               '<Relationship Id="rId1" Type="http://x/relationships/image" '
+               'Target="media/logo.png"/></Relationships>')
+
+
+@pytest.fixture
+def corporate_docx(tmp_path):
+    """Pandoc's reference document with a renamed font, sample text and a picture."""
+    reference = subprocess.run([pypandoc.get_pandoc_path(), '--print-default-data-file',
+                                'reference.docx'], capture_output=True, check=True).stdout
+    path = tmp_path / 'foretag.docx'
+    with zipfile.ZipFile(io.BytesIO(reference)) as source, \
+            zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            data = source.read(info)
+            if info.filename == 'word/styles.xml':
+                data = data.replace(b'w:asciiTheme="minorHAnsi"', b'w:ascii="Corporate Sans"')
+            elif info.filename == 'word/document.xml':
+                start = data.index(b'<w:body>')
+                data = data[:start] + b'<w:body>' + b'<w:p><w:r><w:t>Exempel</w:t></w:r></w:p>' \
+                    * 1000 + data[start + len(b'<w:body>'):]
+            target.writestr(info, data)
+        target.writestr('word/media/exempel.png', os.urandom(200_000))
+    return path
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = ReferenceTemplates(str(tmp_path / 'store'))
+    monkeypatch.setattr(templates_module, 'templates', store)
+    return store
+
+
+def test_strip_keeps_sections_and_header_media():
+    """Test that body text and body-only media go, while header media stays."""
+    document = (b'<w:document xmlns:w="w" xmlns:r="r" xmlns:a="a">' + BODY + b'</w:document>')
+    source = io.BytesIO()
+    with zipfile.ZipFile(source, 'w') as f:
+        f.writestr('[Content_Types].xml', '<Types xmlns="http://schemas.openxmlformats.org/'
+                   'package/2006/content-types"><Override PartName="/word/media/bild.png" '
+                   'ContentType="image/png"/></Types>')
+        f.writestr('word/document.xml', document)
+        f.writestr('word/styles.xml', '<w:styles xmlns:w="w"/>')
+        f.writestr('word/_rels/document.xml.rels', RELS)
+        f.writestr('word/_rels/header1.xml.rels', HEADER_RELS)
+        f.writestr('word/header1.xml', '<w:hdr xmlns:w="w"/>')
+        f.writestr('word/media/bild.png', b'body picture')
+        f.writestr('word/media/logo.png', b'header logo')
+
+    with zipfile.ZipFile(io.BytesIO(strip_reference_doc(source.getvalue()))) as stripped:
+        names = stripped.namelist()
+        document = stripped.read('word/document.xml')
+        rels = stripped.read('word/_rels/document.xml.rels')
+        types = stripped.read('[Content_Types].xml')
+    assert 'word/media/logo.png' in names and 'word/media/bild.png' not in names
+    assert b'Exempeltext' not in document and b'<w:pgSz w:w="11906"/>' in document
+    assert b'rId8' in rels and b'rId9' not in rels
+    assert b'bild.png' not in types
+    assert b'<Relationships xmlns="' in rels and b'<Types xmlns="' in types
+    # The serialization prefixes did not leak into ElementTree's global registry
+    namespace = 'http://schemas.openxmlformats.org/package/2006/relationships'
+    assert ElementTree.tostring(ElementTree.Element(f'{{{namespace}}}x')).startswith(b'<ns0:')
+
+
+def test_strip_keeps_only_the_final_body_section():
+    """Test that section properties nested in other elements are not mistaken for it."""
+    final = (b'<w:sectPr w:rsidR="1"><w:pgSz w:w="11906"/><w:sectPrChange w:id="2">'
+             b'<w:sectPr><w:pgSz w:w="12240"/></w:sectPr></w:sectPrChange></w:sectPr>')
+    document = (b'<w:document><w:body><w:p><w:pPr><w:sectPr><w:pgSz w:w="1"/></w:sectPr>'
+                b'</w:pPr></w:p><w:p><w:r><w:t a="x>y">Text</w:t></w:r></w:p>\n'
+                + final + b'</w:body></w:document>')
+    assert _strip_body(document) == b'<w:document><w:body>' + final + b'</w:body></w:document>'
+
+    # Without final section properties, a section break in a paragraph goes too
+    document = document.replace(final, b'')
+    assert _strip_body(document) == b'<w:document><w:body></w:body></w:document>'
+
+
+@pytest.mark.parametrize('contents, message', [
+    (b'not a zip file', 'not a DOCX file'),
+    (None, 'lacks word/styles.xml'),
+])
+def test_unusable_templates_are_rejected(tmp_path, store, contents, message):
+    """Test that broken reference documents fail before any export."""
+    path = tmp_path / 'trasig.docx'
+    if contents is None:
+        with zipfile.ZipFile(path, 'w') as f:
+            f.writestr('[Content_Types].xml', '<Types/>')
+            f.writestr('word/document.xml', '<w:document xmlns:w="w"/>')
+    else:
+        path.write_bytes(contents)
+    with pytest.raises(ValueError, match=message):
+        store.prepare(str(path))
+    with pytest.raises(ValueError, match=message):
+        DocumentConverter(reference_doc=str(path)).convert_text('# A', 'docx',
+                                                                output_file=str(tmp_path / 'a.docx'))
+    assert main(['batch', str(tmp_path), '-t', 'docx', '--reference-doc', str(path)]) == 1
+
+
+def test_exports_use_the_prepared_template(tmp_path, store, corporate_docx, monkeypatch):
+    """Test that exports get the template's styles, but not its text or media."""
+    output = tmp_path / 'rapport.docx'
+    with DocumentConverter(reference_doc=str(corporate_docx)) as converter:
+        converter.convert_text("# Rapport\n", 'docx', output_file=str(output))
+        source = tmp_path / 'rapport.md'
+        source.write_text("# Fil\n", encoding='utf-8')
+        converter.convert_file(str(source), 'docx', str(tmp_path / 'fil.docx'))
+        # Other formats are not affected
+        assert '<h1' in converter.convert_text("# Rapport\n", 'html')
+
+    for path in (output, tmp_path / 'fil.docx'):
+        with zipfile.ZipFile(path) as f:
+            assert b'Corporate Sans' in f.read('word/styles.xml')
+            assert b'Exempel<' not in f.read('word/document.xml')
+            assert not any(name.startswith('word/media/') for name in f.namelist())
+
+    # Prepared once: later lookups, also from a new store, only stat the template
+    monkeypatch.setattr(templates_module, 'strip_reference_doc', None)
+    prepared = store.prepare(str(corporate_docx))
+    assert ReferenceTemplates(store.store_dir).prepare(str(corporate_docx)) == prepared
+    assert os.path.getsize(prepared) < os.path.getsize(corporate_docx) / 10
+
+
+def test_batch_passes_template_to_workers(tmp_path, store, corporate_docx):
+    """Test that process workers export with the template prepared by the parent."""
+    (tmp_path / 'docs').mkdir()
+    (tmp_path / 'docs' / 'a.md').write_text("# A\n", encoding='utf-8')
+    summary = convert_batch([str(tmp_path / 'docs')], 'docx', workers=1,
+                            reference_doc=str(corporate_docx))
+    assert summary.count('converted') == 1
+    with zipfile.ZipFile(tmp_path / 'docs' / 'a.docx') as f:
+        assert b'Corporate Sans' in f.read('word/styles.xml')
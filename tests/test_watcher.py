@@ -0,0 +1,107 @@
+"""Tests for the watch-folder mode."""
+
+import sys
+import os
+import threading
+import time
+import pytest
+
+# Add src directory to path for imports
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import watcher as watcher_module
+from converter import DocumentConverter
+from main import build_parser
+from watcher import FolderWatcher
+
+
+@pytest.fixture(scope='module')
+def converter():
+    with DocumentConverter(engine='pool', pool_size=2) as converter:
+        yield converter
+
+
+def make_watcher(tmp_path, converter, **options):
+    return FolderWatcher(str(tmp_path / 'docs'), ['html', 'docx'], converter=converter,
+                         manifest_file=str(tmp_path / 'manifest.json'), **options)
+
+
+def converted(results):
+    return sorted(os.path.relpath(result.output_file) for result in results
+                  if result.status == 'converted')
+
+
+def test_only_changed_content_is_reconverted(tmp_path, converter, monkeypatch):
+    """Test the manifest across edits, touches, image changes and restarts."""
+    monkeypatch.chdir(tmp_path)
+    docs = tmp_path / 'docs'
+    (docs / 'sub').mkdir(parents=True)
+    (docs / 'a.md').write_text("# A\n\n![bild](bild.png)\n", encoding='utf-8')
+    (docs / 'sub' / 'b.md').write_text("# B\n", encoding='utf-8')
+    (docs / 'bild.png').write_bytes(b'first')
+
+    watcher = make_watcher(tmp_path, converter)
+    assert converted(watcher.scan()) == ['docs/a.docx', 'docs/a.html',
+                                         'docs/sub/b.docx', 'docs/sub/b.html']
+    assert watcher.scan() == []
+
+    # Saving without changes only updates the stored file times
+    os.utime(docs / 'a.md', ns=(1, 1))
+    assert watcher.update([str(docs / 'a.md')]) == []
+
+    (docs / 'sub' / 'b.md').write_text("# B2\n", encoding='utf-8')
+    assert converted(watcher.update([str(docs / 'sub' / 'b.md')])) == ['docs/sub/b.docx',
+                                                                     'docs/sub/b.html']
+    assert 'B2' in (docs / 'sub' / 'b.html').read_text(encoding='utf-8')
+
+    (docs / 'bild.png').write_bytes(b'second')
+    assert converted(watcher.update([str(docs / 'bild.png')])) == ['docs/a.docx', 'docs/a.html']
+
+    # A restarted watcher picks up changes made while it was not running
+    (docs / 'sub' / 'b.md').write_text("# B3\n", encoding='utf-8')
+    os.remove(docs / 'a.html')
+    restarted = make_watcher(tmp_path, converter)
+    assert converted(restarted.scan()) == ['docs/a.html', 'docs/sub/b.docx', 'docs/sub/b.html']
+    assert make_watcher(tmp_path, converter).scan() == []
+
+
+@pytest.mark.parametrize('use_inotify', [True, False])
+def test_run_converts_new_and_edited_files(tmp_path, converter, use_inotify):
+    """Test that a running watcher debounces edits and converts them once."""
+    if use_inotify and watcher_module._load_inotify() is None:
+        pytest.skip("inotify is not available")
+    (tmp_path / 'docs').mkdir()
+    results = []
+    watcher = make_watcher(tmp_path, converter, debounce=0.3, poll_interval=0.1,
+                           use_inotify=use_inotify, progress=results.append)
+    ready = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(ready,), daemon=True)
+    thread.start()
+    try:
+        assert ready.wait(10)
+        new_dir = tmp_path / 'docs' / 'ny'
+        new_dir.mkdir()
+        for i in range(5):
+            (new_dir / 'c.md').write_text(f"# Version {i}\n", encoding='utf-8')
+            time.sleep(0.05)
+
+        output = new_dir / 'c.html'
+        deadline = time.monotonic() + 15
+        while len(results) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.5)
+    finally:
+        watcher.stop()
+        thread.join(10)
+    assert 'Version 4' in output.read_text(encoding='utf-8')
+    assert sorted(os.path.basename(result.output_file) for result in results) == ['c.docx',
+                                                                                  'c.html']
+
+
+def test_watch_command_arguments():
+    """Test parsing of the watch command line."""
+    args = build_parser().parse_args(['watch', 'docs', '-t', 'html', '-t', 'docx',
+                                      '--debounce', '500', '--poll'])
+    assert args.directory == 'docs'
+    assert args.to == ['html', 'docx']
+    assert args.debounce == 500.0 and args.poll